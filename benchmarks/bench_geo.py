@@ -0,0 +1,54 @@
+"""
+Scalar calculate_distance per listing vs one vectorized calculate_distances
+call for the whole batch.
+
+    python3 ./benchmarks/bench_geo.py
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from geo import calculate_distance, calculate_distances  # noqa: E402
+
+
+def bench(points, as_strings):
+    random.seed(points)
+    lats = [random.uniform(40.0, 41.5) for _ in range(points)]
+    longs = [random.uniform(-75.0, -73.0) for _ in range(points)]
+    if as_strings:
+        # Craigslist and GumTree hand us coordinates as strings
+        lats = [f"{lat:.6f}" for lat in lats]
+        longs = [f"{long:.6f}" for long in longs]
+
+    start = time.perf_counter()
+    scalar = [calculate_distance(40.7128, -74.0060, lat, long) for lat, long in zip(lats, longs)]
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = calculate_distances(40.7128, -74.0060, lats, longs)
+    vectorized_time = time.perf_counter() - start
+
+    error = max(abs(a - b) for a, b in zip(scalar, vectorized.tolist()))
+    return scalar_time, vectorized_time, error
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-n", "--points", type=int, nargs="+", default=[10_000, 1_000_000]
+    )
+    args = parser.parse_args()
+
+    for as_strings in (False, True):
+        kind = "str" if as_strings else "float"
+        for points in args.points:
+            scalar_time, vectorized_time, error = bench(points, as_strings)
+            print(
+                f"{points:>9,} {kind:5} points: scalar {scalar_time * 1000:9.1f} ms, "
+                f"vectorized {vectorized_time * 1000:8.1f} ms, "
+                f"speedup {scalar_time / vectorized_time:6.1f}x, max error {error:.1e} km"
+            )
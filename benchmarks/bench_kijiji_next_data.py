@@ -0,0 +1,105 @@
+"""
+Compares the old parsel/XPath __NEXT_DATA__ extraction of Kijiji search
+pages with the byte-level extractor in kijiji.py.
+
+    python3 ./benchmarks/bench_kijiji_next_data.py --pages ./saved_pages
+
+Every *.html file in --pages is used, without it a synthetic page with the
+size and shape of a real 40 listing results page is generated.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from kijiji import extract_listings, listing_records  # noqa: E402
+
+
+def synthetic_page(listings=40, filler_kb=400):
+    state = {"ROOT_QUERY": {"__typename": "Query"}}
+    for i in range(listings):
+        state[f"ListingV2:{i}"] = {
+            "__typename": "ListingV2",
+            "id": str(1700000000 + i),
+            "title": f"2012 Toyota Corolla {i}",
+            "location": {"address": "Calgary, AB T2P 1J9"},
+            "imageUrls": [f"https://media.kijiji.ca/api/v1/ca-prod/{i}/1.jpg"],
+            "price": {"amount": 1500000 + i, "currency": "CAD"},
+            "attributes": [
+                {"name": "caryear", "values": ["2012"]},
+                {"name": "carmileageinkms", "values": ["120000"]},
+            ],
+            "seoUrl": f"/v-cars-trucks/calgary/2012-toyota-corolla/{1700000000 + i}",
+            "posterInfo": {"__ref": f"PosterInfo:{i}"},
+            "activationDate": f"2024-06-20T05:{i % 60:02d}:13.000Z",
+            "sortingDate": f"2024-06-20T05:{i % 60:02d}:13.000Z",
+        }
+        state[f"PosterInfo:{i}"] = {"__typename": "PosterInfo", "id": str(i)}
+
+    next_data = {"props": {"pageProps": {"__APOLLO_STATE__": state}}}
+    filler = "<div class='card'><a href='/x'>" + "listing text " * 8 + "</a></div>"
+    body = filler * (filler_kb * 1024 // len(filler))
+    page = (
+        "<!DOCTYPE html><html><head><title>Kijiji</title></head><body>"
+        + body
+        + '<script id="__NEXT_DATA__" type="application/json">'
+        + json.dumps(next_data)
+        + "</script></body></html>"
+    )
+    return page.encode()
+
+
+def parsel_listings(content: bytes):
+    from parsel import Selector
+
+    listing_page = Selector(content.decode("utf-8"))
+    listing_json = listing_page.xpath('//script[@id="__NEXT_DATA__"]/text()').get()
+    listing_json = json.loads(str(listing_json))
+
+    appollo_state = listing_json["props"]["pageProps"]["__APOLLO_STATE__"]
+    filtered = {k: v for k, v in appollo_state.items() if k.startswith("ListingV2")}
+    return listing_records({"props": {"pageProps": {"__APOLLO_STATE__": filtered}}})
+
+
+def bench(func, pages, repeat):
+    start = time.perf_counter()
+    count = 0
+    for _ in range(repeat):
+        for page in pages:
+            count += len(func(page))
+    elapsed = time.perf_counter() - start
+    return elapsed / (repeat * len(pages)), count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--pages", help="Folder of saved Kijiji html pages", default=None)
+    parser.add_argument("-r", "--repeat", help="Passes over the pages", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(args.pages, "*.html"))):
+            with open(path, "rb") as file:
+                pages.append(file.read())
+    else:
+        pages = [synthetic_page()]
+
+    size_kb = sum(len(page) for page in pages) / len(pages) / 1024
+    print(f"{len(pages)} page(s), {size_kb:.0f} KB on average")
+
+    new_time, new_count = bench(extract_listings, pages, args.repeat)
+    print(f"bytes extractor : {new_time * 1000:8.2f} ms/page")
+
+    try:
+        old_time, old_count = bench(parsel_listings, pages, args.repeat)
+    except ImportError:
+        print("parsel not installed, skipping the DOM baseline")
+    else:
+        assert old_count == new_count, (old_count, new_count)
+        print(f"parsel + XPath  : {old_time * 1000:8.2f} ms/page")
+        print(f"speedup         : {old_time / new_time:8.1f}x")
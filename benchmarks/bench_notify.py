@@ -0,0 +1,210 @@
+"""
+Burst test of the notification fan-out against local stand-in servers: a
+webhook receiver, a minimal SMTP server, a Unix socket listener and a
+local file.
+
+Scraper threads report a burst of new listings in many small polls. It
+reports how long notify() held up the scrapers, how many requests, emails
+and socket writes the burst went out in and how long the sinks took to
+drain it, with a slow webhook to show that it holds up nothing else.
+
+    python3 ./benchmarks/bench_notify.py --listings 5000 --polls 500 --webhook_latency 0.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from metrics import Metrics  # noqa: E402
+from notify import FileSink, Notifier, SMTPSink, UnixSocketSink, WebhookSink  # noqa: E402
+
+
+class WebhookServer:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self.listings = 0
+        self.runner = None
+
+    async def receive(self, request):
+        payload = await request.json()
+        await asyncio.sleep(self.latency)
+        self.requests += 1
+        self.listings += payload["count"]
+        return web.json_response({"ok": True})
+
+    async def start(self, port):
+        app = web.Application(client_max_size=256 * 1024**2)
+        app.add_routes([web.post("/listings", self.receive)])
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", port).start()
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+class SMTPServer:
+    """Just enough SMTP to accept messages"""
+
+    def __init__(self):
+        self.connections = 0
+        self.messages = 0
+        self.server = None
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        writer.write(b"220 stub ESMTP\r\n")
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            command = line[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                writer.write(b"250 stub\r\n")
+            elif command == b"DATA":
+                writer.write(b"354 end with .\r\n")
+                await writer.drain()
+                while (await reader.readline()) not in (b".\r\n", b""):
+                    pass
+                self.messages += 1
+                writer.write(b"250 OK\r\n")
+            elif command == b"QUIT":
+                writer.write(b"221 bye\r\n")
+                await writer.drain()
+                break
+            else:
+                writer.write(b"250 OK\r\n")
+            await writer.drain()
+        writer.close()
+
+    async def start(self, port):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", port)
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+class SocketServer:
+    def __init__(self):
+        self.connections = 0
+        self.writes = 0
+        self.listings = 0
+        self.server = None
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            self.writes += 1
+            self.listings += json.loads(line)["count"]
+        writer.close()
+
+    async def start(self, path):
+        self.server = await asyncio.start_unix_server(self.handle, path, limit=256 * 1024**2)
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+def listings_df(poll, count):
+    return pd.DataFrame(
+        [
+            {
+                "listing_id": f"{poll}-{i}",
+                "title": f"Toyota Corolla #{poll}-{i}",
+                "price": "$ 12000.0",
+                "url": f"https://www.example.com/{poll}/{i}",
+                "time_found": time.time(),
+            }
+            for i in range(count)
+        ]
+    )
+
+
+async def main(args):
+    folder = tempfile.mkdtemp()
+    webhook, smtp, socket_server = WebhookServer(args.webhook_latency), SMTPServer(), SocketServer()
+    await webhook.start(args.port)
+    await smtp.start(args.port + 1)
+    await socket_server.start(os.path.join(folder, "notify.sock"))
+
+    metrics = Metrics()
+    file_path = os.path.join(folder, "notifications.jsonl")
+    notifier = Notifier(
+        [
+            WebhookSink(f"http://127.0.0.1:{args.port}/listings", batch_wait=args.batch_wait),
+            SMTPSink("127.0.0.1", "alerts@example.com", ["me@example.com"], port=args.port + 1, batch_wait=args.batch_wait),
+            UnixSocketSink(os.path.join(folder, "notify.sock"), batch_wait=args.batch_wait),
+            FileSink(file_path, batch_wait=args.batch_wait),
+        ],
+        metrics,
+    )
+    await notifier.start()
+
+    per_poll = max(args.listings // args.polls, 1)
+    frames = [listings_df(poll, per_poll) for poll in range(args.polls)]
+    notify_seconds = []
+
+    def scraper_poll(frame):
+        start = time.perf_counter()
+        notifier.notify("craiglist", "toyota|40.7|-74.0", "toyota", frame)
+        notify_seconds.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(8) as executor:
+        await asyncio.gather(*(loop.run_in_executor(executor, scraper_poll, frame) for frame in frames))
+    burst = time.perf_counter() - start
+
+    await notifier.close(timeout=120)
+    drained = time.perf_counter() - start
+
+    with open(file_path) as file:
+        file_lines = sum(1 for _ in file)
+
+    counters = {}
+    for counter in metrics.summary()["counters"]:
+        counters[(counter["name"], counter["labels"].get("sink"))] = counter["value"]
+
+    total = per_poll * args.polls
+    notify_seconds.sort()
+    print(f"{total:,} listings in {args.polls:,} polls, reported in {burst:.3f}s, drained after {drained:.2f}s")
+    print(
+        f"notify() p50 {notify_seconds[len(notify_seconds) // 2] * 1000:.2f} ms,"
+        f" max {notify_seconds[-1] * 1000:.2f} ms"
+    )
+    print(f"webhook      {webhook.requests:>6} requests     {webhook.listings:>8,} listings")
+    print(f"smtp         {smtp.messages:>6} emails       over {smtp.connections} connection(s)")
+    print(f"unix_socket  {socket_server.writes:>6} writes       {socket_server.listings:>8,} listings, {socket_server.connections} connection(s)")
+    print(f"file         {counters.get(('notification_batches_total', 'file'), 0):>6} appends      {file_lines:>8,} listings")
+    dropped = {sink: value for (name, sink), value in counters.items() if name == "notifications_dropped_total"}
+    if dropped:
+        print(f"dropped      {dropped}")
+
+    await webhook.stop()
+    await smtp.stop()
+    await socket_server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-l", "--listings", type=int, default=5000, help="New listings in the burst")
+    parser.add_argument("-n", "--polls", type=int, default=500, help="Polls the burst is spread over")
+    parser.add_argument("-w", "--webhook_latency", type=float, default=0.5, help="Seconds the webhook takes to answer")
+    parser.add_argument("-b", "--batch_wait", type=float, default=0.2, help="Seconds the sinks wait for a batch to fill")
+    parser.add_argument("-p", "--port", type=int, default=8950, help="Webhook port, SMTP gets the next one")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,224 @@
+"""
+Bytes on the wire and decode time of the full OfferUp feed query vs the
+listing-only one.
+
+The full response is synthetic, shaped after the fragments of FULL_QUERY
+(listing, seller ad and display ad tiles, filters, feed options, grid
+modules). The listing-only response is the same feed cut down to what
+LISTING_QUERY selects, which is what the server sends back for it.
+
+    python3 ./benchmarks/bench_offerup_query.py
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from offerup import OfferUp  # noqa: E402
+
+
+LISTING_FIELDS = (
+    "listingId",
+    "conditionText",
+    "flags",
+    "image",
+    "isFirmPrice",
+    "locationName",
+    "price",
+    "title",
+    "vehicleMiles",
+)
+LISTING_TILES = ("ModularFeedTileListing", "ModularFeedTileSellerAd")
+
+
+def listing(i):
+    return {
+        "listingId": str(1600000000 + i),
+        "conditionText": "Used",
+        "flags": ["OFFERUP_SHIPPING"] if i % 4 == 0 else [],
+        "image": {
+            "height": 450,
+            "url": f"https://images.offerup.com/{i:08x}/600x450.jpg",
+            "width": 600,
+            "__typename": "ModularFeedImage",
+        },
+        "isFirmPrice": i % 3 == 0,
+        "locationName": "Brooklyn, NY",
+        "price": str(100 + i),
+        "title": f"iPhone 13 Pro 128GB unlocked #{i}",
+        "vehicleMiles": None,
+        "__typename": "ModularFeedListing",
+    }
+
+
+def display_ad(i):
+    return {
+        "tileId": f"ad-{i}",
+        "googleDisplayAd": {
+            "ouAdId": f"ou-{i}",
+            "additionalSizes": ["300x250", "320x100"],
+            "adExperimentId": "control",
+            "adHeight": 250,
+            "adNetwork": "google",
+            "adPage": "search",
+            "adRequestId": f"{i:032x}",
+            "adTileType": "display",
+            "adWidth": 300,
+            "adaptive": True,
+            "channel": "search_results",
+            "clickFeedbackUrl": f"https://offerup.com/ads/click?id={i:032x}",
+            "clientId": "ca-app-pub-0000000000000000",
+            "contentUrl": "https://offerup.com/search?q=iphone",
+            "customTargeting": [
+                {"key": key, "values": ["iphone", "electronics"], "__typename": "KeyValues"}
+                for key in ("q", "category", "zip", "experiment")
+            ],
+            "displayAdType": "banner",
+            "experimentDataHash": f"{i * 7919:016x}",
+            "formatIds": ["123456789"],
+            "impressionFeedbackUrl": f"https://offerup.com/ads/impression?id={i:032x}",
+            "renderLocation": "search",
+            "searchId": f"{i:016x}",
+            "searchQuery": "iphone",
+            "templateId": "tmpl-1",
+            "__typename": "GoogleDisplayAd",
+        },
+        "tileType": "GOOGLE_DISPLAY_AD",
+        "__typename": "ModularFeedTileGoogleDisplayAd",
+    }
+
+
+def filter_block(i):
+    return {
+        "targetName": f"filter_{i}",
+        "title": f"Filter {i}",
+        "subTitle": None,
+        "shortcutLabel": f"F{i}",
+        "shortcutRank": i,
+        "type": "SINGLE_SELECTION_LIST",
+        "isExpandedHighlight": False,
+        "options": [
+            {
+                "isDefault": j == 0,
+                "isSelected": j == 0,
+                "label": f"Option {j}",
+                "subLabel": None,
+                "value": str(j),
+                "__typename": "ModularFeedSelectionListFilterOption",
+            }
+            for j in range(8)
+        ],
+        "__typename": "ModularFeedSelectionListFilter",
+    }
+
+
+def full_response(listings: int):
+    tiles = []
+    for i in range(listings):
+        tile_type = "ModularFeedTileSellerAd" if i % 10 == 0 else "ModularFeedTileListing"
+        tiles.append(
+            {
+                "tileId": f"tile-{i}",
+                "listing": listing(i),
+                "tileType": "LISTING",
+                "__typename": tile_type,
+            }
+        )
+        if i % 6 == 5:
+            tiles.append(display_ad(i))
+
+    return {
+        "data": {
+            "modularFeed": {
+                "analyticsData": {
+                    "requestId": "0" * 32,
+                    "searchPerformedEventUniqueId": "1" * 32,
+                    "searchSessionId": "2" * 32,
+                    "__typename": "ModularFeedAnalyticsData",
+                },
+                "categoryInfo": {"categoryId": "7", "isForcedCategory": False, "__typename": "ModularFeedCategoryInfo"},
+                "feedAdditions": [],
+                "filters": [filter_block(i) for i in range(12)],
+                "legacyFeedOptions": [filter_block(i) for i in range(8)],
+                "looseTiles": tiles,
+                "modules": [
+                    {
+                        "moduleId": "recommended",
+                        "grid": {"actionPath": None, "tiles": tiles[:12], "__typename": "ModularFeedGrid"},
+                        "moduleType": "GRID",
+                        "__typename": "ModularFeedModuleGrid",
+                    }
+                ],
+                "pageCursor": "eyJvZmZzZXQiOjUwfQ==",
+                "query": {
+                    "appliedQuery": "iphone",
+                    "decisionType": "ORIGINAL",
+                    "originalQuery": "iphone",
+                    "suggestedQuery": None,
+                    "__typename": "ModularFeedQueryInfo",
+                },
+                "__typename": "ModularFeed",
+            }
+        }
+    }
+
+
+def listing_response(full: dict):
+    """The full feed cut down to the selection of LISTING_QUERY"""
+    tiles = []
+    for tile in full["data"]["modularFeed"]["looseTiles"]:
+        if tile["__typename"] in LISTING_TILES:
+            slim_listing = {field: tile["listing"][field] for field in LISTING_FIELDS}
+            slim_listing["image"] = {"url": tile["listing"]["image"]["url"]}
+            tiles.append(
+                {"tileType": tile["tileType"], "listing": slim_listing, "__typename": tile["__typename"]}
+            )
+        else:
+            tiles.append({"__typename": tile["__typename"]})
+    return {"data": {"modularFeed": {"looseTiles": tiles}}}
+
+
+def decode_time(content: bytes, rounds: int):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        json.loads(content)
+    return (time.perf_counter() - start) / rounds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--listings", type=int, default=50)
+    parser.add_argument("-r", "--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    full_search = OfferUp("iphone", "40.7128", "-74.0060", limit=str(args.listings), full_query=True)
+    listing_search = OfferUp("iphone", "40.7128", "-74.0060", limit=str(args.listings))
+
+    full = full_response(args.listings)
+    full_content = json.dumps(full).encode()
+    listing_content = json.dumps(listing_response(full)).encode()
+
+    for scraper, content in ((full_search, full_content), (listing_search, listing_content)):
+        scraper.time_checked = 0
+        assert len(scraper.parse_listing(json.loads(content))) == args.listings
+
+    print(f"request body:  full {len(full_search.body):7,} B   listing-only {len(listing_search.body):7,} B")
+    print(f"response body: full {len(full_content):7,} B   listing-only {len(listing_content):7,} B")
+
+    full_decode = decode_time(full_content, args.rounds)
+    listing_decode = decode_time(listing_content, args.rounds)
+    print(
+        f"json decode:   full {full_decode * 1e3:7.3f} ms  listing-only {listing_decode * 1e3:7.3f} ms"
+        f"  ({full_decode / listing_decode:.1f}x)"
+    )
+
+    # Old behaviour: json.dumps of the whole payload on every poll
+    payload = json.loads(full_search.body)
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        json.dumps(payload).encode()
+    per_poll = (time.perf_counter() - start) / args.rounds
+    print(f"body per poll: serialized {per_poll * 1e6:7.1f} us  pre-serialized 0 us")
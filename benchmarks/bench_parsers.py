@@ -0,0 +1,234 @@
+"""
+Offline benchmark of every marketplace parser on the response fixtures in
+benchmarks/fixtures, as checked in and scaled up to a very large response.
+
+For every parser and size it reports listings parsed per second, the
+tracemalloc peak of one parse and the memory blocks still allocated
+once the parsed DataFrame is dropped (leaks and caches show up there).
+
+    python3 ./benchmarks/bench_parsers.py
+    python3 ./benchmarks/bench_parsers.py -m gumtree_uk -m kijiji --large 50000
+
+Every fixture named <marketplace>.<ext> or <marketplace>-<name>.<ext> is
+used, so recorded (anonymized) responses can be added next to the
+generated ones.
+"""
+import argparse
+import contextlib
+import copy
+import glob
+import gc
+import io
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from registry import load_marketplace  # noqa: E402
+from transport import Response  # noqa: E402
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+SEARCHES = {
+    "offerup": {"query": "iphone", "lat": "40.7128", "long": "-74.0060"},
+    "craiglist": {"query": "toyota", "lat": "40.6731", "long": "-74.3214"},
+    "gumtree_uk": {"query": "toyota", "lat": "51.5072", "long": "-0.1276"},
+    "kijiji": {"query": "toyota", "city": "Calgary", "state": "AB"},
+    "kijiji_mobile": {"query": "toyota", "lat": "49.2827", "long": "-123.1207"},
+    "ebay": {"query": "iphone", "postal_code": "10001", "country": "US"},
+}
+CONTENT_TYPES = {
+    ".json": "application/json",
+    ".xml": "application/xml; charset=utf-8",
+    ".html": "text/html; charset=utf-8",
+}
+
+
+def cycle(items, n):
+    return [copy.deepcopy(items[i % len(items)]) for i in range(n)]
+
+
+def scale_offerup(content, n):
+    resp = json.loads(content)
+    feed = resp["data"]["modularFeed"]
+    listings = [tile for tile in feed["looseTiles"] if tile.get("listing")]
+    ads = [tile for tile in feed["looseTiles"] if not tile.get("listing")]
+    tiles = []
+    for i, tile in enumerate(cycle(listings, n)):
+        tile["listing"]["listingId"] = str(5000000000 + i)
+        tiles.append(tile)
+        if ads and i % 6 == 5:
+            tiles.append(copy.deepcopy(ads[i % len(ads)]))
+    feed["looseTiles"] = tiles
+    return json.dumps(resp).encode()
+
+
+def scale_craiglist(content, n):
+    resp = json.loads(content)
+    items = cycle(resp["data"]["items"], n)
+    for i, item in enumerate(items):
+        item[0] = n - i
+        item[1] = n - i
+    resp["data"]["items"] = items
+    return json.dumps(resp).encode()
+
+
+def scale_gumtree_uk(content, n):
+    ads = [
+        match.group(0)
+        for match in re.finditer(rb"<(\w+:)?ad [^>]*>.*?</\1ad>", content, re.S)
+    ]
+    start = content.index(ads[0])
+    end = content.rindex(ads[-1]) + len(ads[-1])
+    scaled = [
+        re.sub(rb'\bid="[^"]*"', b'id="%d"' % (9000000000 + i), ads[i % len(ads)], count=1)
+        for i in range(n)
+    ]
+    return content[:start] + b"".join(scaled) + content[end:]
+
+
+def scale_kijiji(content, n):
+    from kijiji import extract_next_data
+
+    next_data = extract_next_data(content)
+    resp = json.loads(next_data)
+    state = resp["props"]["pageProps"]["__APOLLO_STATE__"]
+    listings = [value for key, value in state.items() if key.startswith("ListingV2")]
+    state = {key: value for key, value in state.items() if not key.startswith("ListingV2")}
+    for i, listing in enumerate(cycle(listings, n)):
+        listing["id"] = str(8000000000 + i)
+        state[f"ListingV2:{listing['id']}"] = listing
+    resp["props"]["pageProps"]["__APOLLO_STATE__"] = state
+    return content.replace(next_data, json.dumps(resp).encode(), 1)
+
+
+def scale_kijiji_mobile(content, n):
+    resp = json.loads(content)
+    results = cycle(resp["results"], n)
+    for i, result in enumerate(results):
+        result["id"] = str(8000000000 + i)
+    resp["results"] = results
+    return json.dumps(resp).encode()
+
+
+def scale_ebay(content, n):
+    resp = json.loads(content)
+    items = cycle(resp["itemSummaries"], n)
+    for i, item in enumerate(items):
+        item["itemId"] = f"v1|{400000000000 + i}|0"
+    resp["itemSummaries"] = items
+    return json.dumps(resp).encode()
+
+
+SCALERS = {
+    "offerup": scale_offerup,
+    "craiglist": scale_craiglist,
+    "gumtree_uk": scale_gumtree_uk,
+    "kijiji": scale_kijiji,
+    "kijiji_mobile": scale_kijiji_mobile,
+    "ebay": scale_ebay,
+}
+
+
+def load_fixtures(marketplace):
+    paths = glob.glob(os.path.join(FIXTURES, f"{marketplace}.*"))
+    paths += glob.glob(os.path.join(FIXTURES, f"{marketplace}-*.*"))
+    for path in sorted(paths):
+        extension = os.path.splitext(path)[1]
+        if extension not in CONTENT_TYPES:
+            continue
+        with open(path, "rb") as file:
+            yield os.path.basename(path), file.read(), CONTENT_TYPES[extension]
+
+
+def create_scraper(marketplace):
+    """Parser only scraper, the constructors of some marketplaces go online"""
+    cls = load_marketplace(marketplace)
+    scraper = cls.__new__(cls)
+    for attr, value in SEARCHES[marketplace].items():
+        setattr(scraper, attr, value)
+    scraper.time_checked = time.time()
+    return scraper
+
+
+def parse(scraper, response):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return scraper.parse_response(response)
+
+
+def measure(scraper, response, min_time):
+    listings = len(parse(scraper, response))  # warm up imports and caches
+
+    rounds = 0
+    start = time.perf_counter()
+    while True:
+        parse(scraper, response)
+        rounds += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+
+    gc.collect()
+    tracemalloc.start()
+    blocks = sys.getallocatedblocks()
+    listings_df = parse(scraper, response)
+    _, peak = tracemalloc.get_traced_memory()
+    del listings_df
+    gc.collect()
+    retained = sys.getallocatedblocks() - blocks
+    tracemalloc.stop()
+
+    return listings, listings * rounds / elapsed, elapsed / rounds, peak, retained
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-m", "--marketplace", choices=list(SEARCHES), action="append", help="Only these parsers"
+    )
+    parser.add_argument(
+        "-l", "--large", type=int, default=10000, help="Listings in the scaled up response"
+    )
+    parser.add_argument(
+        "-t", "--min_time", type=float, default=1.0, help="Seconds each parser runs for"
+    )
+    parser.add_argument("-o", "--output", help="Write the results as JSON", default=None)
+    args = parser.parse_args()
+
+    results = []
+    header = f"{'fixture':28} {'size':>6} {'listings':>9} {'KB':>9} {'listings/s':>12} {'ms/parse':>10} {'peak MB':>9} {'retained':>9}"
+    print(header)
+    print("-" * len(header))
+    for marketplace in args.marketplace or SEARCHES:
+        scraper = create_scraper(marketplace)
+        for name, content, content_type in load_fixtures(marketplace):
+            sizes = (("small", content), ("large", SCALERS[marketplace](content, args.large)))
+            for size, body in sizes:
+                response = Response(200, f"https://{marketplace}.invalid/", {"Content-Type": content_type}, body)
+                listings, rate, per_parse, peak, retained = measure(scraper, response, args.min_time)
+                results.append(
+                    {
+                        "marketplace": marketplace,
+                        "fixture": name,
+                        "size": size,
+                        "listings": listings,
+                        "bytes": len(body),
+                        "listings_per_second": rate,
+                        "seconds_per_parse": per_parse,
+                        "peak_bytes": peak,
+                        "retained_blocks": retained,
+                    }
+                )
+                print(
+                    f"{name:28} {size:>6} {listings:>9,} {len(body) / 1024:>9,.0f} {rate:>12,.0f}"
+                    f" {per_parse * 1000:>10.2f} {peak / 2**20:>9.2f} {retained:>9,}"
+                )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
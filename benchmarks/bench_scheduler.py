@@ -0,0 +1,128 @@
+"""
+Fixed vs adaptive poll intervals (scheduler.AdaptiveScheduler) on
+simulated saved searches. Listings arrive at very different rates per
+search, from dead searches to hot ones, optionally busier during the day,
+and a poll gets at most one page of the newest ones, the rest of a full
+page is missed.
+
+It reports requests, listings missed and how long found listings waited
+to be found, for the fixed interval, for the adaptive scheduler and for a
+fixed interval that makes as many requests as the adaptive one did.
+
+    python3 ./benchmarks/bench_scheduler.py --searches 200 --days 2 --interval 300
+"""
+import argparse
+import heapq
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from daemon import SavedSearch  # noqa: E402
+from listing_batch import ListingBatch  # noqa: E402
+from scheduler import AdaptiveScheduler  # noqa: E402
+
+
+def arrivals(rate, start, end, diurnal, rng):
+    """Posting times of a Poisson stream, `rate` per hour, busiest mid-afternoon if diurnal"""
+    times = []
+    peak = rate * (1 + diurnal)
+    if peak <= 0:
+        return times
+    posted = start
+    while True:
+        posted += rng.expovariate(peak / 3600)
+        if posted >= end:
+            return times
+        hour = time.localtime(posted).tm_hour + time.localtime(posted).tm_min / 60
+        if rng.random() * (1 + diurnal) <= 1 + diurnal * math.sin(2 * math.pi * (hour - 9) / 24):
+            times.append(posted)
+
+
+def simulate(searches, streams, start, end, page_size, interval=None, scheduler=None):
+    pending = [(start + random.Random(i).uniform(0, search.interval), i) for i, search in enumerate(searches)]
+    heapq.heapify(pending)
+    positions = [0] * len(searches)
+    requests = missed = 0
+    lags = []
+    while pending:
+        now, i = heapq.heappop(pending)
+        if now >= end:
+            continue
+        stream = streams[i]
+        first = positions[i]
+        while positions[i] < len(stream) and stream[positions[i]] <= now:
+            positions[i] += 1
+        new = stream[first:positions[i]]
+        requests += 1
+        if len(new) > page_size:
+            missed += len(new) - page_size
+            new = new[-page_size:]
+        lags += [now - posted for posted in new]
+
+        if scheduler is None:
+            heapq.heappush(pending, (now + interval, i))
+            continue
+        batch = ListingBatch(["listing_id", "sorted_time"])
+        for n, posted in enumerate(new):
+            batch.append(f"{i}-{first + n}", posted)
+        scheduler.observe(searches[i], batch, now)
+        heapq.heappush(pending, (now + scheduler.next_interval(searches[i], now), i))
+
+    lags.sort()
+    total = sum(len(stream) for stream in streams)
+    return {
+        "requests": requests,
+        "missed": missed / total if total else 0.0,
+        "lag_p50": lags[len(lags) // 2] if lags else 0.0,
+        "lag_p95": lags[int(len(lags) * 0.95)] if lags else 0.0,
+    }
+
+
+def report(name, result):
+    print(
+        f"{name:30} {result['requests']:>9,} {result['missed']:>8.1%}"
+        f" {result['lag_p50'] / 60:>10.1f} {result['lag_p95'] / 60:>10.1f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--searches", type=int, default=200, help="Saved searches")
+    parser.add_argument("-d", "--days", type=float, default=2, help="Days simulated")
+    parser.add_argument("-i", "--interval", type=float, default=300, help="Fixed interval, and where adaptive ones start")
+    parser.add_argument("-l", "--limit", type=int, default=40, help="Listings per page")
+    parser.add_argument("-dr", "--dead", type=float, default=0.3, help="Share of searches nothing is posted for")
+    parser.add_argument("-dn", "--diurnal", type=float, default=0.8, help="Day/night swing of the posting rates, 0 for none")
+    parser.add_argument("-mi", "--min_interval", type=float, default=30)
+    parser.add_argument("-xi", "--max_interval", type=float, default=3600)
+    parser.add_argument("-bi", "--base_interval", type=float, default=1200, help="Adaptive interval at one listing an hour")
+    parser.add_argument("-s", "--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    end = time.time()
+    start = end - args.days * 86400
+    searches = [
+        SavedSearch("kijiji_mobile", {"query": f"search {i}", "lat": "0", "long": "0", "limit": args.limit}, args.interval)
+        for i in range(args.searches)
+    ]
+    # Listings per hour, median 1, from a few a week to hundreds
+    rates = [0.0 if rng.random() < args.dead else rng.lognormvariate(0, 2) for _ in searches]
+    streams = [arrivals(rate, start, end, args.diurnal, rng) for rate in rates]
+
+    print(
+        f"{args.searches} searches over {args.days:g} days, {sum(map(len, streams)):,} listings,"
+        f" {args.limit} per page"
+    )
+    print(f"{'schedule':30} {'requests':>9} {'missed':>8} {'p50 min':>10} {'p95 min':>10}")
+    report(f"fixed {args.interval:g}s", simulate(searches, streams, start, end, args.limit, interval=args.interval))
+    for profile in (False, True):
+        scheduler = AdaptiveScheduler(args.min_interval, args.max_interval, args.base_interval, profile=profile)
+        adaptive = simulate(searches, streams, start, end, args.limit, scheduler=scheduler)
+        report("adaptive, hourly profile" if profile else "adaptive", adaptive)
+    same_budget = args.interval * simulate(searches, streams, start, end, args.limit, interval=args.interval)["requests"] / adaptive["requests"]
+    report(f"fixed {same_budget:.0f}s (same requests)", simulate(searches, streams, start, end, args.limit, interval=same_budget))
@@ -0,0 +1,93 @@
+"""
+Startup time of every entry point: wall time of a fresh interpreter
+importing the script's module (everything the script does before its
+first request), which heavy libraries the import pulled in and whether
+it left files behind in the working directory.
+
+    python3 ./benchmarks/bench_startup.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+ENTRY_POINTS = [
+    "offerup",
+    "craiglist",
+    "gum_tree_uk",
+    "kijiji",
+    "kijiji_mobile",
+    "eBay",
+    "daemon",
+    "archive",
+    "history",
+    "seen_store",
+    "segment_log",
+]
+
+HEAVY_MODULES = ["pandas", "pyarrow", "numpy", "aiohttp", "requests", "parsel", "geopy"]
+
+# Not every script parses arguments (gum_tree_uk.py polls right away), so
+# the module is imported under its name instead of run with --help
+PROBE = """
+import sys
+sys.path.insert(0, {src!r})
+import {module}
+print(",".join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+
+def run(code, cwd):
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=cwd, capture_output=True, text=True, check=True
+    )
+    return time.perf_counter() - start, result.stdout.strip()
+
+
+def bench(module, runs):
+    cwd = tempfile.mkdtemp()
+    code = PROBE.format(src=SRC, module=module, heavy=HEAVY_MODULES)
+    _, loaded = run(code, cwd)  # also warms the bytecode and OS file caches
+    times = sorted(run(code, cwd)[0] for _ in range(runs))
+    return {
+        "entry_point": module,
+        "median_ms": statistics.median(times) * 1000,
+        "min_ms": times[0] * 1000,
+        "loaded": loaded,
+        "files_created": sorted(os.listdir(cwd)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--runs", type=int, default=10, help="Runs per entry point")
+    parser.add_argument(
+        "-e", "--entry_point", choices=ENTRY_POINTS, action="append", help="Only these modules"
+    )
+    parser.add_argument("-o", "--output", help="Write the results as JSON", default=None)
+    args = parser.parse_args()
+
+    interpreter = statistics.median(run("pass", None)[0] for _ in range(args.runs))
+    results = []
+    print(f"{'entry point':15} {'median ms':>10} {'min ms':>8}  {'files':5}  heavy modules loaded")
+    print("-" * 80)
+    for module in args.entry_point or ENTRY_POINTS:
+        result = bench(module, args.runs)
+        results.append(result)
+        print(
+            f"{module:15} {result['median_ms']:10.1f} {result['min_ms']:8.1f}"
+            f"  {'yes' if result['files_created'] else 'no':5}  {result['loaded'] or '-'}"
+        )
+    print(f"\nA bare interpreter starts in {interpreter * 1000:.1f} ms")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
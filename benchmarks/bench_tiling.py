@@ -0,0 +1,184 @@
+"""
+Coverage of a wide Kijiji search polled as one request vs as tiles
+(tiling.TiledScraper), against a simulated feed: listings are posted
+around a few cities of different size in the search's circle and
+every request gets the newest page within its own circle, like the API.
+
+It reports the share of the listings posted in the circle that the
+search ever reported, the requests per poll once the tiles settled and
+the listings reported from outside the circle, which the tiles at the
+edge reach into as Kijiji listings have no coordinates to drop them on.
+
+    python3 ./benchmarks/bench_tiling.py --polls 30 --rate 100 --radius_km 1000
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from geo import calculate_distances, destination_point  # noqa: E402
+from kijiji_mobile import KijijiMobile  # noqa: E402
+from metrics import Metrics  # noqa: E402
+from seen_store import MemorySeenStore  # noqa: E402
+from tiling import TiledScraper  # noqa: E402
+from transport import Response, Transport  # noqa: E402
+
+
+CENTER = (49.2827, -123.1207)
+
+
+class FeedTransport(Transport):
+    """Newest-first page of the simulated listings within a request's circle"""
+
+    def __init__(self):
+        self.ids = []
+        self.lats = np.empty(0)
+        self.longs = np.empty(0)
+        self.posted = np.empty(0)
+        self.requests = 0
+
+    def post(self, listings):
+        """Add (id, lat, long, posted) listings"""
+        ids, lats, longs, posted = zip(*listings)
+        self.ids.extend(ids)
+        self.lats = np.concatenate([self.lats, lats])
+        self.longs = np.concatenate([self.longs, longs])
+        self.posted = np.concatenate([self.posted, posted])
+
+    def fetch(self, method, url, params=None, headers=None, data=None, timeout=None):
+        self.requests += 1
+        distances = calculate_distances(params["latitude"], params["longitude"], self.lats, self.longs)
+        inside = np.flatnonzero(distances <= float(params["radius"]) / 1000)
+        newest = inside[np.argsort(-self.posted[inside], kind="stable")][: int(params["limit"])]
+        results = []
+        for i in newest.tolist():
+            sorting_date = datetime.fromtimestamp(self.posted[i], timezone.utc).isoformat()
+            results.append(
+                {
+                    "id": self.ids[i],
+                    "title": f"Toyota Corolla #{self.ids[i]}",
+                    "locationInfo": {"mapAddress": "Somewhere, BC"},
+                    "thumbnailUrl": None,
+                    "price": {"amount": 1200000},
+                    "attributes": {},
+                    "posterInfo": {"id": "0"},
+                    "activationDate": sorting_date,
+                    "sortingDate": sorting_date,
+                }
+            )
+        content = json.dumps({"results": results, "totalCount": len(inside)}).encode()
+        return Response(200, url, {"Content-Type": "application/json"}, content)
+
+    async def afetch(self, method, url, params=None, headers=None, data=None, timeout=None):
+        return self.fetch(method, url, params)
+
+
+def make_cities(count, radius_km, rng):
+    # A few large cities and many small towns, Zipf-like
+    cities = []
+    for rank in range(1, count + 1):
+        center = destination_point(
+            *CENTER, rng.uniform(0, 360), radius_km * rng.random() ** 0.5
+        )
+        cities.append((center, 1 / rank, rng.uniform(5, 30)))
+    return cities
+
+
+def post_listings(cities, count, start, end, next_id, rng):
+    weights = [weight for _, weight, _ in cities]
+    listings = []
+    for (center, _, spread), posted in zip(
+        rng.choices(cities, weights, k=count),
+        sorted(rng.uniform(start, end) for _ in range(count)),
+    ):
+        lat, long = destination_point(*center, rng.uniform(0, 360), abs(rng.gauss(0, spread)))
+        listings.append((str(next_id), lat, long, posted))
+        next_id += 1
+    return listings, next_id
+
+
+async def run(args, tiled):
+    rng = random.Random(args.seed)
+    cities = make_cities(args.cities, args.radius_km, rng)
+    transport = FeedTransport()
+    metrics = Metrics()
+
+    params = {
+        "query": "toyota",
+        "lat": str(CENTER[0]),
+        "long": str(CENTER[1]),
+        "distance": int(args.radius_km * 1000),
+        "limit": args.limit,
+    }
+    with contextlib.redirect_stdout(io.StringIO()):
+        scraper = KijijiMobile(**params)
+    scraper.seen_store = MemorySeenStore()
+    scraper.transport = transport
+    scraper.metrics = metrics
+    poller = TiledScraper(scraper, params) if tiled else scraper
+
+    now = time.time()
+    clock = now - args.polls * args.interval
+    listings, next_id = post_listings(cities, args.limit, clock - args.interval, clock, 0, rng)
+    transport.post(listings)  # already there before the first poll
+
+    posted = {}
+    reported = set()
+    requests = []
+    for _ in range(args.polls):
+        listings, next_id = post_listings(cities, args.rate, clock, clock + args.interval, next_id, rng)
+        transport.post(listings)
+        clock += args.interval
+        posted.update((listing_id, (lat, long)) for listing_id, lat, long, _ in listings)
+
+        before = transport.requests
+        with contextlib.redirect_stdout(io.StringIO()):
+            new_listings = poller.process_listings(await poller.aget_listings())
+        reported.update(str(listing_id) for listing_id in new_listings.column("listing_id"))
+        requests.append(transport.requests - before)
+
+    ids = list(posted)
+    distances = calculate_distances(
+        *CENTER, [posted[i][0] for i in ids], [posted[i][1] for i in ids]
+    )
+    inside = {listing_id for listing_id, distance in zip(ids, distances) if distance <= args.radius_km}
+    settled = requests[len(requests) // 2:]
+    return {
+        "coverage": len(reported & inside) / len(inside),
+        "requests_per_poll": sum(settled) / len(settled),
+        "outside": len(reported - inside - set(str(i) for i in range(args.limit))),
+        "tiles": len(poller.plan.leaves()) if tiled else 1,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--polls", type=int, default=30, help="Polls of the search")
+    parser.add_argument("-r", "--rate", type=int, default=100, help="Listings posted in the circle between polls")
+    parser.add_argument("-rk", "--radius_km", type=float, default=1000, help="Radius of the search")
+    parser.add_argument("-l", "--limit", type=int, default=40, help="Listings per page")
+    parser.add_argument("-c", "--cities", type=int, default=25, help="Places the listings are posted around")
+    parser.add_argument("-i", "--interval", type=float, default=300, help="Seconds between polls")
+    parser.add_argument("-s", "--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp())  # new listings are written under ./data
+    print(f"{args.rate} listings per poll in {args.radius_km:g} km, {args.limit} per page, {args.polls} polls")
+    print(f"{'mode':8} {'coverage':>9} {'requests/poll':>14} {'tiles':>6} {'outside circle':>15}")
+    for tiled in (False, True):
+        result = asyncio.run(run(args, tiled))
+        print(
+            f"{'tiled' if tiled else 'single':8} {result['coverage']:9.1%}"
+            f" {result['requests_per_poll']:14.1f} {result['tiles']:6} {result['outside']:15}"
+        )
@@ -0,0 +1,212 @@
+"""
+Regenerates the checked-in parser fixtures.
+
+The fixtures follow the shape of real responses of each marketplace API
+(field names, nesting, namespaces, ads mixed in with listings) but all ids,
+names, places and URLs are made up. Recorded responses can be dropped next
+to them as <marketplace>-<anything>.<ext> once they are anonymized.
+
+    python3 ./benchmarks/fixtures/generate.py
+"""
+import json
+import os
+import random
+
+
+FOLDER = os.path.dirname(os.path.abspath(__file__))
+LISTINGS = 20
+
+TITLES = ("Toyota Corolla", "Honda Civic", "Ford Focus", "iPhone 13 Pro", "Mountain bike", "Dining table")
+CITIES = (("Springfield", 40.71, -74.0), ("Riverside", 40.65, -73.95), ("Fairview", 40.8, -74.1))
+
+
+def offerup(rng):
+    tiles = []
+    for i in range(LISTINGS):
+        if i % 6 == 5:
+            tiles.append(
+                {
+                    "tileId": f"ad-{i}",
+                    "googleDisplayAd": {"ouAdId": f"ou-{i}", "adNetwork": "google", "adTileType": "display"},
+                    "tileType": "GOOGLE_DISPLAY_AD",
+                    "__typename": "ModularFeedTileGoogleDisplayAd",
+                }
+            )
+        tiles.append(
+            {
+                "tileId": f"tile-{i}",
+                "listing": {
+                    "listingId": str(1000000 + i),
+                    "conditionText": rng.choice(["Used", "Like new", "New"]),
+                    "flags": ["OFFERUP_SHIPPING"] if i % 4 == 0 else [],
+                    "image": {"height": 450, "url": f"https://images.example.com/ou/{i}.jpg", "width": 600},
+                    "isFirmPrice": i % 3 == 0,
+                    "locationName": f"{rng.choice(CITIES)[0]}, NY",
+                    "price": str(rng.randrange(20, 20000)),
+                    "title": f"{rng.choice(TITLES)} #{i}",
+                    "vehicleMiles": str(rng.randrange(1000, 200000)) if i % 2 else None,
+                    "__typename": "ModularFeedListing",
+                },
+                "tileType": "LISTING",
+                "__typename": "ModularFeedTileSellerAd" if i == 0 else "ModularFeedTileListing",
+            }
+        )
+    return json.dumps({"data": {"modularFeed": {"looseTiles": tiles, "pageCursor": "e30="}}}).encode()
+
+
+def craiglist(rng):
+    locations = [[0, "springfield"]] + [[i, f"area{i}", f"sub{i}" if i % 2 else None] for i in range(1, 8)]
+    items = []
+    for i in range(LISTINGS):
+        _, lat, long = rng.choice(CITIES)
+        items.append(
+            [
+                LISTINGS - i,
+                (LISTINGS - i) * 60,
+                rng.choice([146, 147, 148]),
+                0,
+                f"{rng.randrange(len(locations))}:{i}~{lat + rng.uniform(-0.1, 0.1):.4f}~{long + rng.uniform(-0.1, 0.1):.4f}",
+                [13, rng.randrange(1000)],
+                [4, f"3:00{i:03d}_abcdefg{i}", f"3:00{i:03d}_hijklmn{i}"],
+                [6, f"{rng.choice(TITLES).lower().replace(' ', '-')}-{i}"],
+                [10, f"${rng.randrange(100, 30000):,}"],
+                f"{rng.choice(TITLES)} #{i}",
+            ]
+        )
+    return json.dumps(
+        {
+            "data": {
+                "canonicalUrl": "https://springfield.craigslist.org/search/sss/",
+                "decode": {"locations": locations, "minPostingId": 7700000000, "minPostedDate": 1718000000},
+                "items": items,
+            }
+        }
+    ).encode()
+
+
+GUMTREE_NAMESPACES = {
+    "ns0": "http://www.ebayclassifiedsgroup.com/schema/ad/v1",
+    "ns1": "http://www.ebayclassifiedsgroup.com/schema/types/v1",
+    "ns2": "http://www.ebayclassifiedsgroup.com/schema/location/v1",
+    "ns3": "http://www.ebayclassifiedsgroup.com/schema/attribute/v1",
+    "ns4": "http://www.ebayclassifiedsgroup.com/schema/picture/v1",
+}
+
+
+def gumtree_uk(rng):
+    ads = []
+    for i in range(LISTINGS):
+        _, lat, long = rng.choice(CITIES)
+        ads.append(
+            f'<ns0:ad id="{1400000000 + LISTINGS - i}">'
+            f"<ns0:title>{rng.choice(TITLES)} #{i}</ns0:title>"
+            f"<ns0:price><ns1:amount>{rng.randrange(100, 30000)}</ns1:amount>"
+            "<ns1:currency-iso-code><ns1:value>GBP</ns1:value></ns1:currency-iso-code></ns0:price>"
+            f"<ns0:start-date-time>2024-06-20T{23 - i % 24:02d}:{59 - i % 60:02d}:00.000+01:00</ns0:start-date-time>"
+            f"<ns0:user-id>user{i}</ns0:user-id><ns0:account-id>account{i}</ns0:account-id>"
+            f'<ns0:link rel="self" href="https://api.example.com/ads/{i}"/>'
+            f'<ns0:link rel="self-public-website" href="https://www.example.com/p/{i}"/>'
+            '<ns2:locations><ns2:location id="10000392"><ns2:localized-name>England</ns2:localized-name></ns2:location>'
+            f'<ns2:location id="{10000400 + i}"><ns2:localized-name>{rng.choice(CITIES)[0]}</ns2:localized-name>'
+            f"<ns2:area><ns2:lat>{lat + rng.uniform(-0.1, 0.1):.5f}</ns2:lat><ns2:lng>{long + rng.uniform(-0.1, 0.1):.5f}</ns2:lng></ns2:area>"
+            "</ns2:location></ns2:locations>"
+            f'<ns4:pictures><ns4:picture><ns4:link rel="thumb" href="https://img.example.com/{i}/thumb.jpg"/>'
+            f'<ns4:link rel="extrabig" href="https://img.example.com/{i}/big.jpg"/></ns4:picture></ns4:pictures>'
+            '<ns3:attributes><ns3:attribute name="vehicle_make"><ns3:value>toyota</ns3:value></ns3:attribute>'
+            f'<ns3:attribute name="vehicle_mileage"><ns3:value>{rng.randrange(1000, 150000)}</ns3:value></ns3:attribute>'
+            f'<ns3:attribute name="vehicle_registration_year"><ns3:value>{rng.randrange(2005, 2024)}</ns3:value></ns3:attribute>'
+            "</ns3:attributes></ns0:ad>"
+        )
+    declarations = " ".join(f'xmlns:{prefix}="{uri}"' for prefix, uri in GUMTREE_NAMESPACES.items())
+    return (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><ns0:ads {declarations}>'
+        + "".join(ads)
+        + "</ns0:ads>"
+    ).encode()
+
+
+def kijiji(rng):
+    state = {"ROOT_QUERY": {"__typename": "Query"}}
+    for i in range(LISTINGS):
+        state[f"ListingV2:{i}"] = {
+            "__typename": "ListingV2",
+            "id": str(1700000000 + LISTINGS - i),
+            "title": f"{rng.choice(TITLES)} #{i}",
+            "location": {"address": f"{rng.choice(CITIES)[0]}, AB"},
+            "imageUrls": [f"https://media.example.com/kijiji/{i}/1.jpg"],
+            "price": {"amount": rng.randrange(1000, 3000000), "currency": "CAD"},
+            "attributes": [
+                {"name": "caryear", "values": [str(rng.randrange(2005, 2024))]},
+                {"name": "carmileageinkms", "values": [str(rng.randrange(1000, 250000))]},
+            ],
+            "seoUrl": f"/v-cars-trucks/springfield/listing-{i}/{1700000000 + LISTINGS - i}",
+            "posterInfo": {"__ref": f"PosterInfo:{i}"},
+            "activationDate": f"2024-06-20T{23 - i % 24:02d}:00:13.000Z",
+            "sortingDate": f"2024-06-20T{23 - i % 24:02d}:00:13.000Z",
+        }
+        state[f"PosterInfo:{i}"] = {"__typename": "PosterInfo", "id": str(i)}
+
+    next_data = {"props": {"pageProps": {"__APOLLO_STATE__": state}}}
+    card = "<li class='card'><a href='/listing'>" + "listing text " * 8 + "</a></li>"
+    return (
+        "<!DOCTYPE html><html><head><title>Results</title></head><body><ul>"
+        + card * 400
+        + '</ul><script id="__NEXT_DATA__" type="application/json">'
+        + json.dumps(next_data)
+        + "</script></body></html>"
+    ).encode()
+
+
+def kijiji_mobile(rng):
+    results = []
+    for i in range(LISTINGS):
+        results.append(
+            {
+                "id": str(1700000000 + LISTINGS - i),
+                "title": f"{rng.choice(TITLES)} #{i}",
+                "locationInfo": {"mapAddress": f"{rng.choice(CITIES)[0]}, BC"},
+                "thumbnailUrl": f"https://media.example.com/kijiji/{i}/thumb.jpg",
+                "price": {"amount": rng.randrange(1000, 3000000) if i % 5 else None},
+                "attributes": {"carmileageinkms": str(rng.randrange(1000, 250000)), "caryear": str(rng.randrange(2005, 2024))},
+                "posterInfo": {"id": str(i)},
+                "activationDate": f"2024-06-20T{23 - i % 24:02d}:00:13.000Z",
+                "sortingDate": f"2024-06-20T{23 - i % 24:02d}:00:13.000Z",
+            }
+        )
+    return json.dumps({"results": results, "totalCount": LISTINGS}).encode()
+
+
+def ebay(rng):
+    items = []
+    for i in range(LISTINGS):
+        items.append(
+            {
+                "itemId": f"v1|{300000000000 + LISTINGS - i}|0",
+                "title": f"{rng.choice(TITLES)} #{i}",
+                "itemWebUrl": f"https://www.example.com/itm/{300000000000 + LISTINGS - i}",
+                "seller": {"username": f"seller{i}", "feedbackScore": rng.randrange(1000)},
+                "price": {"value": f"{rng.randrange(10, 30000)}.00", "currency": "USD"},
+                "thumbnailImages": [{"imageUrl": f"https://i.example.com/{i}/s-l1600.jpg"}],
+                "itemLocation": {"postalCode": "100**", "country": "US"},
+                "itemCreationDate": f"2024-06-20T{23 - i % 24:02d}:00:00.000Z",
+            }
+        )
+    return json.dumps({"total": LISTINGS, "itemSummaries": items}).encode()
+
+
+FIXTURES = {
+    "offerup.json": offerup,
+    "craiglist.json": craiglist,
+    "gumtree_uk.xml": gumtree_uk,
+    "kijiji.html": kijiji,
+    "kijiji_mobile.json": kijiji_mobile,
+    "ebay.json": ebay,
+}
+
+
+if __name__ == "__main__":
+    for name, generate in FIXTURES.items():
+        content = generate(random.Random(name))
+        with open(os.path.join(FOLDER, name), "wb") as file:
+            file.write(content)
+        print(f"{name}: {len(content) / 1024:.1f} KB")
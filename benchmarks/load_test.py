@@ -0,0 +1,222 @@
+"""
+Load test of the whole fetch -> parse -> dedup -> store pipeline against
+benchmarks/stub_server.py instead of the live marketplaces.
+
+Starts the stub server, points every scraper at it through the API URL
+environment variables, runs a SearchDaemon with many saved searches for
+a fixed time in a scratch folder and reports throughput, errors and the
+latency of every poll stage.
+
+    python3 ./benchmarks/load_test.py --searches 500 --interval 5 --duration 60
+    python3 ./benchmarks/load_test.py -m offerup -m craiglist --latency 0.3 --error_rate 0.02
+    python3 ./benchmarks/load_test.py -m offerup -m kijiji_mobile --overlap 4 --coalesce
+    python3 ./benchmarks/load_test.py --max_rate 20 --capacity 16 --rate_limit
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS, "..", "src"))
+
+from stub_server import ENDPOINTS  # noqa: E402
+
+
+SEARCHES = {
+    "offerup": {"query": "iphone", "lat": "40.7128", "long": "-74.0060"},
+    "craiglist": {"query": "toyota", "lat": "40.6731", "long": "-74.3214"},
+    "gumtree_uk": {"query": "toyota", "lat": "51.5072", "long": "-0.1276"},
+    "kijiji": {"query": "toyota", "city": "Calgary", "state": "AB"},
+    "kijiji_mobile": {"query": "toyota", "lat": "49.2827", "long": "-123.1207"},
+    "ebay": {"query": "iphone", "postal_code": "10001", "country": "US"},
+}
+STAGES = ("fetch", "decode", "parse", "dedup", "write")
+
+
+def start_stub(args):
+    command = [
+        sys.executable,
+        os.path.join(BENCHMARKS, "stub_server.py"),
+        "--host", "127.0.0.1",
+        "--port", str(args.port),
+        "--latency", str(args.latency),
+        "--jitter", str(args.jitter),
+        "--error_rate", str(args.error_rate),
+        "--fresh_rate", str(args.fresh_rate),
+        "--max_rate", str(args.max_rate),
+        "--capacity", str(args.capacity),
+    ]
+    stub = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{args.port}"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            urllib.request.urlopen(base_url + ENDPOINTS["kijiji_mobile"][1], timeout=1)
+            break
+        except OSError:
+            if stub.poll() is not None or time.monotonic() > deadline:
+                stub.kill()
+                raise RuntimeError("Stub server did not start")
+            time.sleep(0.2)
+
+    # The scraper modules read these when they are imported
+    for variable, path in ENDPOINTS.values():
+        os.environ[variable] = base_url + path
+    return stub
+
+
+def saved_searches(marketplaces, count, interval, overlap=1):
+    """
+    `count` searches, every `overlap` of them watching the same query and
+    place with different price limits, as users of one area would
+    """
+    from daemon import SavedSearch
+
+    searches = []
+    for i in range(count):
+        marketplace = marketplaces[(i // overlap) % len(marketplaces)]
+        params = dict(SEARCHES[marketplace])
+        params["query"] = f"{params['query']} {i // overlap}"
+        if i % overlap:
+            params["min_price"] = str(100 * (i % overlap))
+        searches.append(SavedSearch(marketplace, params, interval))
+    return searches
+
+
+async def run_for(daemon, duration):
+    task = asyncio.create_task(daemon.run())
+    await asyncio.sleep(duration)
+    task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await task
+
+
+def report(summary, duration):
+    counters = {}
+    throttled = 0
+    for counter in summary["counters"]:
+        counters[counter["name"]] = counters.get(counter["name"], 0) + counter["value"]
+        if counter["name"] == "responses_total" and counter["labels"].get("status") == "429":
+            throttled += counter["value"]
+
+    totals = {
+        "duration": duration,
+        "requests": counters.get("responses_total", 0) + counters.get("fetch_errors_total", 0),
+        "polls": counters.get("polls_total", 0),
+        "listings": counters.get("listings_parsed_total", 0),
+        "new_listings": counters.get("new_listings_total", 0),
+        "poll_errors": counters.get("poll_errors_total", 0),
+        "fetch_errors": counters.get("fetch_errors_total", 0),
+        "throttled": throttled,
+        "backoffs": counters.get("rate_limit_backoffs_total", 0),
+    }
+    print(f"{'requests/s':>14} {totals['requests'] / duration:12,.1f}")
+    print(f"{'polls/s':>14} {totals['polls'] / duration:12,.1f}")
+    print(f"{'listings/s':>14} {totals['listings'] / duration:12,.1f}")
+    print(f"{'new listings':>14} {totals['new_listings']:12,}")
+    print(f"{'poll errors':>14} {totals['poll_errors']:12,}")
+    print(f"{'fetch errors':>14} {totals['fetch_errors']:12,}")
+    print(f"{'429s':>14} {totals['throttled']:12,}")
+    print(f"{'backoffs':>14} {totals['backoffs']:12,}")
+    print()
+
+    header = f"{'stage':8} {'marketplace':14} {'count':>8} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}"
+    print(header)
+    print("-" * len(header))
+    stages = sorted(
+        (
+            histogram
+            for histogram in summary["histograms"]
+            if histogram["name"] == "stage_seconds" and histogram["count"]
+        ),
+        key=lambda histogram: (STAGES.index(histogram["labels"]["stage"]), histogram["labels"]["marketplace"]),
+    )
+    for histogram in stages:
+        print(
+            f"{histogram['labels']['stage']:8} {histogram['labels']['marketplace']:14}"
+            f" {histogram['count']:>8,} {histogram['p50'] * 1000:>9.1f}"
+            f" {histogram['p95'] * 1000:>9.1f} {histogram['max'] * 1000:>9.1f}"
+        )
+    return {"totals": totals, "stages": stages}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-m", "--marketplace", choices=list(SEARCHES), action="append", help="Only these marketplaces"
+    )
+    parser.add_argument("-s", "--searches", type=int, default=120, help="Saved searches polled")
+    parser.add_argument("-i", "--interval", type=float, default=5, help="Seconds between polls of a search")
+    parser.add_argument("-d", "--duration", type=float, default=30, help="Seconds the daemon runs for")
+    parser.add_argument("-c", "--concurrency", type=int, default=256)
+    parser.add_argument("-w", "--workers", type=int, default=8)
+    parser.add_argument("-p", "--port", type=int, default=8900)
+    parser.add_argument("-l", "--latency", type=float, default=0.1)
+    parser.add_argument("-j", "--jitter", type=float, default=0.1)
+    parser.add_argument("-e", "--error_rate", type=float, default=0.01)
+    parser.add_argument("-n", "--fresh_rate", type=float, default=0.5)
+    parser.add_argument("-mr", "--max_rate", type=float, default=0.0, help="Requests per second the stub serves")
+    parser.add_argument("-cp", "--capacity", type=int, default=0, help="Requests in flight before the stub slows down")
+    parser.add_argument("-ov", "--overlap", type=int, default=1, help="Searches sharing a query and place")
+    parser.add_argument("-co", "--coalesce", action="store_true", help="Coalesce overlapping searches")
+    parser.add_argument(
+        "-ad", "--adaptive", action="store_true", help="Adaptive intervals, from a fifth to five times --interval"
+    )
+    parser.add_argument("-rl", "--rate_limit", action="store_true", help="Pace and limit the requests per host")
+    parser.add_argument("-hi", "--history", action="store_true", help="Also write the Parquet history")
+    parser.add_argument("-o", "--output", help="Write the results as JSON", default=None)
+    parser.add_argument("-v", "--verbose", action="store_true", help="Keep the scrapers' output")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    stub = start_stub(args)
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            # Listings, databases and lookup caches go to ./data
+            os.chdir(folder)
+            from daemon import SearchDaemon, coalesce_searches
+            from history import ListingHistory
+            from metrics import Metrics
+            from rate_limit import RateLimiter
+            from scheduler import AdaptiveScheduler
+            from seen_store import CachedSeenStore, SQLiteSeenStore, SEEN_DB
+
+            os.makedirs(os.path.dirname(SEEN_DB), exist_ok=True)
+            metrics = Metrics()
+            searches = saved_searches(
+                args.marketplace or list(SEARCHES), args.searches, args.interval, args.overlap
+            )
+            if args.coalesce:
+                searches = coalesce_searches(searches)
+            daemon = SearchDaemon(
+                searches,
+                seen_store=CachedSeenStore(SQLiteSeenStore(SEEN_DB)),
+                concurrency=args.concurrency,
+                workers=args.workers,
+                metrics=metrics,
+                history=ListingHistory() if args.history else None,
+                scheduler=AdaptiveScheduler(args.interval / 5, args.interval * 5, metrics=metrics)
+                if args.adaptive
+                else None,
+                limiter=RateLimiter() if args.rate_limit else None,
+            )
+            quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+            with quiet:
+                asyncio.run(run_for(daemon, args.duration))
+            os.chdir(BENCHMARKS)
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    results = report(metrics.summary(), args.duration)
+    if output:
+        with open(output, "w") as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,373 @@
+"""
+Local stand-in for the marketplace APIs, for load testing the whole
+fetch -> parse -> dedup -> store pipeline without touching live endpoints.
+
+Every marketplace endpoint replays the response fixture of that
+marketplace (benchmarks/fixtures, or --fixtures with recorded ones) as a
+newest-first feed. Fresh listings with new ids and posting times are
+injected ahead of the old ones, and requests get a configurable latency,
+jitter and error rate. Like a marketplace throttling its clients it can
+answer 429 to requests over --max_rate per second and slow down with more
+than --capacity requests in flight.
+
+    python3 ./benchmarks/stub_server.py --port 8900 --latency 0.2 --jitter 0.1 --error_rate 0.01
+
+Point the scrapers at it with the environment variables it prints on
+startup, e.g. OFFERUP_API_URL=http://127.0.0.1:8900/offerup/api/graphql
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import random
+import re
+import sys
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+ERROR_STATUSES = (429, 500, 502, 503)
+MAX_FEED = 1000  # listings kept per feed, oldest are dropped
+
+# Marketplace -> (environment variable of the scraper module, stub path)
+ENDPOINTS = {
+    "offerup": ("OFFERUP_API_URL", "/offerup/api/graphql"),
+    "craiglist": ("CRAIGLIST_API_URL", "/craiglist/web/v8/postings/search/full"),
+    "gumtree_uk": ("GUMTREE_UK_API_URL", "/gumtree_uk/capi/api/ads"),
+    "kijiji": ("KIJIJI_API_URL", "/kijiji/anvil2/api"),
+    "kijiji_mobile": ("KIJIJI_MOBILE_API_URL", "/kijiji_mobile/v2/listings"),
+    "ebay": ("EBAY_API_URL", "/ebay/buy/browse/v1/item_summary/search"),
+}
+KIJIJI_SEARCH_PATH = "/kijiji/b-search"
+
+
+def iso_now(suffix="Z"):
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000") + suffix
+
+
+class Feed:
+    """
+    Newest-first listings of one marketplace. Subclasses know where the
+    listings sit in the fixture, how to stamp a copy of one with a new id
+    and posting time, and how to render a page back to bytes.
+    """
+
+    content_type = "application/json"
+
+    def __init__(self, content: bytes, page_size: int = None):
+        self.templates = self.load(content)
+        self.fresh_templates = [t for t in self.templates if self.is_listing(t)]
+        self.listings = deque(self.templates, maxlen=MAX_FEED)
+        self.page_size = page_size or len(self.templates)
+        self.sequence = 0
+
+    def load(self, content):
+        raise NotImplementedError
+
+    def is_listing(self, template):
+        return True
+
+    def fresh(self, template, sequence):
+        raise NotImplementedError
+
+    def render(self, listings):
+        raise NotImplementedError
+
+    def inject(self, count):
+        for _ in range(count):
+            self.sequence += 1
+            template = copy.deepcopy(random.choice(self.fresh_templates))
+            self.listings.appendleft(self.fresh(template, self.sequence))
+
+    def page(self):
+        return self.render(list(self.listings)[: self.page_size])
+
+
+class JSONFeed(Feed):
+    """Listings in a list somewhere in a JSON document"""
+
+    path = ()
+
+    def load(self, content):
+        self.document = json.loads(content)
+        return self.container(self.document)
+
+    def container(self, document):
+        for key in self.path:
+            document = document[key]
+        return document
+
+    def render(self, listings):
+        document = copy.copy(self.document)
+        parent = document
+        for key in self.path[:-1]:
+            parent[key] = copy.copy(parent[key])
+            parent = parent[key]
+        parent[self.path[-1]] = listings
+        return json.dumps(document).encode()
+
+
+class OfferUpFeed(JSONFeed):
+    path = ("data", "modularFeed", "looseTiles")
+
+    def is_listing(self, tile):
+        return bool(tile.get("listing"))
+
+    def fresh(self, tile, sequence):
+        tile["listing"]["listingId"] = str(3000000000 + sequence)
+        return tile
+
+
+class CraiglistFeed(JSONFeed):
+    path = ("data", "items")
+
+    def load(self, content):
+        items = super().load(content)
+        decode = self.document["data"]["decode"]
+        self.min_id = decode["minPostingId"]
+        self.min_date = decode["minPostedDate"]
+        return items
+
+    def fresh(self, item, sequence):
+        item[0] = 10**6 + sequence
+        item[1] = int(time.time()) - self.min_date
+        return item
+
+
+class KijijiMobileFeed(JSONFeed):
+    path = ("results",)
+
+    def fresh(self, result, sequence):
+        result["id"] = str(3000000000 + sequence)
+        result["activationDate"] = result["sortingDate"] = iso_now()
+        return result
+
+
+class EbayFeed(JSONFeed):
+    path = ("itemSummaries",)
+
+    def fresh(self, item, sequence):
+        item["itemId"] = f"v1|{500000000000 + sequence}|0"
+        item["itemCreationDate"] = iso_now()
+        return item
+
+
+class KijijiFeed(Feed):
+    content_type = "text/html; charset=utf-8"
+
+    def load(self, content):
+        # Imported here so that importing this module leaves the scraper
+        # modules, and the API URLs they read on import, alone
+        from kijiji import extract_next_data
+
+        next_data = extract_next_data(content)
+        start = content.index(next_data)
+        self.head = content[:start]
+        self.tail = content[start + len(next_data) :]
+        self.document = json.loads(next_data)
+        state = self.document["props"]["pageProps"]["__APOLLO_STATE__"]
+        self.other = {key: value for key, value in state.items() if not key.startswith("ListingV2")}
+        return [value for key, value in state.items() if key.startswith("ListingV2")]
+
+    def fresh(self, listing, sequence):
+        listing["id"] = str(3000000000 + sequence)
+        listing["activationDate"] = listing["sortingDate"] = iso_now()
+        return listing
+
+    def render(self, listings):
+        state = dict(self.other)
+        for listing in listings:
+            state[f"ListingV2:{listing['id']}"] = listing
+        document = {"props": {"pageProps": {"__APOLLO_STATE__": state}}}
+        return self.head + json.dumps(document).encode() + self.tail
+
+
+class GumTreeFeed(Feed):
+    content_type = "application/xml; charset=utf-8"
+
+    def load(self, content):
+        ads = [
+            match.group(0)
+            for match in re.finditer(rb"<(\w+:)?ad [^>]*>.*?</\1ad>", content, re.S)
+        ]
+        start = content.index(ads[0])
+        end = content.rindex(ads[-1]) + len(ads[-1])
+        self.head = content[:start]
+        self.tail = content[end:]
+        return ads
+
+    def fresh(self, ad, sequence):
+        ad = re.sub(rb'\bid="[^"]*"', b'id="%d"' % (3000000000 + sequence), ad, count=1)
+        return re.sub(
+            rb"(start-date-time>)[^<]*(<)",
+            lambda match: match.group(1) + iso_now("+00:00").encode() + match.group(2),
+            ad,
+            count=1,
+        )
+
+    def render(self, ads):
+        return self.head + b"".join(ads) + self.tail
+
+
+FEEDS = {
+    "offerup": (OfferUpFeed, "offerup.json"),
+    "craiglist": (CraiglistFeed, "craiglist.json"),
+    "gumtree_uk": (GumTreeFeed, "gumtree_uk.xml"),
+    "kijiji": (KijijiFeed, "kijiji.html"),
+    "kijiji_mobile": (KijijiMobileFeed, "kijiji_mobile.json"),
+    "ebay": (EbayFeed, "ebay.json"),
+}
+
+
+class StubServer:
+    def __init__(
+        self,
+        fixtures: str = FIXTURES,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        fresh_rate: float = 0.0,
+        max_rate: float = 0.0,
+        capacity: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.fresh_rate = fresh_rate
+        self.max_rate = max_rate
+        self.capacity = capacity
+        self.base_url = None
+        self.requests = 0
+        self.in_flight = 0
+        self.tokens = max_rate  # a second's worth of requests
+        self.refilled = time.monotonic()
+        self.feeds = {}
+        for marketplace, (feed_class, name) in FEEDS.items():
+            with open(os.path.join(fixtures, name), "rb") as file:
+                self.feeds[marketplace] = feed_class(file.read())
+
+    def fresh_count(self):
+        """fresh_rate new listings per request on average"""
+        count = int(self.fresh_rate)
+        if random.random() < self.fresh_rate - count:
+            count += 1
+        return count
+
+    async def delay(self):
+        wait = self.latency + random.uniform(0, self.jitter)
+        if self.capacity and self.in_flight > self.capacity:
+            # Overloaded, every request waits for its share
+            wait *= self.in_flight / self.capacity
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def throttled(self):
+        if not self.max_rate:
+            return False
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self.refilled) * self.max_rate, self.max_rate)
+        self.refilled = now
+        if self.tokens < 1:
+            return True
+        self.tokens -= 1
+        return False
+
+    def failure(self):
+        if self.throttled():
+            return web.Response(status=429, text="stub throttled", headers={"Retry-After": "1"})
+        if self.error_rate and random.random() < self.error_rate:
+            status = random.choice(ERROR_STATUSES)
+            headers = {"Retry-After": "1"} if status in (429, 503) else {}
+            return web.Response(status=status, text="stub error", headers=headers)
+        return None
+
+    async def feed_page(self, marketplace):
+        self.requests += 1
+        failure = self.failure()
+        self.in_flight += 1
+        try:
+            await self.delay()
+        finally:
+            self.in_flight -= 1
+        if failure is not None:
+            return failure
+
+        feed = self.feeds[marketplace]
+        feed.inject(self.fresh_count())
+        return web.Response(body=feed.page(), headers={"Content-Type": feed.content_type})
+
+    async def kijiji_api(self, request):
+        """The anvil2 GraphQL lookups behind Kijiji searches"""
+        self.requests += 1
+        await self.delay()
+        payload = await request.json()
+        query = payload.get("query", "")
+        variables = payload.get("variables", {})
+
+        if "placeSuggestions" in query:
+            place = variables.get("input", "")
+            data = {"placeSuggestions": [{"placeId": f"stub-{place}", "address": place}]}
+        elif "locationFromPlace" in query:
+            data = {"locationFromPlace": {"location": {"id": 1700273, "localizedName": "Stub"}}}
+        else:
+            keywords = variables["input"]["searchQuery"].get("keywords") or "all"
+            data = {"searchUrl": f"{self.base_url}{KIJIJI_SEARCH_PATH}/{keywords}"}
+        return web.json_response({"data": data})
+
+    def application(self):
+        app = web.Application()
+        routes = []
+        for marketplace, (_, path) in ENDPOINTS.items():
+            if marketplace == "kijiji":
+                routes.append(web.post(path, self.kijiji_api))
+                continue
+            handler = self.marketplace_handler(marketplace)
+            routes += [web.get(path, handler), web.post(path, handler)]
+        routes.append(web.get(KIJIJI_SEARCH_PATH + "/{query}", self.marketplace_handler("kijiji")))
+        app.add_routes(routes)
+        return app
+
+    def marketplace_handler(self, marketplace):
+        async def handler(request):
+            return await self.feed_page(marketplace)
+
+        return handler
+
+    def environment(self):
+        return {variable: self.base_url + path for variable, path in ENDPOINTS.values()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("-p", "--port", type=int, default=8900)
+    parser.add_argument("-f", "--fixtures", help="Folder of response fixtures", default=FIXTURES)
+    parser.add_argument("-l", "--latency", help="Seconds added to every response", type=float, default=0.0)
+    parser.add_argument("-j", "--jitter", help="Random extra seconds, up to", type=float, default=0.0)
+    parser.add_argument("-e", "--error_rate", help="Share of requests failing", type=float, default=0.0)
+    parser.add_argument(
+        "-n", "--fresh_rate", help="New listings injected per request on average", type=float, default=0.5
+    )
+    parser.add_argument(
+        "-mr", "--max_rate", help="Requests per second served, 429 over it, 0 for no limit", type=float, default=0.0
+    )
+    parser.add_argument(
+        "-cp", "--capacity", help="Requests in flight before responses slow down, 0 for no limit", type=int, default=0
+    )
+    args = parser.parse_args()
+
+    stub = StubServer(
+        args.fixtures, args.latency, args.jitter, args.error_rate, args.fresh_rate, args.max_rate, args.capacity
+    )
+    stub.base_url = f"http://{args.host}:{args.port}"
+    for variable, url in stub.environment().items():
+        print(f"export {variable}={url}")
+    sys.stdout.flush()
+    web.run_app(stub.application(), host=args.host, port=args.port, print=None, access_log=None)
@@ -0,0 +1,327 @@
+import argparse
+import collections
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from registry import load_marketplace, marketplace_names
+
+
+ARCHIVE_FOLDER = "./data/archive"
+DEFAULT_SAMPLE_RATE = 0.05
+COMPRESSION_LEVEL = 6
+DICTIONARY_SIZE = 32 * 1024  # zlib only looks back 32KB
+TRAIN_AFTER = 50  # responses archived before the first dictionary is built
+TRAIN_SAMPLES = 200
+QUEUE_SIZE = 200  # responses waiting to be written, more are dropped
+
+
+TOKEN_PATTERN = re.compile(rb'[^<>",{}\[\]]{4,}[<>",{}\[\]]')
+
+
+def split_tokens(content: bytes):
+    """Rough markup/JSON tokens, good enough to find shared boilerplate"""
+    return TOKEN_PATTERN.findall(content)
+
+
+def train_dictionary(samples, size: int = DICTIONARY_SIZE):
+    """
+    Build a zlib preset dictionary out of the byte strings that show up in
+    most sample responses (keys, tags, namespaces, URLs). The most common
+    ones go last, where zlib finds them with the shortest distance.
+    """
+    document_counts = collections.Counter()
+    for sample in samples:
+        document_counts.update(set(split_tokens(sample)))
+
+    threshold = max(2, len(samples) // 2)
+    common = [
+        token
+        for token, count in document_counts.most_common()
+        if count >= threshold
+    ]
+
+    dictionary = b""
+    for token in common:
+        if len(dictionary) + len(token) > size:
+            break
+        dictionary = token + dictionary
+    return dictionary
+
+
+def compress(content: bytes, dictionary: bytes = None):
+    if dictionary:
+        compressor = zlib.compressobj(COMPRESSION_LEVEL, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(COMPRESSION_LEVEL)
+    return compressor.compress(content) + compressor.flush()
+
+
+def decompress(blob: bytes, dictionary: bytes = None):
+    if dictionary:
+        decompressor = zlib.decompressobj(zdict=dictionary)
+    else:
+        decompressor = zlib.decompressobj()
+    return decompressor.decompress(blob) + decompressor.flush()
+
+
+class ResponseArchive:
+    """
+    Sampled, append-only archive of raw responses.
+
+    Every marketplace gets a folder holding daily segment files of zlib
+    compressed responses, the shared preset dictionaries they were
+    compressed with and index.jsonl, one line per response with the search,
+    timestamp and position of the response in its segment.
+
+    record() only samples and queues the response, a writer thread
+    compresses and writes it and trains the dictionaries, so polls never
+    wait on the archive. Once `queue_size` responses are waiting, new
+    ones are dropped (counted in `dropped`). close() writes what is queued.
+    """
+
+    def __init__(
+        self,
+        folder: str = ARCHIVE_FOLDER,
+        sample_rate: float = DEFAULT_SAMPLE_RATE,
+        queue_size: int = QUEUE_SIZE,
+    ):
+        self.folder = folder
+        self.sample_rate = sample_rate
+        self.dictionaries = {}
+        self.untrained = collections.defaultdict(int)
+        self.lock = threading.Lock()
+        self.queue = queue.Queue(queue_size)
+        self.writer = None
+        self.writer_lock = threading.Lock()
+        self.dropped = 0
+
+    def marketplace_folder(self, marketplace):
+        folder = os.path.join(self.folder, marketplace)
+        os.makedirs(folder, exist_ok=True)
+        return folder
+
+    def current_dictionary(self, marketplace):
+        """(dictionary id, dictionary bytes), (None, None) before training"""
+        if marketplace not in self.dictionaries:
+            path = os.path.join(self.marketplace_folder(marketplace), "dict-current")
+            dictionary_id = None
+            if os.path.exists(path):
+                with open(path) as file:
+                    dictionary_id = file.read().strip() or None
+            self.dictionaries[marketplace] = (
+                dictionary_id,
+                load_dictionary(self.folder, marketplace, dictionary_id),
+            )
+        return self.dictionaries[marketplace]
+
+    def record(self, marketplace: str, search_key: str, search: dict, response, time_checked: float = None):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+
+        with self.writer_lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self.write_queued, daemon=True)
+                self.writer.start()
+        try:
+            self.queue.put_nowait(
+                (marketplace, search_key, search, response, time_checked or time.time())
+            )
+        except queue.Full:
+            self.dropped += 1
+
+    def write_queued(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                self.write(*item)
+            except Exception as e:
+                print(f"Could not archive a {item[0]} response: {e!r}")
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """Wait until every queued response is written"""
+        self.queue.join()
+
+    def close(self):
+        with self.writer_lock:
+            writer, self.writer = self.writer, None
+        if writer is not None:
+            self.queue.put(None)
+            writer.join()
+
+    def write(self, marketplace: str, search_key: str, search: dict, response, time_checked: float):
+        with self.lock:
+            dictionary_id, dictionary = self.current_dictionary(marketplace)
+            blob = compress(response.content, dictionary)
+
+            folder = self.marketplace_folder(marketplace)
+            segment = datetime.fromtimestamp(time_checked).strftime("%Y%m%d") + ".arc"
+            with open(os.path.join(folder, segment), "ab") as file:
+                offset = file.tell()
+                file.write(blob)
+
+            entry = {
+                "search_key": search_key,
+                "search": search,
+                "ts": time_checked,
+                "url": response.url,
+                "status": response.status,
+                "segment": segment,
+                "offset": offset,
+                "size": len(blob),
+                "raw_size": len(response.content),
+                "dict": dictionary_id,
+            }
+            with open(os.path.join(folder, "index.jsonl"), "a") as file:
+                file.write(json.dumps(entry) + "\n")
+
+            if dictionary_id is None:
+                self.untrained[marketplace] += 1
+                if self.untrained[marketplace] >= TRAIN_AFTER:
+                    self.train(marketplace)
+
+    def train(self, marketplace: str, samples: int = TRAIN_SAMPLES):
+        """Build a new dictionary from the latest archived responses"""
+        entries = read_index(self.folder, marketplace)[-samples:]
+        contents = [read_response(self.folder, marketplace, entry) for entry in entries]
+        dictionary = train_dictionary(contents)
+        if not dictionary:
+            return None
+
+        dictionary_id = f"{zlib.crc32(dictionary):08x}"
+        folder = self.marketplace_folder(marketplace)
+        with open(os.path.join(folder, f"dict-{dictionary_id}.bin"), "wb") as file:
+            file.write(dictionary)
+        with open(os.path.join(folder, "dict-current"), "w") as file:
+            file.write(dictionary_id)
+
+        self.dictionaries[marketplace] = (dictionary_id, dictionary)
+        self.untrained[marketplace] = 0
+        return dictionary_id
+
+
+def load_dictionary(folder, marketplace, dictionary_id):
+    if not dictionary_id:
+        return None
+    with open(os.path.join(folder, marketplace, f"dict-{dictionary_id}.bin"), "rb") as file:
+        return file.read()
+
+
+def read_index(folder, marketplace, search_key=None, since=None, until=None):
+    path = os.path.join(folder, marketplace, "index.jsonl")
+    if not os.path.exists(path):
+        return []
+
+    entries = []
+    with open(path) as file:
+        for line in file:
+            entry = json.loads(line)
+            if search_key is not None and entry["search_key"] != search_key:
+                continue
+            if since is not None and entry["ts"] < since:
+                continue
+            if until is not None and entry["ts"] >= until:
+                continue
+            entries.append(entry)
+    return entries
+
+
+def read_blob(folder, marketplace, entry):
+    with open(os.path.join(folder, marketplace, entry["segment"]), "rb") as file:
+        file.seek(entry["offset"])
+        return file.read(entry["size"])
+
+
+def read_response(folder, marketplace, entry):
+    dictionary = load_dictionary(folder, marketplace, entry["dict"])
+    return decompress(read_blob(folder, marketplace, entry), dictionary)
+
+
+def reparse_entry(marketplace, entry, blob, dictionary):
+    """Run in a worker: replay one archived response through its parser"""
+    from transport import Response
+
+    cls = load_marketplace(marketplace)
+
+    # Skip __init__, Kijiji's makes network calls, the parser only needs
+    # the search fields
+    scraper = cls.__new__(cls)
+    for attr, value in entry["search"].items():
+        setattr(scraper, attr, value)
+    scraper.time_checked = entry["ts"]
+
+    content = decompress(blob, dictionary)
+    response = Response(entry["status"], entry["url"], {}, content)
+    return scraper.parse_response(response).to_dataframe()
+
+
+def reparse(folder, marketplace, entries, workers=None):
+    """Replay archived responses through parse_response on every core"""
+    dictionaries = {}
+    jobs = []
+    for entry in entries:
+        if entry["dict"] not in dictionaries:
+            dictionaries[entry["dict"]] = load_dictionary(folder, marketplace, entry["dict"])
+        jobs.append(
+            (
+                marketplace,
+                entry,
+                read_blob(folder, marketplace, entry),
+                dictionaries[entry["dict"]],
+            )
+        )
+
+    if not jobs:
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunksize = max(1, len(jobs) // ((workers or os.cpu_count() or 1) * 4))
+        yield from pool.map(reparse_entry, *zip(*jobs), chunksize=chunksize)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Raw response archive tools")
+    parser.add_argument("command", choices=["reparse", "train", "stats"])
+    parser.add_argument(
+        "-m", "--marketplace", choices=marketplace_names(), required=True
+    )
+    parser.add_argument("-a", "--archive", help="Archive folder", default=ARCHIVE_FOLDER)
+    parser.add_argument("-k", "--search_key", help="Only this search", default=None)
+    parser.add_argument("-s", "--since", help="Unix timestamp lower bound", type=float, default=None)
+    parser.add_argument("-u", "--until", help="Unix timestamp upper bound", type=float, default=None)
+    parser.add_argument("-w", "--workers", help="Parse processes", type=int, default=None)
+    parser.add_argument("-o", "--output", help="csv file for re-parsed listings", default=None)
+    args = parser.parse_args()
+
+    if args.command == "train":
+        dictionary_id = ResponseArchive(args.archive).train(args.marketplace)
+        print(f"Trained dictionary {dictionary_id} for {args.marketplace}")
+
+    elif args.command == "stats":
+        entries = read_index(args.archive, args.marketplace, args.search_key, args.since, args.until)
+        raw = sum(entry["raw_size"] for entry in entries)
+        stored = sum(entry["size"] for entry in entries)
+        print(f"{len(entries)} responses, {raw / 1024:.0f} KB raw, {stored / 1024:.0f} KB stored")
+        if stored:
+            print(f"Compression ratio {raw / stored:.1f}")
+
+    else:
+        import pandas as pd
+
+        entries = read_index(args.archive, args.marketplace, args.search_key, args.since, args.until)
+        frames = list(reparse(args.archive, args.marketplace, entries, args.workers))
+        listings_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        print(f"Re-parsed {len(entries)} responses into {len(listings_df)} listings")
+        if args.output:
+            listings_df.to_csv(args.output, index=None)
@@ -1,67 +1,100 @@
-import pandas as pd
-from datetime import datetime
 import os
-import requests
 import argparse
 from craiglist_categories import CATEGORIES
-import json
-import math
+from listing_batch import ListingBatch
+from marketplace import Marketplace
+from geo import distance_list
+from watermark import Cutoff
 
 
 DATA_FOLDER = "./data/craiglist"
 LISTINGS_DB = f"{DATA_FOLDER}/LISING_DB.csv"
 
-API_URL = "https://sapi.craigslist.org/web/v8/postings/search/full"
+API_URL = os.environ.get(
+    "CRAIGLIST_API_URL", "https://sapi.craigslist.org/web/v8/postings/search/full"
+)
 HEADERS = {
     "Content-Type": "application/json",
     "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
 }
 
-os.makedirs(DATA_FOLDER, exist_ok=True)
-
-
-def get_item_attribute(id, item_list):
-    for rec in item_list:
-        if isinstance(rec, list) and len(rec) > 1 and rec[0] == id:
-            attribute = rec
-            break
-    else:
-        return [None]
-
-    return attribute[1:]
-
-
-def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float):
+ITEM_IMAGES = 4
+ITEM_HANDLE = 6
+ITEM_PRICE = 10
+ITEM_TAGS = (ITEM_IMAGES, ITEM_HANDLE, ITEM_PRICE)
+
+LOCATION_CACHE_SIZE = 256
+
+COLUMNS = [
+    "query",
+    "lat",
+    "long",
+    "listing_id",
+    "title",
+    "location",
+    "image_url",
+    "price",
+    "url",
+    "time_posted",
+    "time_found",
+    "source_url",
+    "distance",
+]
+
+# canonicalUrl -> (raw decode.locations, decoded location table)
+location_tables = {}
+
+
+def decode_item(item):
     """
-    Calculate the distance between two points
-
-    @param lat1: Latitude of point 1
-    @param lon1: Longitude of point 1
-    @param lat2: Latitude of point 2
-    @param lon2: Longitude of point 2
-    @return: Distance between the points
+    Tagged attributes of a sapi item in one pass, {tag: values} for the
+    tags in ITEM_TAGS. Items are [id, date, category, ?, location, ...,
+    [tag, *values], ..., title], the first record of a tag wins.
     """
-    earth_radius = 6371.0  # Radius of the earth in km
-
-    lat1_rad = math.radians(float(lat1))
-    lon1_rad = math.radians(float(lon1))
-    lat2_rad = math.radians(float(lat2))
-    lon2_rad = math.radians(float(lon2))
-
-    dlon = lon2_rad - lon1_rad
-    dlat = lat2_rad - lat1_rad
-
-    a = (
-        math.sin(dlat / 2) ** 2
-        + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
-    )
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    distance = earth_radius * c
+    attributes = {}
+    for rec in item:
+        if type(rec) is list and len(rec) > 1:
+            tag = rec[0]
+            if tag in ITEM_TAGS and tag not in attributes:
+                attributes[tag] = rec[1:]
+    return attributes
+
+
+def decode_locations(locations):
+    """decode.locations as a list of (subdomain, subregion)"""
+    table = []
+    for location in locations:
+        try:
+            subdomain = location[1] if len(location) > 1 else None
+            subregion = location[2] if len(location) > 2 else None
+            table.append((subdomain, subregion))
+        except TypeError:
+            table.append((None, None))
+    return table
+
+
+def location_table(source_url, locations):
+    """
+    decode_locations() cached per canonicalUrl. Polls of the same search
+    usually get the same locations back, a cached table is only reused
+    if the raw list still matches.
+    """
+    cached = location_tables.get(source_url)
+    if cached is not None and cached[0] == locations:
+        return cached[1]
 
-    return distance
+    table = decode_locations(locations)
+    if source_url not in location_tables and len(location_tables) >= LOCATION_CACHE_SIZE:
+        location_tables.pop(next(iter(location_tables)))
+    location_tables[source_url] = (locations, table)
+    return table
 
 
-class Craiglist:
+class Craiglist(Marketplace):
+    NAME = "craiglist"
+    DATA_FOLDER = DATA_FOLDER
+    LISTINGS_DB = LISTINGS_DB
+    WATERMARK_COLUMN = "time_posted"
 
     def __init__(
         self,
@@ -149,64 +182,25 @@ class Craiglist:
             "max_price": 30000.0,
         }
 
-    def new_listings_filename(self):
-
-        return f"{DATA_FOLDER}/NEW_LISTINGS_{self.time_checked}.csv"
-
-    def get_listings(self):
-        response = requests.get(
-            API_URL,
-            headers=HEADERS,
-            params=self.params,
-        )
-        self.time_checked = datetime.now().timestamp()
-
-        # print(response.json())
-
-        listings_df = self.parse_listing(response.json())
-        return listings_df
-
-    def check_new_listings(self):
-        latest_listings_df = self.get_listings()
-
-        if os.path.exists(LISTINGS_DB):
-
-            old_listings_df = pd.read_csv(LISTINGS_DB)
-
-            latest_listings_df["long"] = latest_listings_df["long"].astype(float)
-            latest_listings_df["lat"] = latest_listings_df["lat"].astype(float)
-            latest_listings_df["listing_id"] = latest_listings_df["listing_id"].astype(
-                int
-            )
-
-            old_listings_df["long"] = old_listings_df["long"].astype(float)
-            old_listings_df["lat"] = old_listings_df["lat"].astype(float)
-            old_listings_df["listing_id"] = old_listings_df["listing_id"].astype(int)
-
-            merge_df = latest_listings_df.merge(
-                old_listings_df[["listing_id", "query", "long", "lat"]],
-                on=["listing_id", "query", "long", "lat"],
-                how="left",
-                indicator=True,
-            )
-            new_listings_df = merge_df[merge_df["_merge"] == "left_only"]
+    def build_request(self):
+        return {
+            "method": "GET",
+            "url": API_URL,
+            "headers": HEADERS,
+            "params": self.params,
+        }
 
-        else:
-            new_listings_df = latest_listings_df
+    def parse_response(self, response):
+        return self.parse_listing(self.decode_json(response))
 
-        ## Notify of new listings
-        print(
-            f"Found {len(new_listings_df)} new listings for {self.query} in lat {self.lat} and long {self.long}"
-        )
-        new_listings_df.to_csv(self.new_listings_filename(), index=None)
-
-        ## Add new listing df to the listing db so notification doesnt come up again
-        if "_merge" in new_listings_df.columns:
-            new_listings_df = new_listings_df.drop(columns=["_merge"])
-
-        new_listings_df.to_csv(
-            LISTINGS_DB, mode="a", index=None, header=not os.path.exists(LISTINGS_DB)
-        )
+    def listing_distances(self, listings):
+        lats = []
+        longs = []
+        for location in listings.column("location"):
+            lat, _, long = (location or "").partition(", ")
+            lats.append(lat)
+            longs.append(long)
+        return distance_list(self.lat, self.long, lats, longs)
 
     def parse_listing(self, resp):
 
@@ -215,55 +209,47 @@ class Craiglist:
         source_url = data.get("canonicalUrl", "").strip("/")
 
         decode = data.get("decode") or {}
-        locations = decode.get("locations")
-
-        formatted_locs = []
-        for location in locations:
-
-            try:
-
-                subdomain = location[1] if len(location) > 1 else None
-                subregion = location[2] if len(location) > 2 else None
-
-                formatted_locs.append(
-                    {
-                        "subdomain": subdomain,
-                        "subregion": subregion,
-                    }
-                )
-            except TypeError:
-                formatted_locs.append({})
+        locations = location_table(source_url, decode.get("locations") or [])
 
         min_post_id = decode.get("minPostingId")
         min_post_date = decode.get("minPostedDate")
 
-        listing_data = []
+        listings = ListingBatch(
+            COLUMNS,
+            constants={
+                "query": self.query,
+                "lat": self.lat,
+                "long": self.long,
+                "time_found": self.time_checked,
+                "source_url": source_url,
+            },
+        )
+        lats = []
+        longs = []
+        cutoff = Cutoff(self.watermark)
 
         items = data.get("items")
         for item in items:
 
             listing_id = item[0] + min_post_id
             time_posted = item[1] + min_post_date
+            if cutoff.passed(time_posted, listing_id):
+                break
             category = CATEGORIES.get(item[2])
 
-            location = item[4]
-
-            index, lat, long = location.split("~")
-            index = index.split(":")[0]
+            index, lat, long = item[4].split("~")
+            subdomain, subregion = locations[int(index.partition(":")[0])]
 
-            subregion = formatted_locs[int(index)].get("subregion")
-            subdomain = formatted_locs[int(index)].get("subdomain")
-
-            images = get_item_attribute(4, item)
+            attributes = decode_item(item)
 
             images = [
-                f"https://images.craigslist.org/{image.split(':')[-1 ]}_600x450.jpg"
-                for image in images
+                f"https://images.craigslist.org/{image.split(':')[-1]}_600x450.jpg"
+                for image in attributes.get(ITEM_IMAGES, ())
                 if isinstance(image, str)
             ]
 
-            price = get_item_attribute(10, item)[0]
-            handle = get_item_attribute(6, item)[0]
+            price = attributes.get(ITEM_PRICE, [None])[0]
+            handle = attributes.get(ITEM_HANDLE, [None])[0]
 
             title = item[-1]
 
@@ -272,26 +258,22 @@ class Craiglist:
             else:
                 url = f"https://{subdomain}.craigslist.org/{category}/d/{handle}/{listing_id}.html"
 
-            listing_data.append(
-                {
-                    "query": self.query,
-                    "lat": self.lat,
-                    "long": self.long,
-                    "listing_id": listing_id,
-                    "title": title,
-                    "location": f"{lat}, {long}",
-                    "image_url": images[0] if images else None,
-                    "price": price,
-                    "url": url,
-                    "time_posted": time_posted,
-                    "time_found": self.time_checked,
-                    "source_url": source_url,
-                    "distance": calculate_distance(self.lat, self.long, lat, long),
-                }
+            added = listings.append(
+                listing_id,
+                title,
+                f"{lat}, {long}",
+                images[0] if images else None,
+                price,
+                url,
+                time_posted,
+                None,
             )
-        listing_df = pd.DataFrame(listing_data)
-        listing_df.drop_duplicates(inplace=True)
-        return listing_df
+            if added:
+                lats.append(lat)
+                longs.append(long)
+
+        listings.set_column("distance", distance_list(self.lat, self.long, lats, longs))
+        return listings
 
 
 if __name__ == "__main__":
@@ -0,0 +1,528 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from archive import ResponseArchive, ARCHIVE_FOLDER
+from http_pool import configure_host
+from metrics import DEFAULT_METRICS_PORT, default_metrics
+from parse_pool import ParseExecutor, DEFAULT_BATCH_SIZE
+from registry import MARKETPLACES, load_marketplace
+from seen_store import CachedSeenStore, SQLiteSeenStore, SEEN_DB
+from segment_log import close_segment_logs
+from transport import AiohttpTransport, default_transport
+
+
+DEFAULT_INTERVAL = 300  # seconds
+DEFAULT_CONCURRENCY = 256
+DEFAULT_WORKERS = 8
+
+
+class SavedSearch:
+    """
+    A search the daemon polls. `params` are the keyword arguments of the
+    marketplace class, e.g.
+
+    {"marketplace": "offerup", "interval": 60, "params": {"query": "iphone", "lat": "40.7128", "long": "-74.0060"}}
+
+    With "tile": true a wide search is polled as tiles of smaller radius
+    where the marketplace allows it, see tiling.TiledScraper.
+    """
+
+    def __init__(
+        self,
+        marketplace: str,
+        params: dict,
+        interval: float = DEFAULT_INTERVAL,
+        tile: bool = False,
+    ):
+        if marketplace not in MARKETPLACES:
+            raise ValueError(f"Unknown marketplace {marketplace}")
+
+        self.marketplace = marketplace
+        self.params = params
+        self.interval = float(interval)
+        self.tile = tile
+        self.scraper = None
+
+    def __repr__(self):
+        return f"{self.marketplace}:{self.params.get('query')}"
+
+    def new_scraper(
+        self,
+        seen_store,
+        transport,
+        parse_executor=None,
+        archive=None,
+        metrics=None,
+        history=None,
+        notifier=None,
+    ):
+        scraper = load_marketplace(self.marketplace)(**self.params)
+        scraper.seen_store = seen_store
+        scraper.transport = transport
+        scraper.parse_executor = parse_executor
+        scraper.archive = archive
+        scraper.metrics = metrics
+        scraper.history = history
+        scraper.notifier = notifier
+        return scraper
+
+    def create_scraper(self, *args, **kwargs):
+        scraper = self.new_scraper(*args, **kwargs)
+        if self.tile:
+            from tiling import TiledScraper, can_tile
+
+            if can_tile(type(scraper)):
+                scraper = TiledScraper(scraper, self.params)
+            else:
+                print(f"{self.marketplace} searches can't be tiled, polling {self} as one request")
+        self.scraper = scraper
+        return scraper
+
+
+class SearchGroup(SavedSearch):
+    """
+    Saved searches polled with one upstream request made with `params`,
+    see planner.plan_searches(). Polled as often as its most frequent
+    search, and tiled if any of them is.
+    """
+
+    def __init__(self, searches, params: dict):
+        super().__init__(
+            searches[0].marketplace,
+            params,
+            min(search.interval for search in searches),
+            any(search.tile for search in searches),
+        )
+        self.searches = searches
+
+    def __repr__(self):
+        return f"{self.marketplace}:{self.params.get('query')} x{len(self.searches)}"
+
+    def create_scraper(self, *args, **kwargs):
+        from planner import CoalescedScraper
+
+        upstream = super().create_scraper(*args, **kwargs)
+        scrapers = []
+        for search in self.searches:
+            search.scraper = search.new_scraper(*args, **kwargs)
+            scrapers.append(search.scraper)
+        self.scraper = CoalescedScraper(upstream, scrapers)
+        return self.scraper
+
+
+def coalesce_searches(searches, max_growth: float = None):
+    """Saved searches and groups of them that share one request"""
+    from planner import MAX_GROWTH, plan_searches
+
+    return [
+        members[0] if params is None else SearchGroup(members, params)
+        for members, params in plan_searches(searches, max_growth or MAX_GROWTH)
+    ]
+
+
+def load_searches(path):
+    with open(path) as file:
+        searches = json.load(file)
+
+    return [
+        SavedSearch(
+            search["marketplace"],
+            search.get("params", {}),
+            search.get("interval", DEFAULT_INTERVAL),
+            search.get("tile", False),
+        )
+        for search in searches
+    ]
+
+
+class SearchDaemon:
+    """
+    Runs many saved searches in one process. Every search keeps its scraper
+    between polls, all of them share one async transport (and so its
+    connection pool) and one seen-listing store with an in-memory cache in
+    front of it. Requests are awaited on the event loop, only the blocking
+    store and file writes go to a small thread pool.
+
+    Poll stages, fetch timings and counts go to `metrics`. If summary_path
+    is set a JSON summary of them is written there when the daemon stops.
+    New listings also go to the Parquet `history` and the sinks of
+    `notifier` if they are given. With a `scheduler` (AdaptiveScheduler)
+    every search is polled at the interval it picks from the search's
+    new-listing rate instead of its fixed one, starting from the rates in
+    the history if there is one. With a `limiter` (RateLimiter) the
+    requests to every host are paced and limited to what it keeps up with.
+    """
+
+    def __init__(
+        self,
+        searches,
+        seen_store=None,
+        transport=None,
+        parse_executor=None,
+        archive=None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        workers: int = DEFAULT_WORKERS,
+        metrics=None,
+        summary_path: str = None,
+        history=None,
+        notifier=None,
+        scheduler=None,
+        limiter=None,
+    ):
+        self.searches = searches
+        self.seen_store = seen_store or CachedSeenStore(SQLiteSeenStore(SEEN_DB))
+        self.transport = transport or AiohttpTransport()
+        self.parse_executor = parse_executor
+        self.archive = archive
+        self.concurrency = concurrency
+        self.metrics = metrics or default_metrics()
+        self.transport.metrics = self.metrics
+        self.limiter = limiter
+        if limiter is not None:
+            limiter.metrics = self.metrics
+            self.transport.limiter = limiter
+            # Lookups outside the search requests, like Kijiji's locations,
+            # go through the default transport
+            default_transport().limiter = limiter
+        self.summary_path = summary_path
+        self.history = history
+        self.notifier = notifier
+        self.scheduler = scheduler
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.semaphore = None
+        self.polls = 0
+        self.errors = 0
+
+    async def run_blocking(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def setup_search(self, search):
+        try:
+            await self.run_blocking(
+                search.create_scraper,
+                self.seen_store,
+                self.transport,
+                self.parse_executor,
+                self.archive,
+                self.metrics,
+                self.history,
+                self.notifier,
+            )
+        except Exception as e:
+            self.errors += 1
+            print(f"Could not set up {search}: {e!r}")
+
+    async def poll(self, search):
+        scraper = search.scraper
+        try:
+            async with self.semaphore:
+                listings = await scraper.aget_listings()
+            new_listings = await self.run_blocking(scraper.process_listings, listings)
+            if self.scheduler is not None:
+                self.scheduler.observe(search, new_listings, time.time())
+        except Exception as e:
+            self.errors += 1
+            self.metrics.inc("poll_errors_total", marketplace=search.marketplace)
+            print(f"Poll failed for {search}: {e!r}")
+        self.polls += 1
+
+    async def run_search(self, search):
+        # Spread the first polls over the interval so searches sharing an
+        # interval don't all fire at once
+        await asyncio.sleep(random.uniform(0, search.interval))
+
+        next_poll = time.monotonic()
+        while True:
+            await self.poll(search)
+
+            if self.scheduler is not None:
+                next_poll += self.scheduler.next_interval(search)
+            else:
+                next_poll += search.interval
+            now = time.monotonic()
+            if next_poll < now:
+                # Poll took longer than the interval, skip the missed slots
+                next_poll = now
+            await asyncio.sleep(next_poll - now)
+
+    async def resolve_searches(self):
+        """Let each marketplace resolve the lookups of all its searches at once"""
+        by_marketplace = {}
+        for search in self.searches:
+            # A group's searches are set up too, besides its request
+            params = [search.params] + [member.params for member in getattr(search, "searches", ())]
+            by_marketplace.setdefault(search.marketplace, []).extend(params)
+
+        for marketplace, searches in by_marketplace.items():
+            try:
+                await self.run_blocking(
+                    load_marketplace(marketplace).resolve_searches, searches
+                )
+            except Exception as e:
+                print(f"Could not resolve {marketplace} searches: {e!r}")
+
+    async def run(self):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        if self.notifier is not None:
+            await self.notifier.start()
+
+        await self.resolve_searches()
+        await asyncio.gather(*(self.setup_search(search) for search in self.searches))
+        ready = [search for search in self.searches if search.scraper is not None]
+        print(f"Polling {len(ready)} of {len(self.searches)} searches")
+        if self.scheduler is not None and self.history is not None:
+            try:
+                seeded = await self.run_blocking(self.scheduler.seed, ready, self.history.folder)
+                print(f"Started the poll rates of {seeded} searches from the listing history")
+            except Exception as e:
+                print(f"Could not read the listing history: {e!r}")
+
+        try:
+            await asyncio.gather(*(self.run_search(search) for search in ready))
+        finally:
+            if self.notifier is not None:
+                await self.notifier.close()
+            if self.archive is not None:
+                await self.run_blocking(self.archive.close)
+            await self.transport.aclose()
+            if self.limiter is not None:
+                for limits in self.limiter.describe():
+                    print(f"Last limits of {limits}")
+            if self.parse_executor is not None:
+                self.parse_executor.close()
+            self.executor.shutdown(wait=False)
+            self.seen_store.close()
+            close_segment_logs()
+            if self.history is not None:
+                self.history.close()
+            if self.summary_path:
+                self.metrics.write_summary(self.summary_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-s", "--searches", help="JSON file of saved searches", type=str, required=True
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        help="Maximum number of requests in flight",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="Threads for store and file writes",
+        type=int,
+        default=DEFAULT_WORKERS,
+    )
+    parser.add_argument("-db", "--db", help="Seen listings database", default=SEEN_DB)
+    parser.add_argument(
+        "-p",
+        "--pool_config",
+        help="JSON file of per-host connection pool settings",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "-pw",
+        "--parse_workers",
+        help="Processes for parsing CPU heavy responses, 0 parses in the daemon",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "-pb",
+        "--parse_batch",
+        help="Responses sent to a parse process at once",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+    )
+    parser.add_argument(
+        "-a", "--archive_dir", help="Raw response archive folder", default=ARCHIVE_FOLDER
+    )
+    parser.add_argument(
+        "-as",
+        "--archive_sample",
+        help="Share of responses archived, 0 disables the archive",
+        type=float,
+        default=0,
+    )
+    parser.add_argument(
+        "-mp",
+        "--metrics_port",
+        help=f"Port of the local /metrics endpoint, e.g. {DEFAULT_METRICS_PORT}, 0 disables it",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "-ms",
+        "--metrics_summary",
+        help="JSON file the metrics summary of the run is written to",
+        default=None,
+    )
+    parser.add_argument(
+        "-hd",
+        "--history_dir",
+        help="Also keep the listing history as Parquet here, e.g. ./data/history",
+        default=None,
+    )
+    parser.add_argument(
+        "-co",
+        "--coalesce",
+        help="Poll searches of the same query with one request where the marketplace allows it",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-cg",
+        "--coalesce_growth",
+        help="Largest covering radius of coalesced searches over their largest radius",
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "-t",
+        "--tile",
+        help="Poll every search as tiles sized by listing density where the marketplace allows it",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-ad",
+        "--adaptive",
+        help="Poll every search as often as new listings show up for it, within the interval bounds",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-mi",
+        "--min_interval",
+        help="Shortest adaptive poll interval in seconds",
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "-xi",
+        "--max_interval",
+        help="Longest adaptive poll interval in seconds",
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "-bi",
+        "--base_interval",
+        help="Adaptive poll interval of a search that gets one new listing an hour, busier ones are polled more often",
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "-tp",
+        "--time_profile",
+        help="Keep the adaptive poll rates per hour of the day",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-nrl",
+        "--no_rate_limit",
+        dest="rate_limit",
+        help="Don't pace the requests to every host or back off when it pushes back",
+        action="store_false",
+    )
+    parser.add_argument(
+        "-rc",
+        "--rate_limit_config",
+        help="JSON file of per-host rate limit settings",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "-n",
+        "--notify",
+        help="JSON file of notification sinks (webhook, smtp, file, unix_socket)",
+        default=None,
+    )
+    args = parser.parse_args()
+
+    history = None
+    if args.history_dir:
+        # pyarrow is only loaded when the history is kept
+        from history import ListingHistory
+
+        history = ListingHistory(args.history_dir)
+
+    metrics = default_metrics()
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+
+    if args.pool_config:
+        with open(args.pool_config) as file:
+            for host, options in json.load(file).items():
+                configure_host(host, **options)
+
+    searches = load_searches(args.searches)
+    if args.coalesce:
+        searches = coalesce_searches(searches, args.coalesce_growth)
+    if args.tile:
+        for search in searches:
+            search.tile = True
+
+    scheduler = None
+    if args.adaptive:
+        from scheduler import (
+            AdaptiveScheduler,
+            BASE_INTERVAL,
+            DEFAULT_MAX_INTERVAL,
+            DEFAULT_MIN_INTERVAL,
+        )
+
+        scheduler = AdaptiveScheduler(
+            args.min_interval or DEFAULT_MIN_INTERVAL,
+            args.max_interval or DEFAULT_MAX_INTERVAL,
+            args.base_interval or BASE_INTERVAL,
+            profile=args.time_profile,
+            metrics=metrics,
+        )
+
+    limiter = None
+    if args.rate_limit:
+        from rate_limit import RateLimiter
+
+        host_limits = None
+        if args.rate_limit_config:
+            with open(args.rate_limit_config) as file:
+                host_limits = json.load(file)
+        limiter = RateLimiter(host_limits, metrics=metrics)
+
+    notifier = None
+    if args.notify:
+        from notify import Notifier, load_sinks
+
+        notifier = Notifier(load_sinks(args.notify), metrics)
+
+    daemon = SearchDaemon(
+        searches,
+        seen_store=CachedSeenStore(SQLiteSeenStore(args.db)),
+        parse_executor=ParseExecutor(args.parse_workers, args.parse_batch)
+        if args.parse_workers
+        else None,
+        archive=ResponseArchive(args.archive_dir, args.archive_sample)
+        if args.archive_sample
+        else None,
+        concurrency=args.concurrency,
+        workers=args.workers,
+        metrics=metrics,
+        summary_path=args.metrics_summary,
+        history=history,
+        notifier=notifier,
+        scheduler=scheduler,
+        limiter=limiter,
+    )
+    try:
+        asyncio.run(daemon.run())
+    except KeyboardInterrupt:
+        pass
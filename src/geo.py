@@ -0,0 +1,101 @@
+import math
+
+import numpy as np
+
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float):
+    """
+    Calculate the distance between two points
+
+    @param lat1: Latitude of point 1
+    @param lon1: Longitude of point 1
+    @param lat2: Latitude of point 2
+    @param lon2: Longitude of point 2
+    @return: Distance between the points in km
+    """
+    lat1_rad = math.radians(float(lat1))
+    lon1_rad = math.radians(float(lon1))
+    lat2_rad = math.radians(float(lat2))
+    lon2_rad = math.radians(float(lon2))
+
+    dlon = lon2_rad - lon1_rad
+    dlat = lat2_rad - lat1_rad
+
+    a = (
+        math.sin(dlat / 2) ** 2
+        + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
+    )
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+
+def to_float_array(values):
+    """Coordinates as a float array, None and empty strings become NaN"""
+    if isinstance(values, np.ndarray) and values.dtype.kind == "f":
+        return values
+    try:
+        return np.asarray(values, dtype=float)
+    except (TypeError, ValueError):
+        return np.array(
+            [np.nan if value is None or value == "" else float(value) for value in values],
+            dtype=float,
+        )
+
+
+def calculate_distances(lat: float, lon: float, lats, lons):
+    """
+    Distances in km from one point to a whole batch of points in one call.
+
+    @param lat: Latitude of the search location
+    @param lon: Longitude of the search location
+    @param lats: Latitudes of the listings
+    @param lons: Longitudes of the listings
+    @return: numpy array of distances, NaN where a listing has no location
+    """
+    lat1 = math.radians(float(lat))
+    lon1 = math.radians(float(lon))
+    lat2 = np.radians(to_float_array(lats))
+    lon2 = np.radians(to_float_array(lons))
+
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def distance_list(lat: float, lon: float, lats, lons):
+    """calculate_distances() as a list, with None for listings without a location"""
+    if not len(lats):
+        return []
+    distances = calculate_distances(lat, lon, lats, lons)
+    return [None if math.isnan(distance) else distance for distance in distances.tolist()]
+
+
+def destination_point(lat: float, lon: float, bearing: float, distance: float):
+    """
+    Point `distance` km from a point in the direction of `bearing`
+
+    @param lat: Latitude of the start point
+    @param lon: Longitude of the start point
+    @param bearing: Degrees clockwise from north
+    @param distance: Distance in km
+    @return: (latitude, longitude) of the destination
+    """
+    lat1 = math.radians(float(lat))
+    lon1 = math.radians(float(lon))
+    theta = math.radians(bearing)
+    delta = distance / EARTH_RADIUS_KM
+
+    lat2 = math.asin(
+        math.sin(lat1) * math.cos(delta)
+        + math.cos(lat1) * math.sin(delta) * math.cos(theta)
+    )
+    lon2 = lon1 + math.atan2(
+        math.sin(theta) * math.sin(delta) * math.cos(lat1),
+        math.cos(delta) - math.sin(lat1) * math.sin(lat2),
+    )
+    return math.degrees(lat2), (math.degrees(lon2) + 540) % 360 - 180
@@ -1,21 +1,20 @@
-import pandas as pd
-from datetime import datetime, date, timedelta
+from datetime import date, timedelta
 import os
-import requests
 import argparse
 import json
-import math
 import xml.etree.ElementTree as ET
-import xml.dom.minidom
+from listing_batch import ListingBatch
+from marketplace import Marketplace
+from geo import distance_list
+from watermark import Cutoff
 
 
 DATA_FOLDER = "./data/GumTreeUK"
 LISTINGS_DB = f"{DATA_FOLDER}/LISING_DB.csv"
 
-API_URL = "https://iphone-api.gumtree.com/capi/api/ads"
-
-os.makedirs(DATA_FOLDER, exist_ok=True)
-
+API_URL = os.environ.get(
+    "GUMTREE_UK_API_URL", "https://iphone-api.gumtree.com/capi/api/ads"
+)
 
 HEADERS = {
     "Accept": "*/*",
@@ -54,6 +53,27 @@ YEAR_DICT = {
 }
 
 
+COLUMNS = [
+    "query",
+    "lat",
+    "long",
+    "listing_id",
+    "title",
+    "location",
+    "location_name",
+    "image_url",
+    "price",
+    "url",
+    "time_posted",
+    "time_found",
+    "mileage",
+    "year",
+    "distance",
+    "account_id",
+    "user",
+]
+
+
 RADIUS_DICT = {
     0: "zero",
     0.25: "quarter",
@@ -117,53 +137,221 @@ def get_closest_integer(integer_list, value, larger=True):
     return closest
 
 
-def pretty_print_and_save_xml(element, file_name):
-    # Convert the ElementTree object to a string
-    rough_string = ET.tostring(element)
-
-    # Use minidom to format the string
-    reparsed = xml.dom.minidom.parseString(rough_string)
-    pretty_xml = reparsed.toprettyxml(indent="  ")
-
-    # Save the pretty XML to a file
-    with open(file_name, "w") as file:
-        file.write(pretty_xml)
-
+NAMESPACES = {
+    "ad": "http://www.ebayclassifiedsgroup.com/schema/ad/v1",
+    "types": "http://www.ebayclassifiedsgroup.com/schema/types/v1",
+    "location": "http://www.ebayclassifiedsgroup.com/schema/location/v1",
+    "attribute": "http://www.ebayclassifiedsgroup.com/schema/attribute/v1",
+    "picture": "http://www.ebayclassifiedsgroup.com/schema/picture/v1",
+}
 
-def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float):
+FEED_CHUNK_SIZE = 64 * 1024
+
+
+class AdTags:
+    """Qualified tag names of the fields we read, for the document's namespaces"""
+
+    def __init__(self, namespaces: dict):
+        ad = namespaces["ad"]
+        types = namespaces["types"]
+        location = namespaces["location"]
+        attribute = namespaces["attribute"]
+        picture = namespaces["picture"]
+
+        self.ad = f"{{{ad}}}ad"
+        self.title = f"{{{ad}}}title"
+        self.price = f"{{{ad}}}price"
+        self.start_date_time = f"{{{ad}}}start-date-time"
+        self.user_id = f"{{{ad}}}user-id"
+        self.account_id = f"{{{ad}}}account-id"
+        self.link = f"{{{ad}}}link"
+        self.amount = f"{{{types}}}amount"
+        self.currency = f"{{{types}}}currency-iso-code"
+        self.value = f"{{{types}}}value"
+        self.locations = f"{{{location}}}locations"
+        self.localized_name = f"{{{location}}}localized-name"
+        self.area = f"{{{location}}}area"
+        self.lat = f"{{{location}}}lat"
+        self.lng = f"{{{location}}}lng"
+        self.pictures = f"{{{picture}}}pictures"
+        self.picture_link = f"{{{picture}}}link"
+        self.attributes = f"{{{attribute}}}attributes"
+        self.attribute = f"{{{attribute}}}attribute"
+        self.attribute_value = f"{{{attribute}}}value"
+
+
+def detect_namespaces(declared_uris):
     """
-    Calculate the distance between two points
-
-    @param lat1: Latitude of point 1
-    @param lon1: Longitude of point 1
-    @param lat2: Latitude of point 2
-    @param lon2: Longitude of point 2
-    @return: Distance between the points
+    Map the schema roles to the namespace URIs declared in the document. The
+    prefixes differ between car and normal searches (picture is ns3 or ns4)
+    so only the URI is used.
     """
-    earth_radius = 6371.0  # Radius of the earth in km
-
-    lat1_rad = math.radians(float(lat1))
-    lon1_rad = math.radians(float(lon1))
-    lat2_rad = math.radians(float(lat2))
-    lon2_rad = math.radians(float(lon2))
+    namespaces = dict(NAMESPACES)
+    for uri in declared_uris:
+        for role in NAMESPACES:
+            if uri.rstrip("/").endswith(f"/{role}/v1"):
+                namespaces[role] = uri
+    return namespaces
 
-    dlon = lon2_rad - lon1_rad
-    dlat = lat2_rad - lat1_rad
 
-    a = (
-        math.sin(dlat / 2) ** 2
-        + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
-    )
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    distance = earth_radius * c
-
-    return distance
+def ad_record(ad, tags: AdTags):
+    """
+    All fields of one ad in a single pass over its children. Returns the
+    record and the ad coordinates, the distance is filled in for the whole
+    page at once by extract_ads().
+    """
+    title = price = currency_code = start_date_time = None
+    user_id = account_id = image = url = None
+    localized_name = lat = long = None
+    mileage = year = None
+
+    for child in ad:
+        tag = child.tag
+        if tag == tags.title:
+            title = child.text
+        elif tag == tags.price:
+            for part in child:
+                if part.tag == tags.amount:
+                    price = part.text
+                elif part.tag == tags.currency:
+                    value = part.find(tags.value)
+                    currency_code = value.text if value is not None else None
+        elif tag == tags.start_date_time:
+            start_date_time = child.text
+        elif tag == tags.user_id:
+            user_id = child.text
+        elif tag == tags.account_id:
+            account_id = child.text
+        elif tag == tags.link:
+            if child.get("rel") == "self-public-website":
+                url = child.get("href")
+        elif tag == tags.locations:
+            for location in child:
+                if lat is not None:
+                    break
+                for part in location:
+                    if part.tag == tags.localized_name:
+                        localized_name = part.text
+                    elif part.tag == tags.area:
+                        for coordinate in part:
+                            if coordinate.tag == tags.lat:
+                                lat = coordinate.text
+                            elif coordinate.tag == tags.lng:
+                                long = coordinate.text
+        elif tag == tags.pictures and image is None:
+            for picture in child:
+                for link in picture:
+                    if link.tag == tags.picture_link and link.get("rel") == "extrabig":
+                        image = link.get("href")
+                        break
+                if image is not None:
+                    break
+        elif tag == tags.attributes:
+            for attribute in child.iter(tags.attribute):
+                name = attribute.get("name")
+                if name not in ("vehicle_mileage", "vehicle_registration_year"):
+                    continue
+                value = next(attribute.iter(tags.attribute_value), None)
+                value = value.text if value is not None else None
+                if name == "vehicle_mileage" and mileage is None:
+                    mileage = value
+                elif name == "vehicle_registration_year" and year is None:
+                    year = value
+
+    record = {
+        "listing_id": ad.get("id"),
+        "title": title,
+        "location": f"{lat}, {long}" if lat and long else None,
+        "location_name": localized_name,
+        "image_url": image,
+        "price": f"{price} {currency_code}",
+        "url": url,
+        "time_posted": start_date_time,
+        "mileage": mileage,
+        "year": year,
+        "distance": None,
+        "account_id": account_id,
+        "user": user_id,
+    }
+    return record, lat, long
+
+
+def iter_ads(resp_text):
+    """
+    Stream (record, lat, long) out of an ads response. Every ad is read once
+    when its closing tag is parsed and then dropped from the tree, so memory
+    stays flat however many ads the page holds.
+    """
+    if isinstance(resp_text, str):
+        resp_text = resp_text.encode()
+
+    parser = ET.XMLPullParser(events=("start-ns", "start", "end"))
+    declared_uris = []
+    tags = None
+    root = None
+    depth = 0
+
+    for start in range(0, len(resp_text), FEED_CHUNK_SIZE):
+        parser.feed(resp_text[start : start + FEED_CHUNK_SIZE])
+        for event, item in parser.read_events():
+            if event == "start-ns":
+                declared_uris.append(item[1])
+            elif event == "start":
+                depth += 1
+                if root is None:
+                    root = item
+                    tags = AdTags(detect_namespaces(declared_uris))
+            else:
+                depth -= 1
+                if depth == 1 and item.tag == tags.ad:
+                    yield ad_record(item, tags)
+                    item.clear()
+                    root.remove(item)
+    parser.close()
+
+
+def extract_ads(resp_text, search_lat=None, search_long=None, watermark=None):
+    """
+    Listing records of an ads response, without the search fields
+
+    @param resp_text: Raw XML response
+    @param search_lat: Latitude of the search location, for the distance
+    @param search_long: Longitude of the search location, for the distance
+    @param watermark: Watermark of the search, the rest of the response is
+        not parsed once the ads fall behind it
+    @return: List of listing records
+    """
+    records = []
+    lats = []
+    longs = []
+    cutoff = Cutoff(watermark)
+    for record, lat, long in iter_ads(resp_text):
+        if cutoff.passed(record["time_posted"], record["listing_id"]):
+            break
+        records.append(record)
+        lats.append(lat)
+        longs.append(long)
+
+    if search_lat is not None and search_long is not None:
+        for record, distance in zip(
+            records, distance_list(search_lat, search_long, lats, longs)
+        ):
+            record["distance"] = distance
+    return records
 
 
 # write a function, that takes in a number and get the year than number ago
 
 
-class GumTreeUK:
+class GumTreeUK(Marketplace):
+    NAME = "gumtree_uk"
+    DATA_FOLDER = DATA_FOLDER
+    LISTINGS_DB = LISTINGS_DB
+    WATERMARK_COLUMN = "time_posted"
+    RADIUS_PARAM = "radius"
+    RADIUS_KM = 1.609344  # the radius is in miles
+    PAGE_SIZE_PARAM = "size"
+
     def __init__(
         self,
         query: str,
@@ -177,6 +365,7 @@ class GumTreeUK:
         max_year: str = None,
         radius: int = 500,
         car_search: bool = False,
+        size: int = 10,
     ):
         self.query = query
         self.lat = lat
@@ -187,16 +376,18 @@ class GumTreeUK:
         self.max_mileage = max_mileage
         self.min_year = min_year
         self.max_year = max_year
+        self.car_search = car_search
 
         closest_radius = get_closest_integer(RADIUS_DICT.keys(), radius, larger=True)
         print(RADIUS_DICT[closest_radius])
+        self.radius = closest_radius  # the radius actually searched
 
         self.params = {
             "includeTopAds": "true",
             "nearby": "true",
             "distance": RADIUS_DICT[closest_radius],
             "q": self.query,
-            "size": "10",
+            "size": str(size),
             "ad-status": "ACTIVE",
             "sortType": "DATE_DESCENDING",
             "page": "0",
@@ -237,188 +428,49 @@ class GumTreeUK:
                 ]
         print(self.params)
 
-    def new_listings_filename(self):
-        return f"{DATA_FOLDER}/NEW_LISTINGS_{self.time_checked}.csv"
-
-    def get_listings(self):
-        response = requests.get(
-            API_URL,
-            headers=HEADERS,
-            params=self.params,
-        )
-        self.time_checked = datetime.now().timestamp()
+    def build_request(self):
+        return {
+            "method": "GET",
+            "url": API_URL,
+            "headers": HEADERS,
+            "params": self.params,
+        }
 
+    def parse_response(self, response):
         print(response.url)
 
-        # print(response.json())
-
-        listings_df = self.parse_listing(response.content)
-        return listings_df
-
-    def check_new_listings(self):
-        latest_listings_df = self.get_listings()
-        # return
-
-        if os.path.exists(LISTINGS_DB):
-            old_listings_df = pd.read_csv(LISTINGS_DB)
-
-            latest_listings_df["long"] = latest_listings_df["long"].astype(float)
-            latest_listings_df["lat"] = latest_listings_df["lat"].astype(float)
-            latest_listings_df["listing_id"] = latest_listings_df["listing_id"].astype(
-                int
-            )
-
-            old_listings_df["long"] = old_listings_df["long"].astype(float)
-            old_listings_df["lat"] = old_listings_df["lat"].astype(float)
-            old_listings_df["listing_id"] = old_listings_df["listing_id"].astype(int)
-
-            merge_df = latest_listings_df.merge(
-                old_listings_df[["listing_id", "query", "long", "lat"]],
-                on=["listing_id", "query", "long", "lat"],
-                how="left",
-                indicator=True,
-            )
-            new_listings_df = merge_df[merge_df["_merge"] == "left_only"]
-
-        else:
-            new_listings_df = latest_listings_df
-
-        ## Notify of new listings
-        print(
-            f"Found {len(new_listings_df)} new listings for {self.query} in lat {self.lat} and long {self.long}"
-        )
-        new_listings_df.to_csv(self.new_listings_filename(), index=None)
-
-        ## Add new listing df to the listing db so notification doesnt come up again
-        if "_merge" in new_listings_df.columns:
-            new_listings_df = new_listings_df.drop(columns=["_merge"])
-
-        new_listings_df.to_csv(
-            LISTINGS_DB, mode="a", index=None, header=not os.path.exists(LISTINGS_DB)
-        )
+        return self.parse_listing(response.content)
+
+    def listing_distances(self, listings):
+        lats = []
+        longs = []
+        for location in listings.column("location"):
+            lat, _, long = (location or "").partition(", ")
+            lats.append(lat)
+            longs.append(long)
+        return distance_list(self.lat, self.long, lats, longs)
+
+    def parse_task(self):
+        return extract_ads, {
+            "search_lat": self.lat,
+            "search_long": self.long,
+            "watermark": self.watermark,
+        }
 
     def parse_listing(self, resp_text):
-        root = ET.fromstring(resp_text)
-        if car_search:
-            ns = {
-                "ns0": "http://www.ebayclassifiedsgroup.com/schema/ad/v1",
-                "ns1": "http://www.ebayclassifiedsgroup.com/schema/types/v1",
-                "ns2": "http://www.ebayclassifiedsgroup.com/schema/location/v1",
-                "ns3": "http://www.ebayclassifiedsgroup.com/schema/attribute/v1",
-                "ns4": "http://www.ebayclassifiedsgroup.com/schema/picture/v1",
-            }
-        else:
-            ns = {
-                "ns0": "http://www.ebayclassifiedsgroup.com/schema/ad/v1",
-                "ns1": "http://www.ebayclassifiedsgroup.com/schema/types/v1",
-                "ns2": "http://www.ebayclassifiedsgroup.com/schema/location/v1",
-                "ns3": "http://www.ebayclassifiedsgroup.com/schema/picture/v1",
-            }
-
-        print(ns)
-        pretty_print_and_save_xml(root, "check.xml")
-        listing_data = []
-
-        ads = root.findall("ns0:ad", ns)
-
-        for ad in ads:
-            listing_id = ad.get("id")
-            title = ad.find("ns0:title", ns).text
-            price = ad.find("ns0:price/ns1:amount", ns).text
-            currency_code = ad.find(
-                "ns0:price/ns1:currency-iso-code/ns1:value", ns
-            ).text
-            start_date_time = ad.find("ns0:start-date-time", ns).text
-            user_id = (
-                ad.find("ns0:user-id", ns).text if ad.find("ns0:user-id", ns) else None
-            )
-            account_id = ad.find("ns0:account-id", ns).text
-            image_xpath = "ns3:pictures/ns3:picture/ns3:link[@rel='extrabig']"
-            print(image_xpath)
-            image_xpath = (
-                image_xpath.replace("ns3", "ns4") if car_search else image_xpath
-            )
-            image = (
-                ad.find(image_xpath, ns).get(
-                    "href",
-                )
-                # if ad.find(image_xpath, ns) is not None
-                # else None
-            )
-            print(image)
-
-            url = (
-                ad.find("ns0:link[@rel='self-public-website']", ns).get("href")
-                # if ad.find("ns0:link[@rel='self-public-website']", ns) is not None
-                # else None
-            )
-            print(url)
-
-            locations = ad.find("ns2:locations", ns)
-            localized_name = None
-            lat = None
-            long = None
-            for location in locations.findall("ns2:location", ns):
-                localized_name = location.find("ns2:localized-name", ns).text
-                area = location.find("ns2:area", ns)
-                if area is not None:
-                    lat = area.find("ns2:lat", ns).text
-                    long = area.find("ns2:lng", ns).text
-                    break
-
-            mileage = None
-            year = None
-
-            mileage = (
-                ad.find(
-                    "ns3:attributes//ns3:attribute[@name='vehicle_mileage']//ns3:value",
-                    ns,
-                ).text
-                if ad.find(
-                    "ns3:attributes//ns3:attribute[@name='vehicle_mileage']//ns3:value",
-                    ns,
-                )
-                is not None
-                else None
-            )
-            year = (
-                ad.find(
-                    'ns3:attributes//ns3:attribute[@name="vehicle_registration_year"]//ns3:value',
-                    ns,
-                ).text
-                if ad.find(
-                    'ns3:attributes//ns3:attribute[@name="vehicle_registration_year"]//ns3:value',
-                    ns,
-                )
-                is not None
-                else None
-            )
-            listing_data.append(
-                {
-                    "query": self.query,
-                    "lat": self.lat,
-                    "long": self.long,
-                    "listing_id": listing_id,
-                    "title": title,
-                    "location": f"{lat}, {long}" if lat and long else None,
-                    "location_name": localized_name,
-                    "image_url": image,
-                    "price": f"{price} {currency_code}",
-                    "url": url,
-                    "time_posted": start_date_time,
-                    "time_found": self.time_checked,
-                    "mileage": mileage,
-                    "year": year,
-                    "distance": calculate_distance(self.lat, self.long, lat, long)
-                    if lat and long
-                    else None,
-                    "account_id": account_id,
-                    "user": user_id,
-                }
-            )
-        listing_df = pd.DataFrame(listing_data)
-        listing_df.drop_duplicates(inplace=True)
-        return listing_df
+        func, options = self.parse_task()
+        return self.build_listings(func(resp_text, **options))
+
+    def build_listings(self, records):
+        return ListingBatch(
+            COLUMNS,
+            constants={
+                "query": self.query,
+                "lat": self.lat,
+                "long": self.long,
+                "time_found": self.time_checked,
+            },
+        ).extend_records(records)
 
 
 if __name__ == "__main__":
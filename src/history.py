@@ -0,0 +1,343 @@
+import argparse
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from listing_batch import missing, parse_price
+from seen_store import LEGACY_DBS, make_search_key, read_legacy_csv
+from watermark import posted_timestamp
+
+
+HISTORY_FOLDER = "./data/history"
+FLUSH_ROWS = 5000  # buffered listings of a marketplace written as one file
+FLUSH_SECONDS = 300  # oldest buffered listing is written after at most this
+COMPRESSION = "zstd"
+
+# Repeated on most rows of a partition, stored once per row group
+DICTIONARY_COLUMNS = {
+    "search_key",
+    "query",
+    "lat",
+    "long",
+    "city",
+    "state",
+    "postal_code",
+    "country",
+    "currency",
+    "location_name",
+    "listing_type",
+    "listing_type_name",
+    "condition_text",
+}
+TIME_COLUMNS = {"time_posted", "sorted_time", "time_found"}
+NUMERIC_COLUMNS = {"distance"}
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("marketplace", pa.string()), ("date", pa.string())]), flavor="hive"
+)
+
+
+def text(value):
+    return None if missing(value) else str(value)
+
+
+def number(value):
+    if missing(value):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def string_array(values, name):
+    array = pa.array(values, pa.string())
+    return array.dictionary_encode() if name in DICTIONARY_COLUMNS else array
+
+
+def listings_table(listings_df, search_key: str, search: dict, time_found: float):
+    """
+    Typed Arrow table of parsed listings: numeric price and currency out of
+    the price strings, UTC timestamps for the time columns, floats for the
+    numeric ones and strings for everything else. Listings without a
+    time_found column get `time_found`.
+    """
+    rows = len(listings_df)
+    columns = {"search_key": [search_key] * rows}
+    for name, value in search.items():
+        if name not in listings_df.columns:
+            columns[name] = [text(value)] * rows
+    if "time_found" not in listings_df.columns:
+        listings_df = listings_df.assign(time_found=time_found)
+
+    for name in listings_df.columns:
+        values = listings_df[name].tolist()
+        if name == "price":
+            prices = [parse_price(value) for value in values]
+            columns["price"] = pa.array([amount for amount, _ in prices], pa.float64())
+            columns["currency"] = [currency for _, currency in prices]
+        elif name in TIME_COLUMNS:
+            timestamps = (posted_timestamp(value) for value in values)
+            columns[name] = pa.array(
+                [None if ts is None else int(ts * 1000) for ts in timestamps],
+                pa.timestamp("ms", tz="UTC"),
+            )
+        elif name in NUMERIC_COLUMNS:
+            columns[name] = pa.array([number(value) for value in values], pa.float64())
+        else:
+            columns[name] = [text(value) for value in values]
+
+    return pa.table(
+        {
+            name: values if isinstance(values, pa.Array) else string_array(values, name)
+            for name, values in columns.items()
+        }
+    )
+
+
+def partition_date(timestamp: float):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
+
+
+class ListingHistory:
+    """
+    Columnar listing history, one Parquet dataset partitioned by marketplace
+    and UTC date of time_found:
+
+        <folder>/marketplace=kijiji/date=2024-06-20/part-<...>.parquet
+
+    Listings are buffered per marketplace and written FLUSH_ROWS at a time
+    (or once the oldest is FLUSH_SECONDS old, and on close) so polls don't
+    leave thousands of tiny files behind. Files are written under a
+    temporary name and renamed, readers never see a partial file.
+    """
+
+    def __init__(
+        self,
+        folder: str = HISTORY_FOLDER,
+        flush_rows: int = FLUSH_ROWS,
+        flush_seconds: float = FLUSH_SECONDS,
+    ):
+        self.folder = folder
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.buffers = {}  # marketplace -> [tables, rows, first buffered at]
+        self.lock = threading.Lock()
+
+    def record(
+        self, marketplace: str, search_key: str, search: dict, listings_df, time_found: float = None
+    ):
+        if listings_df.empty:
+            return
+
+        table = listings_table(listings_df, search_key, search, time_found or time.time())
+        with self.lock:
+            buffer = self.buffers.setdefault(marketplace, [[], 0, time.monotonic()])
+            buffer[0].append(table)
+            buffer[1] += table.num_rows
+            due = (
+                buffer[1] >= self.flush_rows
+                or time.monotonic() - buffer[2] >= self.flush_seconds
+            )
+            if due:
+                self.flush_marketplace(marketplace)
+
+    def flush(self):
+        with self.lock:
+            for marketplace in list(self.buffers):
+                self.flush_marketplace(marketplace)
+
+    def close(self):
+        self.flush()
+
+    def flush_marketplace(self, marketplace):
+        tables, rows, _ = self.buffers.pop(marketplace)
+        if not rows:
+            return
+        table = pa.concat_tables(tables, promote_options="default").unify_dictionaries()
+
+        dates = [
+            partition_date(ts.timestamp()) if ts is not None else "unknown"
+            for ts in table.column("time_found").to_pylist()
+        ]
+        for date in sorted(set(dates)):
+            mask = pa.array([d == date for d in dates])
+            self.write(marketplace, date, table.filter(mask))
+
+    def write(self, marketplace, date, table):
+        folder = os.path.join(self.folder, f"marketplace={marketplace}", f"date={date}")
+        os.makedirs(folder, exist_ok=True)
+        name = f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+        temporary = os.path.join(folder, f".{name}.tmp")
+        pq.write_table(
+            table,
+            temporary,
+            compression=COMPRESSION,
+            use_dictionary=[column for column in table.column_names if column in DICTIONARY_COLUMNS],
+        )
+        os.replace(temporary, os.path.join(folder, name))
+
+
+def partition_value(name):
+    return name.split("=", 1)[1] if "=" in name else None
+
+
+def history_files(folder=HISTORY_FOLDER, marketplaces=None, since=None, until=None):
+    """
+    Parquet files of the partitions that can hold listings of `marketplaces`
+    found between the `since` and `until` Unix timestamps. Other partition
+    folders are skipped without being listed.
+    """
+    first = partition_date(since) if since is not None else None
+    last = partition_date(until) if until is not None else None
+
+    files = []
+    if not os.path.isdir(folder):
+        return files
+    for marketplace_folder in sorted(os.listdir(folder)):
+        marketplace = partition_value(marketplace_folder)
+        if marketplace is None or (marketplaces and marketplace not in marketplaces):
+            continue
+        marketplace_path = os.path.join(folder, marketplace_folder)
+        for date_folder in sorted(os.listdir(marketplace_path)):
+            date = partition_value(date_folder)
+            if date is None or (date == "unknown" and (first or last)):
+                continue
+            if date != "unknown" and (first and date < first or last and date > last):
+                continue
+            date_path = os.path.join(marketplace_path, date_folder)
+            files += [
+                os.path.join(date_path, name)
+                for name in sorted(os.listdir(date_path))
+                if name.endswith(".parquet")
+            ]
+    return files
+
+
+def read_history(
+    folder=HISTORY_FOLDER,
+    columns=None,
+    marketplaces=None,
+    since=None,
+    until=None,
+    search_key=None,
+):
+    """
+    Listing history as a DataFrame. Only the partitions of `marketplaces`
+    and of the days between `since` and `until` (Unix timestamps, on
+    time_found) are opened, and only `columns` are read from them.
+    Row groups are skipped on their statistics where the filters allow it.
+    """
+    import pandas as pd
+
+    files = history_files(folder, marketplaces, since, until)
+    if not files:
+        return pd.DataFrame(columns=columns)
+
+    # Marketplaces have different columns, read them as one dataset
+    schema = pa.unify_schemas(
+        [pq.read_schema(path) for path in files] + [PARTITIONING.schema],
+        promote_options="permissive",
+    )
+    dataset = ds.dataset(
+        files,
+        schema=schema,
+        format="parquet",
+        partitioning=PARTITIONING,
+        partition_base_dir=folder,
+    )
+
+    expression = None
+    conditions = []
+    if since is not None:
+        conditions.append(ds.field("time_found") >= pa.scalar(int(since * 1000), pa.timestamp("ms", tz="UTC")))
+    if until is not None:
+        conditions.append(ds.field("time_found") <= pa.scalar(int(until * 1000), pa.timestamp("ms", tz="UTC")))
+    if search_key is not None:
+        conditions.append(ds.field("search_key") == search_key)
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def import_listings_db(history, listings_db, marketplaces):
+    """
+    Load a LISING_DB.csv of the CSV history into `history`. `marketplaces`
+    are (marketplace, key columns, search fields) of the scrapers that
+    wrote the file, seen_store.LEGACY_DBS has their key columns. Rows are
+    told apart with seen_store.read_legacy_csv(), an empty key column is
+    part of the key and rows without the key columns are skipped. Returns
+    the rows imported per marketplace.
+    """
+    import pandas as pd
+
+    rows = {marketplace: [] for marketplace, _, _ in marketplaces}
+    for marketplace, row in read_legacy_csv(listings_db, list(rows)):
+        rows[marketplace].append(row)
+
+    imported = {}
+    for marketplace, key_columns, search_fields in marketplaces:
+        key_columns = list(key_columns)
+        listings_df = pd.DataFrame(rows[marketplace], dtype=str)
+        if any(column not in listings_df.columns for column in key_columns):
+            imported[marketplace] = 0
+            continue
+        listings_df = listings_df[listings_df[key_columns].notna().all(axis=1)]
+        for values, group in listings_df.groupby(key_columns, sort=False):
+            search = dict(zip(search_fields, values))
+            history.record(marketplace, make_search_key(*values), search, group)
+        imported[marketplace] = len(listings_df)
+    return imported
+
+
+if __name__ == "__main__":
+    from registry import load_marketplace, marketplace_names
+
+    parser = argparse.ArgumentParser(description="Listing history tools")
+    parser.add_argument("command", choices=["query", "import"])
+    parser.add_argument(
+        "-m", "--marketplace", choices=marketplace_names(), action="append", help="Only these marketplaces"
+    )
+    parser.add_argument("-f", "--folder", help="History folder", default=HISTORY_FOLDER)
+    parser.add_argument("-c", "--column", action="append", help="Only these columns")
+    parser.add_argument("-k", "--search_key", help="Only this search", default=None)
+    parser.add_argument("-s", "--since", help="Unix timestamp lower bound", type=float, default=None)
+    parser.add_argument("-u", "--until", help="Unix timestamp upper bound", type=float, default=None)
+    parser.add_argument("-o", "--output", help="csv file for the queried listings", default=None)
+    args = parser.parse_args()
+
+    if args.command == "import":
+        # kijiji and kijiji_mobile share one file, every file is read once
+        legacy_files = {}
+        for marketplace in args.marketplace or marketplace_names():
+            if marketplace not in LEGACY_DBS:
+                continue
+            csv_path, key_columns = LEGACY_DBS[marketplace]
+            legacy_files.setdefault(os.path.normpath(csv_path), []).append(
+                (marketplace, key_columns, load_marketplace(marketplace).SEARCH_KEY)
+            )
+
+        history = ListingHistory(args.folder)
+        for csv_path, marketplaces in legacy_files.items():
+            if not os.path.exists(csv_path):
+                continue
+            for marketplace, rows in import_listings_db(history, csv_path, marketplaces).items():
+                print(f"Imported {rows} {marketplace} listings from {csv_path}")
+        history.close()
+
+    else:
+        listings_df = read_history(
+            args.folder, args.column, args.marketplace, args.since, args.until, args.search_key
+        )
+        print(f"{len(listings_df)} listings")
+        if args.output:
+            listings_df.to_csv(args.output, index=None)
+        else:
+            print(listings_df.head(20).to_string())
@@ -0,0 +1,131 @@
+import socket
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+
+DEFAULT_POOL_CONFIG = {
+    "pool_connections": 4,  # connection pools kept per session
+    "pool_maxsize": 16,  # connections kept alive per pool
+    "pool_block": False,
+    "max_retries": 0,
+    "keepalive": True,  # TCP keep-alive on pooled sockets
+    "keepalive_idle": 60,  # seconds idle before the first probe
+    "keepalive_interval": 15,
+    "keepalive_count": 4,
+}
+
+# Per-host overrides of DEFAULT_POOL_CONFIG
+HOST_POOL_CONFIG = {
+    "offerup.com": {"pool_maxsize": 32},
+    "sapi.craigslist.org": {"pool_maxsize": 32},
+    "iphone-api.gumtree.com": {"pool_maxsize": 16},
+    "www.kijiji.ca": {"pool_maxsize": 16},
+    "api.ca-kijiji-production.classifiedscloud.io": {"pool_maxsize": 16},
+    "api.ebay.com": {"pool_maxsize": 16},
+}
+
+
+def keepalive_socket_options(config):
+    options = list(HTTPConnection.default_socket_options)
+    if not config.get("keepalive"):
+        return options
+
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    # Linux / macOS only, skipped where the constants don't exist
+    for name, key in (
+        ("TCP_KEEPIDLE", "keepalive_idle"),
+        ("TCP_KEEPINTVL", "keepalive_interval"),
+        ("TCP_KEEPCNT", "keepalive_count"),
+    ):
+        if hasattr(socket, name) and config.get(key):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), config[key]))
+    return options
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    def __init__(self, socket_options=None, **kwargs):
+        self.socket_options = socket_options
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.socket_options is not None:
+            kwargs["socket_options"] = self.socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+
+class SessionPool:
+    """
+    One keep-alive requests.Session per host so repeated calls to the same
+    marketplace reuse TCP/TLS connections instead of handshaking every time.
+    """
+
+    def __init__(self, host_config: dict = None, default_config: dict = None):
+        self.default_config = {**DEFAULT_POOL_CONFIG, **(default_config or {})}
+        self.host_config = {
+            host: dict(config)
+            for host, config in (
+                HOST_POOL_CONFIG if host_config is None else host_config
+            ).items()
+        }
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def config_for(self, host):
+        return {**self.default_config, **self.host_config.get(host, {})}
+
+    def configure(self, host: str, **options):
+        """Change the pool settings of a host, its session is rebuilt on next use"""
+        with self.lock:
+            self.host_config.setdefault(host, {}).update(options)
+            session = self.sessions.pop(host, None)
+        if session is not None:
+            session.close()
+
+    def create_session(self, host):
+        config = self.config_for(host)
+        adapter = KeepAliveAdapter(
+            socket_options=keepalive_socket_options(config),
+            pool_connections=config["pool_connections"],
+            pool_maxsize=config["pool_maxsize"],
+            pool_block=config["pool_block"],
+            max_retries=config["max_retries"],
+        )
+
+        session = requests.Session()
+        session.headers["Connection"] = "keep-alive"
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def session_for(self, url: str):
+        host = urlsplit(url).hostname or ""
+        session = self.sessions.get(host)
+        if session is not None:
+            return session
+
+        with self.lock:
+            if host not in self.sessions:
+                self.sessions[host] = self.create_session(host)
+            return self.sessions[host]
+
+    def close(self):
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            session.close()
+
+
+default_pool = SessionPool()
+
+
+def get_session(url: str):
+    return default_pool.session_for(url)
+
+
+def configure_host(host: str, **options):
+    default_pool.configure(host, **options)
@@ -1,20 +1,186 @@
-import requests
 import json
-import pandas as pd
-from datetime import datetime
-import os
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from kijiji_helper import HEADERS, get_location_id, get_seo_url
-from parsel import Selector
+from listing_batch import ListingBatch
+from marketplace import Marketplace
+from watermark import Cutoff
 
 
 DATA_FOLDER = "./data/kijiji"
 LISTINGS_DB = f"{DATA_FOLDER}/LISING_DB.csv"
 
-os.makedirs(DATA_FOLDER, exist_ok=True)
+COLUMNS = [
+    "query",
+    "city",
+    "state",
+    "listing_id",
+    "title",
+    "location",
+    "image_url",
+    "price",
+    "url",
+    "mileageinkm",
+    "poster_info",
+    "time_posted",
+    "sorted_time",
+    "time_found",
+]
+NEXT_DATA_MARKERS = (b'id="__NEXT_DATA__"', b"id='__NEXT_DATA__'")
+
+RESOLVE_WORKERS = 16
+
+
+def extract_next_data(content: bytes):
+    """
+    Raw JSON of the __NEXT_DATA__ script, found straight in the response
+    bytes without decoding the page or building a DOM.
+    """
+    for marker in NEXT_DATA_MARKERS:
+        start = content.find(marker)
+        if start != -1:
+            break
+    else:
+        raise ValueError("No __NEXT_DATA__ script in page")
+
+    start = content.index(b">", start + len(marker)) + 1
+    end = content.index(b"</script>", start)
+    return content[start:end]
+
+
+def index_apollo_state(appollo_state: dict):
+    """Group the Apollo cache entries ("Typename:id" keys) by typename"""
+    index = {}
+    for record, value in appollo_state.items():
+        typename, _, _ = record.partition(":")
+        index.setdefault(typename, []).append(value)
+    return index
+
+
+def extract_listings(content: bytes, watermark=None):
+    """Listing records of a search results page, without the search fields"""
+    listing_json = json.loads(extract_next_data(content))
+    return listing_records(listing_json, watermark)
+
+
+def listing_records(resp_json: dict, watermark=None):
+    props = resp_json.get("props")
+    page_props = props.get("pageProps")
+    appollo_state = page_props.get("__APOLLO_STATE__")
+
+    listing_data = []
+    cutoff = Cutoff(watermark)
+
+    for value in index_apollo_state(appollo_state).get("ListingV2", []):
+        listing_id = value.get("id")
+        sorting_date = value.get("sortingDate")
+        if cutoff.passed(sorting_date, listing_id):
+            break
+
+        title = value.get("title")
+        location = value.get("location").get("address")
+        image_url = value.get("imageUrls")[0] if value.get("imageUrls") else None
+
+        amount = value.get("price").get("amount")
+        amount = amount / 100
+
+        currency = value.get("price").get("currency")
+
+        attributes = value.get("attributes")
+        for attr in attributes:
+            if attr.get("name") == "carmileageinkms":
+                mileageinkm = attr.get("values")[0] if attr.get("values") else None
+                break
+        else:
+            mileageinkm = None
+
+        price = f"{amount} {currency}"
+        url = value.get("seoUrl")
+        if not url.startswith("http"):
+            url = f"https://www.kijiji.ca/{url.strip('/')}"
+
+        poster_info = value.get("posterInfo").get("__ref")
+        time_posted = value.get("activationDate")
+
+        listing_data.append(
+            {
+                "listing_id": listing_id,
+                "title": title,
+                "location": location,
+                "image_url": image_url,
+                "price": price,
+                "url": url,
+                "mileageinkm": mileageinkm,
+                "poster_info": poster_info,
+                "time_posted": time_posted,
+                "sorted_time": sorting_date,
+            }
+        )
+
+    return listing_data
+
+
+def search_url(
+    query,
+    city,
+    state,
+    min_price=None,
+    max_price=None,
+    min_year=None,
+    max_year=None,
+    min_mileage=None,
+    max_mileage=None,
+    limit=40,
+    car_search=False,
+):
+    """SEO URL of a search, the lookups behind it are cached on disk"""
+    location_id = get_location_id(f"{city}, {state}")
+    return get_seo_url(
+        query=query,
+        location_id=location_id,
+        min_price=min_price,
+        max_price=max_price,
+        min_year=min_year,
+        max_year=max_year,
+        min_mileage=min_mileage,
+        max_mileage=max_mileage,
+        car_search=car_search,
+        limit=limit,
+    )
+
+
+def resolve_searches(searches, workers: int = RESOLVE_WORKERS):
+    """
+    Resolve the URLs of many searches in parallel, Kijiji arguments in
+    `searches`. Each location is looked up once before the SEO URLs so
+    searches sharing a city don't race to resolve it. Failed lookups are
+    left for the constructor to retry.
 
+    @return: Number of searches resolved
+    """
+
+    def resolve(func, *args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            print(f"Could not resolve {args or kwargs}: {e!r}")
+            return None
+
+    locations = {f"{params['city']}, {params['state']}" for params in searches}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda location: resolve(get_location_id, location), locations))
+        urls = list(pool.map(lambda params: resolve(search_url, **params), searches))
+    return sum(url is not None for url in urls)
+
+
+class Kijiji(Marketplace):
+    NAME = "kijiji"
+    DATA_FOLDER = DATA_FOLDER
+    LISTINGS_DB = LISTINGS_DB
+    SEARCH_KEY = ("query", "city", "state")
+    WATERMARK_COLUMN = "sorted_time"
+    PAGE_SIZE_PARAM = "limit"
 
-class Kijiji:
     def __init__(
         self,
         query: str,
@@ -38,135 +204,51 @@ class Kijiji:
         self.max_year = max_year
         self.min_mileage = min_mileage
         self.max_mileage = max_mileage
-        location_id = get_location_id(f"{self.city}, {self.state}")
         self.car_search = car_search
 
-        self.url = get_seo_url(
-            query=self.query,
-            location_id=location_id,
+        self.url = search_url(
+            self.query,
+            self.city,
+            self.state,
             min_price=self.min_price,
             max_price=self.max_price,
             min_year=self.min_year,
             max_year=self.max_year,
             min_mileage=self.min_mileage,
             max_mileage=self.max_mileage,
-            car_search=self.car_search,
             limit=limit,
+            car_search=self.car_search,
         )
         print(self.url)
 
-    def new_listings_filename(self):
-        return f"{DATA_FOLDER}/NEW_LISTINGS_{self.time_checked}.csv"
+    @classmethod
+    def resolve_searches(cls, searches):
+        return resolve_searches(searches)
 
-    def get_listings(self):
-        response = requests.get(self.url, headers=HEADERS)
-        self.time_checked = datetime.now().timestamp()
+    def build_request(self):
+        return {"method": "GET", "url": self.url, "headers": HEADERS}
 
-        listing_page = Selector(response.text)
+    def parse_task(self):
+        return extract_listings, {"watermark": self.watermark}
 
-        listing_json = listing_page.xpath('//script[@id="__NEXT_DATA__"]/text()').get()
-        listing_json = json.loads(str(listing_json))
-
-        listings_df = self.parse_listing(listing_json)
-        return listings_df
-
-    def check_new_listings(self):
-        latest_listings_df = self.get_listings()
-        if os.path.exists(LISTINGS_DB):
-            old_listings_df = pd.read_csv(LISTINGS_DB)
-
-            latest_listings_df["state"] = latest_listings_df["state"].astype(float)
-            latest_listings_df["city"] = latest_listings_df["city"].astype(float)
-
-            old_listings_df["state"] = old_listings_df["state"].astype(float)
-            old_listings_df["city"] = old_listings_df["city"].astype(float)
-
-            merge_df = latest_listings_df.merge(
-                old_listings_df[["listing_id", "query", "state", "city"]],
-                on=["listing_id", "query", "state", "city"],
-                how="left",
-                indicator=True,
-            )
-            new_listings_df = merge_df[merge_df["_merge"] == "left_only"]
-
-        else:
-            new_listings_df = latest_listings_df
-
-        ## Notify of new listings
-        print(
-            f"Found {len(new_listings_df)} new listings for {self.query} in city {self.city} and state {self.state}"
-        )
-        new_listings_df.to_csv(self.new_listings_filename(), index=None)
-
-        ## Add new listing df to the listing db so notification doesnt come up again
-        if "_merge" in new_listings_df.columns:
-            new_listings_df = new_listings_df.drop(columns=["_merge"])
-
-        new_listings_df.to_csv(
-            LISTINGS_DB, mode="a", index=None, header=not os.path.exists(LISTINGS_DB)
-        )
+    def parse_response(self, response):
+        return self.build_listings(extract_listings(response.content, self.watermark))
 
     def parse_listing(self, resp_json: dict):
-        props = resp_json.get("props")
-        page_props = props.get("pageProps")
-        appollo_state = page_props.get("__APOLLO_STATE__")
-
-        listing_data = []
-
-        for record, value in appollo_state.items():
-            if not record.startswith("ListingV2"):
-                continue
-
-            listing_id = value.get("id")
-            title = value.get("title")
-            location = value.get("location").get("address")
-            image_url = value.get("imageUrls")[0] if value.get("imageUrls") else None
-
-            amount = value.get("price").get("amount")
-            amount = amount / 100
-
-            currency = value.get("price").get("currency")
-
-            attributes = value.get("attributes")
-            for attr in attributes:
-                if attr.get("name") == "carmileageinkms":
-                    mileageinkm = attr.get("values")[0] if attr.get("values") else None
-                    break
-            else:
-                mileageinkm = None
-
-            price = f"{amount} {currency}"
-            url = value.get("seoUrl")
-            if not url.startswith("http"):
-                url = f"https://www.kijiji.ca/{url.strip('/')}"
-
-            poster_info = value.get("posterInfo").get("__ref")
-            time_posted = value.get("activationDate")
-            sorting_date = value.get("sortingDate")
-
-            listing_data.append(
-                {
-                    "query": self.query,
-                    "city": self.city,
-                    "state": self.state,
-                    "listing_id": listing_id,
-                    "title": title,
-                    "location": location,
-                    "image_url": image_url,
-                    "price": price,
-                    "url": url,
-                    "mileageinkm": mileageinkm,
-                    "poster_info": poster_info,
-                    "time_posted": time_posted,
-                    "sorted_time": sorting_date,
-                    "time_found": self.time_checked,
-                }
-            )
-
-        print(len(listing_data))
-
-        listing_df = pd.DataFrame(listing_data)
-        return listing_df
+        return self.build_listings(listing_records(resp_json, self.watermark))
+
+    def build_listings(self, records):
+        listings = ListingBatch(
+            COLUMNS,
+            constants={
+                "query": self.query,
+                "city": self.city,
+                "state": self.state,
+                "time_found": self.time_checked,
+            },
+        ).extend_records(records)
+
+        return listings
 
 
 if __name__ == "__main__":
@@ -1,10 +1,10 @@
-from geopy.geocoders import Nominatim
-
-import requests
+from lookup_cache import cached_lookup
+from transport import default_transport
 import json
+import os
 
 
-API_URL = "https://www.kijiji.ca/anvil2/api"
+API_URL = os.environ.get("KIJIJI_API_URL", "https://www.kijiji.ca/anvil2/api")
 
 HEADERS = {
     "Modane": "NTc5YjIzNTQtMGRkZC00YmRhLTkyZDUtZmRkNzU0ZGM3ZGI5",
@@ -12,6 +12,23 @@ HEADERS = {
     "Content-Type": "application/json",
 }
 
+DAY = 24 * 60 * 60
+PLACE_TTL = 30 * DAY
+LOCATION_TTL = 30 * DAY
+SEO_URL_TTL = 7 * DAY
+
+
+def post_query(payload):
+    """
+    Send a GraphQL query through the default transport, so the lookups wait
+    for their turn at the host's rate limiter like the searches do
+    """
+    response = default_transport().fetch(
+        "POST", API_URL, headers=HEADERS, data=json.dumps(payload)
+    )
+    response.raise_for_status()
+    return response.json()
+
 
 def get_location_id(location_name):
     place_id = get_place_suggestion(location_name)
@@ -24,15 +41,14 @@ def get_location_id(location_name):
     return location_id
 
 
+@cached_lookup(f"kijiji_location {API_URL}", LOCATION_TTL)
 def location_from_place(place_id):
     payload = {
         "query": "query locationFromPlace($placeId: String!, $sessionToken: String, $hints: [Hints]) {  locationFromPlace(placeId: $placeId, sessionToken: $sessionToken, hints: $hints) {    location {      ...LocationWithName      __typename    }    place {      ...LocationWithPlaceDetails      __typename    }    __typename  }}fragment LocationWithName on Location {  id  localizedName  __typename}fragment LocationWithPlaceDetails on PlaceDetails {  isCountry  isProvince  location {    latitude    longitude    __typename  }  __typename}",
         "variables": {"placeId": place_id},
     }
 
-    response = requests.post(API_URL, headers=HEADERS, data=json.dumps(payload))
-
-    resp_json = response.json()
+    resp_json = post_query(payload)
 
     data = resp_json.get("data")
     location_from_place = data.get("locationFromPlace")
@@ -41,15 +57,14 @@ def location_from_place(place_id):
     return location
 
 
+@cached_lookup(f"kijiji_place {API_URL}", PLACE_TTL)
 def get_place_suggestion(location_name):
     payload = {
         "query": "query PlaceSuggestions($input: String!, $location: LocationQueryCoordsOptions) {  placeSuggestions(input: $input, location: $location) {    placeId    address    __typename  }}",
         "variables": {"input": location_name},
     }
 
-    response = requests.post(API_URL, headers=HEADERS, data=json.dumps(payload))
-
-    resp_json = response.json()
+    resp_json = post_query(payload)
 
     data = resp_json.get("data")
 
@@ -60,6 +75,7 @@ def get_place_suggestion(location_name):
     return place_id
 
 
+@cached_lookup(f"kijiji_seo_url {API_URL}", SEO_URL_TTL)
 def get_seo_url(
     query,
     location_id,
@@ -118,9 +134,7 @@ def get_seo_url(
             car_mileage_filter
         )
 
-    response = requests.post(API_URL, headers=HEADERS, data=json.dumps(payload))
-
-    resp_json = response.json()
+    resp_json = post_query(payload)
 
     search_url = resp_json.get("data").get("searchUrl")
     return search_url
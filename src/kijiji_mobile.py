@@ -1,23 +1,54 @@
-import requests
-import json
-import pandas as pd
-from datetime import datetime
 import os
 import argparse
-from parsel import Selector
+from listing_batch import ListingBatch
+from marketplace import Marketplace
+from watermark import Cutoff
 
 
 DATA_FOLDER = "./data/kijiji"
-LISTINGS_DB = f"{DATA_FOLDER}/LISING_DB.csv"
-
-os.makedirs(DATA_FOLDER, exist_ok=True)
-
-
-URL = "https://api.ca-kijiji-production.classifiedscloud.io/v2/listings"
+# The kijiji web scraper writes LISING_DB.csv in the same folder
+LISTINGS_DB = f"{DATA_FOLDER}/LISING_DB_MOBILE.csv"
+
+COLUMNS = [
+    "query",
+    "lat",
+    "long",
+    "listing_id",
+    "title",
+    "location",
+    "image_url",
+    "price",
+    "url",
+    "mileageinkm",
+    "car_year",
+    "poster_info",
+    "time_posted",
+    "sorted_time",
+    "time_found",
+]
+
+URL = os.environ.get(
+    "KIJIJI_MOBILE_API_URL",
+    "https://api.ca-kijiji-production.classifiedscloud.io/v2/listings",
+)
 # ?limit=40&offset=0&topAdCount=6&eaTopAdPosition=1&autoRefine=false&address=Vancouver%2C+BC&attribute=caryear__1980%2C2024&attribute=carmileageinkms__1000%2C1000001&category=174&keywords=toyota&latitude=49.28272914832938&longitude=-123.12073733657598&order=DESC&radius=50000&sort=DATE&type=OFFER"
 
 
-class KijijiMobile:
+class KijijiMobile(Marketplace):
+    NAME = "kijiji_mobile"
+    DATA_FOLDER = DATA_FOLDER
+    LISTINGS_DB = LISTINGS_DB
+    WATERMARK_COLUMN = "sorted_time"
+    COALESCE = True
+    RANGE_FILTERS = (
+        ("min_price", "max_price", "price"),
+        ("min_mileage", "max_mileage", "mileageinkm"),
+        ("min_year", "max_year", "car_year"),
+    )
+    RADIUS_PARAM = "distance"
+    RADIUS_KM = 0.001  # the radius is in meters
+    PAGE_SIZE_PARAM = "limit"
+
     def __init__(
         self,
         query: str,
@@ -43,6 +74,7 @@ class KijijiMobile:
         self.min_mileage = min_mileage
         self.max_mileage = max_mileage
         self.car_search = car_search
+        self.distance = distance
 
         self.params = {
             "limit": limit,
@@ -78,67 +110,36 @@ class KijijiMobile:
 
         print(self.params)
 
-    def new_listings_filename(self):
-        return f"{DATA_FOLDER}/NEW_LISTINGS_{self.time_checked}.csv"
-
-    def get_listings(self):
-        response = requests.get(URL, params=self.params)
-        self.time_checked = datetime.now().timestamp()
+    def build_request(self):
+        return {"method": "GET", "url": URL, "params": self.params}
 
-        listing_json = response.json()
+    def parse_response(self, response):
+        listing_json = self.decode_json(response)
 
         print(response.url)
 
-        with open("resp.json", "w") as f:
-            json.dump(listing_json, f, indent=4)
-
-        listings_df = self.parse_listing(listing_json)
-
-        return listings_df
-
-    def check_new_listings(self):
-        latest_listings_df = self.get_listings()
-        if os.path.exists(LISTINGS_DB):
-            old_listings_df = pd.read_csv(LISTINGS_DB)
-
-            latest_listings_df["long"] = latest_listings_df["long"].astype(float)
-            latest_listings_df["lat"] = latest_listings_df["lat"].astype(float)
-
-            old_listings_df["long"] = old_listings_df["long"].astype(float)
-            old_listings_df["lat"] = old_listings_df["lat"].astype(float)
-
-            merge_df = latest_listings_df.merge(
-                old_listings_df[["listing_id", "query", "long", "lat"]],
-                on=["listing_id", "query", "long", "lat"],
-                how="left",
-                indicator=True,
-            )
-            new_listings_df = merge_df[merge_df["_merge"] == "left_only"]
-
-        else:
-            new_listings_df = latest_listings_df
-
-        ## Notify of new listings
-        print(
-            f"Found {len(new_listings_df)} new listings for {self.query} in lat {self.lat} and long {self.long}"
-        )
-        new_listings_df.to_csv(self.new_listings_filename(), index=None)
-
-        ## Add new listing df to the listing db so notification doesnt come up again
-        if "_merge" in new_listings_df.columns:
-            new_listings_df = new_listings_df.drop(columns=["_merge"])
-
-        new_listings_df.to_csv(
-            LISTINGS_DB, mode="a", index=None, header=not os.path.exists(LISTINGS_DB)
-        )
+        return self.parse_listing(listing_json)
 
     def parse_listing(self, resp_json: dict):
         results = resp_json.get("results")
 
-        listing_data = []
+        listings = ListingBatch(
+            COLUMNS,
+            constants={
+                "query": self.query,
+                "lat": self.lat,
+                "long": self.long,
+                "time_found": self.time_checked,
+            },
+        )
+        cutoff = Cutoff(self.watermark)
 
         for record in results:
             listing_id = record.get("id")
+            sorting_date = record.get("sortingDate")
+            if cutoff.passed(sorting_date, listing_id):
+                break
+
             title = record.get("title")
             location = record.get("locationInfo").get("mapAddress")
             image_url = record.get("thumbnailUrl")
@@ -153,32 +154,22 @@ class KijijiMobile:
 
             poster_info = record.get("posterInfo").get("id")
             time_posted = record.get("activationDate")
-            sorting_date = record.get("sortingDate")
 
-            listing_data.append(
-                {
-                    "query": self.query,
-                    "lat": self.lat,
-                    "long": self.long,
-                    "listing_id": listing_id,
-                    "title": title,
-                    "location": location,
-                    "image_url": image_url,
-                    "price": price,
-                    "url": url,
-                    "mileageinkm": mileageinkm,
-                    "car_year": car_year,
-                    "poster_info": poster_info,
-                    "time_posted": time_posted,
-                    "sorted_time": sorting_date,
-                    "time_found": self.time_checked,
-                }
+            listings.append(
+                listing_id,
+                title,
+                location,
+                image_url,
+                price,
+                url,
+                mileageinkm,
+                car_year,
+                poster_info,
+                time_posted,
+                sorting_date,
             )
 
-        print(len(listing_data))
-
-        listing_df = pd.DataFrame(listing_data)
-        return listing_df
+        return listings
 
 
 if __name__ == "__main__":
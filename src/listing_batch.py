@@ -0,0 +1,190 @@
+import csv
+import json
+import math
+import re
+
+
+PRICE_AMOUNT = re.compile(r"-?\d[\d,]*(?:\.\d+)?")
+PRICE_CURRENCY = re.compile(r"\b[A-Z]{3}\b|[$£€]")
+
+
+class ListingBatch:
+    """
+    Listings of one poll, as one tuple per listing of the columns that vary
+    between listings. Per-search constants (query, location, time_found)
+    are kept once for the whole batch, listings repeating the key of an
+    earlier one are dropped as they are added, and a DataFrame is only
+    built when to_dataframe() is called.
+
+        batch = ListingBatch(
+            ["query", "listing_id", "title", "time_found"],
+            constants={"query": self.query, "time_found": self.time_checked},
+        )
+        batch.append(listing_id, title)
+    """
+
+    __slots__ = ("columns", "constants", "key", "fields", "key_position", "rows", "keys", "assigned")
+
+    def __init__(self, columns, constants=None, key: str = "listing_id"):
+        self.columns = list(columns)
+        self.constants = dict(constants or {})
+        self.key = key
+        # The columns append() takes, in order
+        self.fields = [column for column in self.columns if column not in self.constants]
+        self.key_position = self.fields.index(key)
+        self.rows = []
+        self.keys = set()
+        self.assigned = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def empty(self):
+        return not self.rows
+
+    def append(self, *values):
+        """
+        Add a listing, `values` are those of `fields`. False when a listing
+        with the same key is already in the batch.
+        """
+        key = values[self.key_position]
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        self.rows.append(values)
+        return True
+
+    def extend_records(self, records):
+        """Add listing records (dicts holding the `fields`)"""
+        fields = self.fields
+        for record in records:
+            self.append(*[record.get(field) for field in fields])
+        return self
+
+    def set_column(self, name, values):
+        """Replace the values of a column for every listing, e.g. a computed distance"""
+        if len(values) != len(self.rows):
+            raise ValueError(f"{len(values)} values for {len(self.rows)} listings")
+        self.assigned[name] = list(values)
+
+    def column(self, name):
+        if name in self.assigned:
+            return self.assigned[name]
+        if name in self.constants:
+            return [self.constants[name]] * len(self.rows)
+        position = self.fields.index(name)
+        return [row[position] for row in self.rows]
+
+    def select(self, positions, constants=None):
+        """New batch with the listings at `positions`, `constants` replace some of the batch's"""
+        constants = dict(self.constants, **(constants or {}))
+        if len(constants) != len(self.constants):
+            raise ValueError(f"{sorted(set(constants) - set(self.constants))} are not constants")
+        batch = ListingBatch(self.columns, constants, self.key)
+        batch.rows = [self.rows[i] for i in positions]
+        batch.keys = {row[self.key_position] for row in batch.rows}
+        batch.assigned = {
+            name: [values[i] for i in positions] for name, values in self.assigned.items()
+        }
+        return batch
+
+    def to_dataframe(self):
+        import pandas as pd
+
+        return pd.DataFrame(
+            {name: self.column(name) for name in self.columns}, columns=self.columns
+        )
+
+    def write_csv(self, path, header: bool = True):
+        """
+        Append the listings to a csv file the way DataFrame.to_csv writes
+        them, without importing pandas.
+        """
+        columns = [[csv_value(value) for value in self.column(name)] for name in self.columns]
+        with open(path, "a", newline="") as file:
+            writer = csv.writer(file, lineterminator="\n")
+            if header:
+                writer.writerow(self.columns)
+            writer.writerows(zip(*columns))
+
+    def records(self):
+        """Listings as JSON-safe dicts, missing numbers as None"""
+        columns = [[json_value(value) for value in self.column(name)] for name in self.columns]
+        return [dict(zip(self.columns, values)) for values in zip(*columns)]
+
+
+def merge_batches(batches, constants=None):
+    """
+    One batch of the listings of several batches with the same columns,
+    e.g. the pages of a tiled search. A listing in more than one is kept
+    once, as the first batch has it. `constants` replace some of the
+    batches' constants, the others have to be the same in all of them.
+    """
+    first = batches[0]
+    replaced = constants or {}
+    if not set(replaced) <= set(first.constants):
+        raise ValueError(f"{sorted(set(replaced) - set(first.constants))} are not constants")
+    for batch in batches[1:]:
+        if batch.columns != first.columns or batch.constants.keys() != first.constants.keys():
+            raise ValueError("Batches have different columns")
+        for name, value in batch.constants.items():
+            if name not in replaced and value != first.constants[name]:
+                raise ValueError(f"Batches have different {name}")
+
+    merged = ListingBatch(first.columns, dict(first.constants, **replaced), first.key)
+    assigned = {name: [] for batch in batches for name in batch.assigned}
+    for batch in batches:
+        columns = {name: batch.column(name) for name in assigned}
+        for i, row in enumerate(batch.rows):
+            if merged.append(*row):
+                for name, values in assigned.items():
+                    values.append(columns[name][i])
+    merged.assigned = assigned
+    return merged
+
+
+def missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def parse_price(value):
+    """
+    (amount, currency) of a price as the scrapers write it: "12.0 CAD",
+    "$ 12.0", "$1,200", "1200" or a number. Either is None when missing,
+    e.g. GumTree's "None None".
+    """
+    if missing(value) or isinstance(value, bool):
+        return None, None
+    if isinstance(value, (int, float)):
+        return float(value), None
+
+    value = str(value)
+    amount = PRICE_AMOUNT.search(value)
+    currency = PRICE_CURRENCY.search(value)
+    return (
+        float(amount.group(0).replace(",", "")) if amount else None,
+        currency.group(0) if currency else None,
+    )
+
+
+def json_value(value):
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if hasattr(value, "item"):  # numpy scalars
+        value = value.item()
+        if isinstance(value, float) and math.isnan(value):
+            return None
+    return value
+
+
+def csv_value(value):
+    value = json_value(value)
+    return "" if value is None else value
+
+
+def listing_records(listings):
+    """JSON-safe dicts of a ListingBatch or a DataFrame of listings"""
+    if isinstance(listings, ListingBatch):
+        return listings.records()
+    return json.loads(listings.to_json(orient="records"))
@@ -0,0 +1,130 @@
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+LOOKUP_DB = "./data/LOOKUP_CACHE.db"
+DEFAULT_MAX_ENTRIES = 10000
+
+
+class LookupCache:
+    """
+    On-disk cache for slow lookups whose answers rarely change (place ids,
+    location ids, search URLs). Every entry has its own time to live, the
+    least recently used entries are dropped once the cache is full.
+    """
+
+    def __init__(self, path: str = LOOKUP_DB, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS lookups (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )"""
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS lookups_last_used ON lookups (last_used)"
+        )
+        self.conn.commit()
+
+    def get(self, namespace: str, key: str):
+        """Cached value, None if missing or expired"""
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT value, expires FROM lookups WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+            if row is None or row[1] <= now:
+                return None
+            self.conn.execute(
+                "UPDATE lookups SET last_used = ? WHERE namespace = ? AND key = ?",
+                (now, namespace, key),
+            )
+        return json.loads(row[0])
+
+    def set(self, namespace: str, key: str, value, ttl: float):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                """INSERT OR REPLACE INTO lookups
+                (namespace, key, value, expires, last_used) VALUES (?, ?, ?, ?, ?)""",
+                (namespace, key, json.dumps(value), now + ttl, now),
+            )
+            self.evict(now)
+
+    def evict(self, now: float):
+        """Drop expired entries, then the least recently used over max_entries"""
+        self.conn.execute("DELETE FROM lookups WHERE expires <= ?", (now,))
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM lookups").fetchone()
+        if count > self.max_entries:
+            self.conn.execute(
+                """DELETE FROM lookups WHERE rowid IN (
+                    SELECT rowid FROM lookups ORDER BY last_used LIMIT ?
+                )""",
+                (count - self.max_entries,),
+            )
+
+    def clear(self, namespace: str = None):
+        with self.lock, self.conn:
+            if namespace is None:
+                self.conn.execute("DELETE FROM lookups")
+            else:
+                self.conn.execute("DELETE FROM lookups WHERE namespace = ?", (namespace,))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_lookup_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LookupCache(LOOKUP_DB)
+    return _default_cache
+
+
+def cached_lookup(namespace: str, ttl: float):
+    """
+    Cache the results of a lookup function in the default LookupCache, keyed
+    on its arguments. None results are not cached. The undecorated function
+    stays available as `.uncached`.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = json.dumps([args, kwargs], sort_keys=True, default=str)
+            cache = default_lookup_cache()
+            value = cache.get(namespace, key)
+            if value is None:
+                value = func(*args, **kwargs)
+                if value is not None:
+                    cache.set(namespace, key, value, ttl)
+            return value
+
+        wrapper.uncached = func
+        return wrapper
+
+    return decorator
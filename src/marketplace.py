@@ -0,0 +1,339 @@
+import os
+import time
+from datetime import datetime
+
+from listing_batch import parse_price
+from metrics import default_metrics
+from seen_store import default_seen_store, make_search_key
+from segment_log import segment_log
+from transport import default_transport
+from watermark import Watermark, oldest_watermark
+
+
+def filter_bound(value):
+    """Number of a range filter argument, None when it is not set"""
+    if value is None or value == "":
+        return None
+    return parse_price(value)[0]
+
+
+class Marketplace:
+    """
+    Shared new-listing check for the marketplace scrapers.
+
+    Subclasses implement build_request() and parse_response(), which
+    returns the listings as a ListingBatch, and set:
+    - NAME: marketplace name used in the seen-listing store
+    - DATA_FOLDER / LISTINGS_DB: where new listings and history are written.
+      New listings are appended to the segment log in
+      DATA_FOLDER/NEW_LISTINGS_FOLDER, see SegmentLog.
+    - SEARCH_KEY: attributes identifying a saved search, query first
+    - WATERMARK_COLUMN: listing column with the posting time the search is
+      sorted on (newest first), None if the marketplace doesn't send one.
+      Parsers stop at the watermark of the previous polls, see Cutoff.
+    - COALESCE, RANGE_FILTERS, RADIUS_PARAM, RADIUS_KM: what searches of
+      the same query may differ in and still share one request, see
+      planner.plan_searches() and local_listings().
+    - PAGE_SIZE_PARAM: constructor argument with the listings per page.
+      Searches with a page size, a radius and a watermark can be split
+      into tiles of smaller radius, see tiling.TiledScraper.
+
+    Every poll is timed by stage (fetch, decode, parse, dedup, write) in
+    the stage_seconds histogram of `metrics`. JSON responses should be
+    decoded with decode_json() so decoding is not counted as parsing.
+    """
+
+    NAME = None
+    DATA_FOLDER = None
+    LISTINGS_DB = None
+    SEARCH_KEY = ("query", "lat", "long")
+    WATERMARK_COLUMN = None
+    NEW_LISTINGS_FOLDER = "new_listings"
+    COALESCE = False
+    RANGE_FILTERS = ()  # (min attribute, max attribute, listing column)
+    RADIUS_PARAM = None  # search radius attribute, around lat and long
+    RADIUS_KM = 1.0  # km per unit of the radius
+    PAGE_SIZE_PARAM = None  # listings per page argument
+
+    seen_store = None
+    transport = None
+    parse_executor = None
+    archive = None
+    history = None
+    new_listings_log = None
+    notifier = None
+    metrics = None
+    watermark = None
+    coalesced = None  # scrapers of the searches a coalesced request is for
+    decode_seconds = 0.0
+
+    @classmethod
+    def resolve_searches(cls, searches):
+        """
+        Warm up whatever the constructor looks up over the network for many
+        searches (lists of constructor arguments) at once, before the
+        scrapers are created. Nothing to do by default.
+        """
+        return 0
+
+    def get_transport(self):
+        if self.transport is None:
+            self.transport = default_transport()
+        return self.transport
+
+    def get_metrics(self):
+        if self.metrics is None:
+            self.metrics = default_metrics()
+        return self.metrics
+
+    def stage(self, name):
+        """Timer for one stage of a poll"""
+        return self.get_metrics().timer("stage_seconds", marketplace=self.NAME, stage=name)
+
+    def decode_json(self, response):
+        with self.stage("decode") as timer:
+            resp_json = response.json()
+        self.decode_seconds += timer.elapsed
+        return resp_json
+
+    def get_new_listings_log(self):
+        if self.new_listings_log is None:
+            self.new_listings_log = segment_log(
+                os.path.join(self.DATA_FOLDER, self.NEW_LISTINGS_FOLDER)
+            )
+        return self.new_listings_log
+
+    def get_seen_store(self):
+        if self.seen_store is None:
+            self.seen_store = default_seen_store()
+        return self.seen_store
+
+    def search_key(self):
+        return make_search_key(*(getattr(self, attr) for attr in self.SEARCH_KEY))
+
+    def search_fields(self):
+        return {attr: getattr(self, attr) for attr in self.SEARCH_KEY}
+
+    def search_description(self):
+        location = " and ".join(
+            f"{attr} {getattr(self, attr)}" for attr in self.SEARCH_KEY[1:]
+        )
+        return f"{self.query} in {location}"
+
+    def filter_new_listings(self, latest_listings):
+        if latest_listings.empty:
+            return latest_listings
+
+        listing_ids = [str(listing_id) for listing_id in latest_listings.column("listing_id")]
+        new_ids = set(
+            self.get_seen_store().filter_new(self.NAME, self.search_key(), listing_ids)
+        )
+
+        return latest_listings.select(
+            [i for i, listing_id in enumerate(listing_ids) if listing_id in new_ids]
+        )
+
+    def load_watermark(self):
+        if self.WATERMARK_COLUMN is None:
+            return self.watermark
+        if self.coalesced:
+            # Parse as deep as the search that is furthest behind needs
+            self.watermark = oldest_watermark(
+                [scraper.load_watermark() for scraper in self.coalesced]
+            )
+        else:
+            self.watermark = self.get_seen_store().get_watermark(
+                self.NAME, self.search_key()
+            )
+        return self.watermark
+
+    def update_watermark(self, latest_listings):
+        if self.WATERMARK_COLUMN is None or latest_listings.empty:
+            return
+
+        watermark = Watermark.from_listings(
+            latest_listings.column(self.WATERMARK_COLUMN),
+            latest_listings.column("listing_id"),
+            self.time_checked,
+        )
+        if watermark is None:
+            return
+        if self.watermark is not None:
+            watermark = self.watermark.advance(watermark)
+        if watermark != self.watermark:
+            self.get_seen_store().set_watermark(self.NAME, self.search_key(), watermark)
+            self.watermark = watermark
+
+    def listing_distances(self, listings):
+        """
+        km from the search location to every listing, None for a listing
+        without a location. None if the marketplace's listings have no
+        coordinates.
+        """
+        return None
+
+    def local_listings(self, listings):
+        """
+        The listings of a coalesced request this search's own request would
+        have returned: the ones within its RANGE_FILTERS, and within its
+        radius where the listings have coordinates, with this search's
+        fields. Listings without a value for a bounded filter are dropped.
+        """
+        keep = [True] * len(listings)
+        for min_attr, max_attr, column in self.RANGE_FILTERS:
+            low = filter_bound(getattr(self, min_attr, None))
+            high = filter_bound(getattr(self, max_attr, None))
+            if low is None and high is None:
+                continue
+            for i, value in enumerate(listings.column(column)):
+                value = parse_price(value)[0]
+                if (
+                    value is None
+                    or (low is not None and value < low)
+                    or (high is not None and value > high)
+                ):
+                    keep[i] = False
+
+        distances = self.listing_distances(listings)
+        if distances is not None and self.RADIUS_PARAM is not None:
+            radius = float(getattr(self, self.RADIUS_PARAM)) * self.RADIUS_KM
+            for i, distance in enumerate(distances):
+                if distance is None or distance > radius:
+                    keep[i] = False
+
+        positions = [i for i, kept in enumerate(keep) if kept]
+        fields = self.search_fields()
+        local = listings.select(
+            positions, {name: fields[name] for name in fields if name in listings.constants}
+        )
+        if distances is not None and "distance" in listings.columns:
+            local.set_column("distance", [distances[i] for i in positions])
+        return local
+
+    def build_request(self):
+        """Keyword arguments of Transport.fetch for the search request"""
+        raise NotImplementedError
+
+    def parse_response(self, response):
+        raise NotImplementedError
+
+    def parse_task(self):
+        """
+        (module level function, options) that turns the raw response into
+        listing records, for marketplaces whose parsing can run in a
+        ParseExecutor. The records are finished by build_listings().
+        """
+        return None
+
+    def archive_response(self, response):
+        if self.archive is not None:
+            self.archive.record(
+                self.NAME,
+                self.search_key(),
+                self.search_fields(),
+                response,
+                self.time_checked,
+            )
+
+    def record_response(self, response):
+        self.time_checked = datetime.now().timestamp()
+        metrics = self.get_metrics()
+        metrics.inc("responses_total", marketplace=self.NAME, status=response.status)
+        metrics.inc("response_bytes_total", len(response.content), marketplace=self.NAME)
+        metrics.observe("response_bytes", len(response.content), marketplace=self.NAME)
+        self.archive_response(response)
+
+    def record_parsed(self, latest_listings, start):
+        metrics = self.get_metrics()
+        metrics.observe(
+            "stage_seconds",
+            time.perf_counter() - start - self.decode_seconds,
+            marketplace=self.NAME,
+            stage="parse",
+        )
+        metrics.inc("listings_parsed_total", len(latest_listings), marketplace=self.NAME)
+        return latest_listings
+
+    def timed_parse(self, response):
+        self.decode_seconds = 0.0
+        start = time.perf_counter()
+        try:
+            latest_listings = self.parse_response(response)
+        except Exception:
+            self.get_metrics().inc("errors_total", marketplace=self.NAME, stage="parse")
+            raise
+        return self.record_parsed(latest_listings, start)
+
+    def get_listings(self):
+        self.load_watermark()
+        with self.stage("fetch"):
+            response = self.get_transport().fetch(**self.build_request())
+        self.record_response(response)
+        return self.timed_parse(response)
+
+    async def aget_listings(self):
+        self.load_watermark()
+        with self.stage("fetch"):
+            response = await self.get_transport().afetch(**self.build_request())
+        self.record_response(response)
+
+        task = self.parse_task() if self.parse_executor is not None else None
+        if task is None:
+            return self.timed_parse(response)
+
+        func, options = task
+        self.decode_seconds = 0.0
+        start = time.perf_counter()
+        try:
+            records = await self.parse_executor.parse(func, response.content, **options)
+            latest_listings = self.build_listings(records)
+        except Exception:
+            self.get_metrics().inc("errors_total", marketplace=self.NAME, stage="parse")
+            raise
+        return self.record_parsed(latest_listings, start)
+
+    def check_new_listings(self):
+        return self.process_listings(self.get_listings())
+
+    async def acheck_new_listings(self):
+        return self.process_listings(await self.aget_listings())
+
+    def process_listings(self, latest_listings):
+        with self.stage("dedup"):
+            new_listings = self.filter_new_listings(latest_listings)
+        self.get_metrics().inc("new_listings_total", len(new_listings), marketplace=self.NAME)
+
+        ## Notify of new listings
+        print(f"Found {len(new_listings)} new listings for {self.search_description()}")
+        if self.notifier is not None:
+            self.notifier.notify(
+                self.NAME, self.search_key(), self.search_description(), new_listings
+            )
+
+        with self.stage("write"):
+            if not new_listings.empty:
+                os.makedirs(self.DATA_FOLDER, exist_ok=True)
+                self.get_new_listings_log().append_listings(
+                    new_listings, marketplace=self.NAME, search_key=self.search_key()
+                )
+
+                ## Keep the listing history and mark listings seen so notification doesnt come up again
+                new_listings.write_csv(
+                    self.LISTINGS_DB, header=not os.path.exists(self.LISTINGS_DB)
+                )
+                if self.history is not None:
+                    # Only the new listings of a poll are ever turned into a DataFrame
+                    self.history.record(
+                        self.NAME,
+                        self.search_key(),
+                        self.search_fields(),
+                        new_listings.to_dataframe(),
+                        self.time_checked,
+                    )
+                self.get_seen_store().add(
+                    self.NAME, self.search_key(), new_listings.column("listing_id")
+                )
+            self.update_watermark(latest_listings)
+
+        self.get_metrics().inc("polls_total", marketplace=self.NAME)
+        return new_listings
@@ -0,0 +1,244 @@
+import json
+import threading
+import time
+
+
+PREFIX = "swoopa_"
+
+SECONDS_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60,
+)
+BYTES_BUCKETS = tuple(1024 * 4**i for i in range(9))  # 1KB to 64MB
+# Histograms named ..._lag_seconds or ..._interval_seconds, polling scale
+POLL_SECONDS_BUCKETS = (5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600, 86400)
+
+DEFAULT_METRICS_PORT = 9464
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """
+        The q quantile, interpolated linearly within its bucket as
+        Prometheus' histogram_quantile() does. The bucket is narrowed to
+        the smallest and largest value observed, so a quantile never lies
+        outside them.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(list(self.buckets) + [self.max], self.counts):
+            if count and cumulative + count >= rank:
+                low = max(lower, self.min)
+                high = min(bound, self.max)
+                return low + (high - low) * max(rank - cumulative, 0) / count
+            cumulative += count
+            lower = bound
+        return self.max
+
+
+def label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Timer:
+    """
+    Times a block into a seconds histogram. An exception escaping the block
+    counts as an error of the same labels, cancellation does not.
+    """
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.start = None
+        self.elapsed = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self.start
+        self.metrics.observe(self.name, self.elapsed, **self.labels)
+        if exc_type is not None and issubclass(exc_type, Exception):
+            self.metrics.inc("errors_total", **self.labels)
+        return False
+
+
+class Metrics:
+    """
+    Counters and histograms keyed by name and labels, safe to update from
+    the event loop and worker threads alike. Histograms of names ending in
+    _bytes use byte buckets, _lag_seconds and _interval_seconds ones go
+    up to a day, everything else is timed in seconds.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.server = None
+
+    def inc(self, name, value=1, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                if name.endswith("_bytes"):
+                    buckets = BYTES_BUCKETS
+                elif name.endswith(("_lag_seconds", "_interval_seconds")):
+                    buckets = POLL_SECONDS_BUCKETS
+                else:
+                    buckets = SECONDS_BUCKETS
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def timer(self, name, **labels):
+        return Timer(self, name, labels)
+
+    def render_prometheus(self):
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+            typed = set()
+            for (name, key), value in counters:
+                if name not in typed:
+                    lines.append(f"# TYPE {PREFIX}{name} counter")
+                    typed.add(name)
+                lines.append(f"{PREFIX}{name}{format_labels(key)} {value}")
+
+            for (name, key), histogram in histograms:
+                if name not in typed:
+                    lines.append(f"# TYPE {PREFIX}{name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        f"{PREFIX}{name}_bucket{format_labels(key, [('le', bound)])} {cumulative}"
+                    )
+                lines.append(
+                    f"{PREFIX}{name}_bucket{format_labels(key, [('le', '+Inf')])} {histogram.count}"
+                )
+                lines.append(f"{PREFIX}{name}_sum{format_labels(key)} {histogram.sum}")
+                lines.append(f"{PREFIX}{name}_count{format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Everything recorded so far as plain JSON-able data"""
+        with self.lock:
+            counters = [
+                {"name": name, "labels": dict(key), "value": value}
+                for (name, key), value in sorted(self.counters.items())
+            ]
+            histograms = [
+                {
+                    "name": name,
+                    "labels": dict(key),
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "mean": histogram.sum / histogram.count if histogram.count else None,
+                    "p50": histogram.quantile(0.5),
+                    "p95": histogram.quantile(0.95),
+                    "p99": histogram.quantile(0.99),
+                    "max": histogram.max,
+                }
+                for (name, key), histogram in sorted(
+                    self.histograms.items(), key=lambda item: item[0]
+                )
+            ]
+        return {
+            "started": self.started,
+            "duration": time.time() - self.started,
+            "counters": counters,
+            "histograms": histograms,
+        }
+
+    def write_summary(self, path):
+        with open(path, "w") as file:
+            json.dump(self.summary(), file, indent=2)
+
+    def serve(self, port: int = DEFAULT_METRICS_PORT, host: str = "127.0.0.1"):
+        """
+        Serve /metrics (Prometheus text format) and /metrics.json (summary())
+        from a background thread.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = metrics.render_prometheus().encode()
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body = json.dumps(metrics.summary()).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+_default_metrics = None
+
+
+def default_metrics():
+    global _default_metrics
+    if _default_metrics is None:
+        _default_metrics = Metrics()
+    return _default_metrics
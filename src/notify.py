@@ -0,0 +1,369 @@
+import asyncio
+import collections
+import json
+import smtplib
+from email.message import EmailMessage
+
+from listing_batch import listing_records
+from metrics import default_metrics
+
+
+DEFAULT_TIMEOUT = 30  # seconds
+CLOSE_TIMEOUT = 10  # seconds to deliver what is still queued on shutdown
+
+
+class NotifyError(Exception):
+    pass
+
+
+class Sink:
+    """
+    Destination of new-listing notifications. Every sink has its own
+    bounded queue of listings (the oldest are dropped once it is full),
+    delivers up to `batch_size` listings at once after waiting up to
+    `batch_wait` seconds for a batch to fill, and has at most `concurrency`
+    deliveries in flight. While a slow sink is busy its queue grows into
+    bigger batches instead of holding up anything else.
+    """
+
+    name = None
+    batch_size = 500
+    batch_wait = 1.0  # seconds
+    queue_size = 20000  # listings
+    concurrency = 1
+    retries = 2
+    retry_wait = 1.0  # seconds, doubled on every retry
+
+    def __init__(self, name=None, batch_size=None, batch_wait=None, queue_size=None, concurrency=None):
+        self.name = name or self.name
+        self.batch_size = batch_size or self.batch_size
+        self.batch_wait = self.batch_wait if batch_wait is None else batch_wait
+        self.queue_size = queue_size or self.queue_size
+        self.concurrency = concurrency or self.concurrency
+        self.queue = collections.deque(maxlen=self.queue_size)
+
+    async def deliver(self, listings):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class WebhookSink(Sink):
+    """POSTs {"count": n, "listings": [...]} as JSON, over kept-alive connections"""
+
+    name = "webhook"
+    concurrency = 4
+
+    def __init__(self, url, headers=None, timeout=DEFAULT_TIMEOUT, **options):
+        super().__init__(**options)
+        self.url = url
+        self.headers = headers
+        self.timeout = timeout
+        self.session = None
+
+    def get_session(self):
+        import aiohttp
+
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    async def deliver(self, listings):
+        import aiohttp
+
+        async with self.get_session().post(
+            self.url,
+            json={"count": len(listings), "listings": listings},
+            headers=self.headers,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        ) as response:
+            await response.read()
+            if response.status >= 400:
+                raise NotifyError(f"{response.status} from {self.url}")
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+class SMTPSink(Sink):
+    """
+    One email per batch. The SMTP connection is kept open between batches
+    and opened again when the server dropped it.
+    """
+
+    name = "smtp"
+    batch_size = 200
+    batch_wait = 5.0
+
+    def __init__(
+        self,
+        host,
+        sender,
+        recipients,
+        port=25,
+        username=None,
+        password=None,
+        starttls=False,
+        timeout=DEFAULT_TIMEOUT,
+        **options,
+    ):
+        super().__init__(**options)
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = [recipients] if isinstance(recipients, str) else list(recipients)
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.smtp = None
+
+    def connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password)
+        return smtp
+
+    def message(self, listings):
+        message = EmailMessage()
+        message["Subject"] = f"{len(listings)} new listings"
+        message["From"] = self.sender
+        message["To"] = ", ".join(self.recipients)
+        message.set_content(
+            "\n\n".join(
+                f"{listing.get('title')} - {listing.get('price')}\n{listing.get('url')}"
+                for listing in listings
+            )
+        )
+        return message
+
+    def send(self, listings):
+        message = self.message(listings)
+        if self.smtp is None:
+            self.smtp = self.connect()
+        try:
+            self.smtp.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            self.smtp = self.connect()
+            self.smtp.send_message(message)
+
+    def quit(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except smtplib.SMTPException:
+                pass
+            self.smtp = None
+
+    async def deliver(self, listings):
+        await asyncio.get_running_loop().run_in_executor(None, self.send, listings)
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.quit)
+
+
+class FileSink(Sink):
+    """Appends every listing as a JSON line to a local file"""
+
+    name = "file"
+
+    def __init__(self, path, **options):
+        super().__init__(**options)
+        self.path = path
+
+    def write(self, listings):
+        with open(self.path, "a") as file:
+            file.write("".join(json.dumps(listing) + "\n" for listing in listings))
+
+    async def deliver(self, listings):
+        await asyncio.get_running_loop().run_in_executor(None, self.write, listings)
+
+
+class UnixSocketSink(Sink):
+    """
+    Writes every batch as one JSON line to a Unix socket, over one
+    connection that is opened again after an error.
+    """
+
+    name = "unix_socket"
+
+    def __init__(self, path, **options):
+        super().__init__(**options)
+        self.path = path
+        self.writer = None
+
+    async def deliver(self, listings):
+        if self.writer is None:
+            _, self.writer = await asyncio.open_unix_connection(self.path)
+        try:
+            self.writer.write(json.dumps({"count": len(listings), "listings": listings}).encode() + b"\n")
+            await self.writer.drain()
+        except (ConnectionError, OSError):
+            self.writer.close()
+            self.writer = None
+            raise
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+            self.writer = None
+
+
+SINK_TYPES = {
+    "webhook": WebhookSink,
+    "smtp": SMTPSink,
+    "file": FileSink,
+    "unix_socket": UnixSocketSink,
+}
+
+
+def create_sink(config: dict):
+    options = dict(config)
+    return SINK_TYPES[options.pop("type")](**options)
+
+
+def load_sinks(path):
+    """
+    Sinks out of a JSON list of sink options, e.g.
+
+    [{"type": "webhook", "url": "http://localhost:8000/listings", "batch_size": 1000},
+     {"type": "file", "path": "./data/notifications.jsonl"}]
+    """
+    with open(path) as file:
+        return [create_sink(config) for config in json.load(file)]
+
+
+class Notifier:
+    """
+    Fans new listings out to every sink. notify() can be called from any
+    thread and never blocks: it only hands the listings to the event loop,
+    where they are added to the queue of every sink. Each sink is drained
+    by its own task, so a slow or failing sink never holds up polling or
+    the other sinks.
+    """
+
+    def __init__(self, sinks, metrics=None):
+        self.sinks = sinks
+        self.metrics = metrics or default_metrics()
+        self.loop = None
+        self.wakeups = {}
+        self.tasks = []
+        self.deliveries = set()
+        self.closing = None
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.closing = asyncio.Event()
+        for sink in self.sinks:
+            self.wakeups[sink] = asyncio.Event()
+            self.tasks.append(asyncio.create_task(self.run_sink(sink)))
+
+    def notify(self, marketplace: str, search_key: str, search: str, listings):
+        """`listings` is a ListingBatch or a DataFrame"""
+        if listings.empty or self.loop is None:
+            return
+        listings = [
+            {"marketplace": marketplace, "search_key": search_key, "search": search, **record}
+            for record in listing_records(listings)
+        ]
+        self.loop.call_soon_threadsafe(self.enqueue, listings)
+
+    def enqueue(self, listings):
+        for sink in self.sinks:
+            dropped = len(sink.queue) + len(listings) - sink.queue_size
+            if dropped > 0:
+                self.metrics.inc("notifications_dropped_total", dropped, sink=sink.name)
+            sink.queue.extend(listings)
+            self.wakeups[sink].set()
+
+    async def run_sink(self, sink):
+        semaphore = asyncio.Semaphore(sink.concurrency)
+        wakeup = self.wakeups[sink]
+        while True:
+            if not sink.queue:
+                if self.closing.is_set():
+                    return
+                wakeup.clear()
+                await wakeup.wait()
+                continue
+
+            if len(sink.queue) < sink.batch_size and not self.closing.is_set():
+                # Give a burst the chance to go out as one batch, close()
+                # cuts the wait short
+                try:
+                    await asyncio.wait_for(self.closing.wait(), sink.batch_wait)
+                except asyncio.TimeoutError:
+                    pass
+
+            # Taken once a delivery slot is free, so a busy sink sends
+            # everything that queued up meanwhile in one batch
+            await semaphore.acquire()
+            batch = [sink.queue.popleft() for _ in range(min(sink.batch_size, len(sink.queue)))]
+            if not batch:
+                semaphore.release()
+                continue
+            task = asyncio.create_task(self.deliver(sink, batch, semaphore))
+            self.deliveries.add(task)
+            task.add_done_callback(self.deliveries.discard)
+
+    async def deliver(self, sink, batch, semaphore):
+        try:
+            for attempt in range(sink.retries + 1):
+                try:
+                    with self.metrics.timer("notify_seconds", sink=sink.name):
+                        await sink.deliver(batch)
+                except Exception as e:
+                    if attempt == sink.retries:
+                        self.metrics.inc("notifications_failed_total", len(batch), sink=sink.name)
+                        print(f"Could not notify {sink.name} of {len(batch)} listings: {e!r}")
+                        return
+                    await asyncio.sleep(sink.retry_wait * 2**attempt)
+                else:
+                    self.metrics.inc("notifications_sent_total", len(batch), sink=sink.name)
+                    self.metrics.inc("notification_batches_total", sink=sink.name)
+                    return
+        finally:
+            semaphore.release()
+
+    async def close(self, timeout: float = CLOSE_TIMEOUT):
+        """Deliver what is queued, for up to `timeout` seconds, and close the sinks"""
+        if self.closing is None:
+            # Never started
+            for sink in self.sinks:
+                await sink.close()
+            return
+
+        # Listings notify() handed over before close() still get queued
+        await asyncio.sleep(0)
+        self.closing.set()
+        for wakeup in self.wakeups.values():
+            wakeup.set()
+
+        # Sink tasks return once their queue is empty, then the deliveries
+        # they started get what is left of the timeout
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        pending = set()
+        if self.tasks:
+            _, pending = await asyncio.wait(self.tasks, timeout=timeout)
+        if self.deliveries:
+            _, late = await asyncio.wait(
+                set(self.deliveries), timeout=max(deadline - loop.time(), 0)
+            )
+            pending |= late
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        for sink in self.sinks:
+            await sink.close()
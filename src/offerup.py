@@ -1,11 +1,10 @@
-import requests
 import json
-import pandas as pd
-from datetime import datetime
 import os
 import argparse
+from listing_batch import ListingBatch
+from marketplace import Marketplace
 
-API_URL = "https://offerup.com/api/graphql"
+API_URL = os.environ.get("OFFERUP_API_URL", "https://offerup.com/api/graphql")
 HEADERS = {
     "Content-Type": "application/json",
     "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
@@ -13,10 +12,75 @@ HEADERS = {
 DATA_FOLDER = "./data/offerup"
 LISTINGS_DB = f"{DATA_FOLDER}/LISING_DB.csv"
 
-os.makedirs(DATA_FOLDER, exist_ok=True)
-
-
-class OfferUp:
+COLUMNS = [
+    "query",
+    "lat",
+    "long",
+    "listing_type",
+    "listing_type_name",
+    "listing_id",
+    "condition_text",
+    "flags",
+    "image_url",
+    "is_firm_price",
+    "location_name",
+    "price",
+    "title",
+    "vehicle_miles",
+    "url",
+    "time_found",
+]
+# Full feed query of the offerup.com web app, ads, filters and debug blocks
+# included
+FULL_QUERY = "query GetModularFeed($searchParams: [SearchParam], $debug: Boolean = false) {  modularFeed(params: $searchParams, debug: $debug) {    analyticsData {      requestId      searchPerformedEventUniqueId      searchSessionId      __typename    }    categoryInfo {      categoryId      isForcedCategory      __typename    }    feedAdditions    filters {      ...modularFilterNumericRange      ...modularFilterSelectionList      __typename    }    legacyFeedOptions {      ...legacyFeedOptionListSelection      ...legacyFeedOptionNumericRange      __typename    }    looseTiles {      ...modularTileBanner      ...modularTileBingAd      ...modularTileGoogleDisplayAd      ...modularTileJob      ...modularTileEmptyState      ...modularTileListing      ...modularTileLocalDisplayAd      ...modularTileSearchAlert      ...modularTileSellerAd      ...modularModuleTileAdsPostXAd      __typename    }    modules {      ...modularGridModule      __typename    }    pageCursor    query {      ...modularQueryInfo      __typename    }    requestTimeMetadata {      resolverComputationTimeSeconds      serviceRequestTimeSeconds      totalResolverTimeSeconds      __typename    }    searchAlert {      alertId      alertStatus      __typename    }    debugInformation @include(if: $debug) {      rankedListings {        listingId        attributes {          key          value          __typename        }        __typename      }      lastViewedItems {        listingId        attributes {          key          value          __typename        }        __typename      }      categoryAffinities {        affinity        count        decay        affinityOwner        __typename      }      rankingStats {        key        value        __typename      }      __typename    }    __typename  }}fragment modularFilterNumericRange on ModularFeedNumericRangeFilter {  isExpandedHighlight  lowerBound {    ...modularFilterNumericRangeBound    __typename  }  shortcutLabel  shortcutRank  subTitle  targetName  title  type  upperBound {    ...modularFilterNumericRangeBound    __typename  }  __typename}fragment modularFilterNumericRangeBound on ModularFeedNumericRangeFilterNumericRangeBound {  label  limit  placeholderText  targetName  value  __typename}fragment modularFilterSelectionList on ModularFeedSelectionListFilter {  targetName  title  subTitle  shortcutLabel  shortcutRank  type  isExpandedHighlight  options {    ...modularFilterSelectionListOption    __typename  }  __typename}fragment modularFilterSelectionListOption on ModularFeedSelectionListFilterOption {  isDefault  isSelected  label  subLabel  value  __typename}fragment legacyFeedOptionListSelection on FeedOptionListSelection {  label  labelShort  name  options {    default    label    labelShort    selected    subLabel    value    __typename  }  position  queryParam  type  __typename}fragment legacyFeedOptionNumericRange on FeedOptionNumericRange {  label  labelShort  leftQueryParam  lowerBound  name  options {    currentValue    label    textHint    __typename  }  position  rightQueryParam  type  units  upperBound  __typename}fragment modularTileBanner on ModularFeedTileBanner {  tileId  tileType  title  __typename}fragment modularTileBingAd on ModularFeedTileBingAd {  tileId  bingAd {    ouAdId    adExperimentId    adNetwork    adRequestId    adTileType    adSettings {      repeatClickRefractoryPeriodMillis      __typename    }    bingClientId    clickFeedbackUrl    clickReturnUrl    contentUrl    deepLinkEnabled    experimentDataHash    image {      height      url      width      __typename    }    impressionFeedbackUrl    impressionUrls    viewableImpressionUrls    installmentInfo {      amount      description      downPayment      __typename    }    itemName    lowPrice    price    searchId    sellerName    templateFields {      key      value      __typename    }    __typename  }  tileType  __typename}fragment modularTileGoogleDisplayAd on ModularFeedTileGoogleDisplayAd {  tileId  googleDisplayAd {    ouAdId    additionalSizes    adExperimentId    adHeight    adNetwork    adPage    adRequestId    adTileType    adWidth    adaptive    channel    clickFeedbackUrl    clientId    contentUrl    customTargeting {      key      values      __typename    }    displayAdType    errorDrawable {      actionPath      listImage {        height        url        width        __typename      }      __typename    }    experimentDataHash    formatIds    impressionFeedbackUrl    personalizationProperties {      key      values      __typename    }    prebidConfigs {      key      values {        timeout        tamSlotUUID        liftoffPlacementIDs        __typename      }      __typename    }    renderLocation    searchId    searchQuery    templateId    __typename  }  tileType  __typename}fragment modularTileJob on ModularFeedTileJob {  tileId  tileType  job {    address {      city      state      zipcode      __typename    }    companyName    datePosted    image {      height      url      width      __typename    }    industry    jobId    jobListingUrl    jobOwnerId    pills {      text      type      __typename    }    title    apply {      method      value      __typename    }    wageDisplayValue    provider    __typename  }  __typename}fragment modularTileEmptyState on ModularFeedTileEmptyState {  tileId  tileType  title  description  iconType  __typename}fragment modularTileListing on ModularFeedTileListing {  tileId  listing {    ...modularListing    __typename  }  tileType  __typename}fragment modularListing on ModularFeedListing {  listingId  conditionText  flags  image {    height    url    width    __typename  }  isFirmPrice  locationName  price  title  vehicleMiles  __typename}fragment modularTileLocalDisplayAd on ModularFeedTileLocalDisplayAd {  tileId  localDisplayAd {    ouAdId    adExperimentId    adNetwork    adRequestId    adTileType    advertiserId    businessName    callToAction    callToActionType    clickFeedbackUrl    contentUrl    experimentDataHash    headline    image {      height      url      width      __typename    }    impressionFeedbackUrl    searchId    __typename  }  tileType  __typename}fragment modularTileSearchAlert on ModularFeedTileSearchAlert {  tileId  tileType  title  __typename}fragment modularTileSellerAd on ModularFeedTileSellerAd {  tileId  listing {    ...modularListing    __typename  }  sellerAd {    ouAdId    adId    adExperimentId    adNetwork    adRequestId    adTileType    clickFeedbackUrl    experimentDataHash    impressionFeedbackUrl    searchId    __typename  }  tileType  __typename}fragment modularModuleTileAdsPostXAd on ModularFeedTileAdsPostXAd {  ...modularTileAdsPostXAd  moduleId  moduleRank  moduleType  __typename}fragment modularTileAdsPostXAd on ModularFeedTileAdsPostXAd {  tileId  adsPostXAd {    ouAdId    adExperimentId    adNetwork    adRequestId    adTileType    clickFeedbackUrl    experimentDataHash    impressionFeedbackUrl    searchId    offer {      beacons {        noThanksClick        close        __typename      }      title      description      clickUrl      image      pixel      ctaYes      ctaNo      __typename    }    __typename  }  tileType  __typename}fragment modularGridModule on ModularFeedModuleGrid {  moduleId  collection  formFactor  grid {    actionPath    tiles {      ...modularModuleTileBingAd      ...modularModuleTileGoogleDisplayAd      ...modularModuleTileListing      ...modularModuleTileLocalDisplayAd      ...modularModuleTileSellerAd      __typename    }    __typename  }  moduleType  rank  rowIndex  searchId  subTitle  title  infoActionPath  __typename}fragment modularModuleTileBingAd on ModularFeedTileBingAd {  ...modularTileBingAd  moduleId  moduleRank  moduleType  __typename}fragment modularModuleTileGoogleDisplayAd on ModularFeedTileGoogleDisplayAd {  ...modularTileGoogleDisplayAd  moduleId  moduleRank  moduleType  __typename}fragment modularModuleTileListing on ModularFeedTileListing {  ...modularTileListing  moduleId  moduleRank  moduleType  __typename}fragment modularModuleTileLocalDisplayAd on ModularFeedTileLocalDisplayAd {  ...modularTileLocalDisplayAd  moduleId  moduleRank  moduleType  __typename}fragment modularModuleTileSellerAd on ModularFeedTileSellerAd {  ...modularTileSellerAd  moduleId  moduleRank  moduleType  __typename}fragment modularQueryInfo on ModularFeedQueryInfo {  appliedQuery  decisionType  originalQuery  suggestedQuery  __typename}"
+
+# Only the tiles and fields parse_listing() reads
+LISTING_QUERY = (
+    "query GetModularFeed($searchParams: [SearchParam]) {"
+    "  modularFeed(params: $searchParams) {"
+    "    looseTiles {"
+    "      ... on ModularFeedTileListing { tileType listing { ...listingFields } }"
+    "      ... on ModularFeedTileSellerAd { tileType listing { ...listingFields } }"
+    "      __typename"
+    "    }"
+    "  }"
+    "}"
+    "fragment listingFields on ModularFeedListing {"
+    "  listingId conditionText flags image { url } isFirmPrice locationName"
+    "  price title vehicleMiles"
+    "}"
+)
+
+
+class QueryTemplate:
+    """
+    GraphQL request body serialized up to the search params, encode() only
+    has to splice in the params of a search.
+    """
+
+    def __init__(self, query: str, variables: dict = None):
+        variables = dict(variables or {}, searchParams=None)
+        body = json.dumps({"query": query, "variables": variables})
+        self.prefix, _, self.suffix = body.rpartition('"searchParams": null')
+        self.prefix += '"searchParams": '
+
+    def encode(self, search_params_json: str):
+        return (self.prefix + search_params_json + self.suffix).encode()
+
+
+FULL_QUERY_TEMPLATE = QueryTemplate(FULL_QUERY, {"debug": False})
+LISTING_QUERY_TEMPLATE = QueryTemplate(LISTING_QUERY)
+
+
+class OfferUp(Marketplace):
+    NAME = "offerup"
+    DATA_FOLDER = DATA_FOLDER
+    LISTINGS_DB = LISTINGS_DB
+    COALESCE = True
+    RANGE_FILTERS = (("min_price", "max_price", "price"),)
+    RADIUS_PARAM = "distance"
+    RADIUS_KM = 1.609344  # the radius is in miles
+    PAGE_SIZE_PARAM = "limit"
 
     def __init__(
         self,
@@ -28,6 +92,7 @@ class OfferUp:
         distance: str = "50",
         limit: str = "50",
         sort_by: str = "-posted",
+        full_query: bool = False,
     ):
         self.query = query
         self.lat = lat
@@ -35,85 +100,49 @@ class OfferUp:
         self.distance = distance
         self.min_price = min_price
         self.max_price = max_price
-        self.payload = {
-            "query": "query GetModularFeed($searchParams: [SearchParam], $debug: Boolean = false) {  modularFeed(params: $searchParams, debug: $debug) {    analyticsData {      requestId      searchPerformedEventUniqueId      searchSessionId      __typename    }    categoryInfo {      categoryId      isForcedCategory      __typename    }    feedAdditions    filters {      ...modularFilterNumericRange      ...modularFilterSelectionList      __typename    }    legacyFeedOptions {      ...legacyFeedOptionListSelection      ...legacyFeedOptionNumericRange      __typename    }    looseTiles {      ...modularTileBanner      ...modularTileBingAd      ...modularTileGoogleDisplayAd      ...modularTileJob      ...modularTileEmptyState      ...modularTileListing      ...modularTileLocalDisplayAd      ...modularTileSearchAlert      ...modularTileSellerAd      ...modularModuleTileAdsPostXAd      __typename    }    modules {      ...modularGridModule      __typename    }    pageCursor    query {      ...modularQueryInfo      __typename    }    requestTimeMetadata {      resolverComputationTimeSeconds      serviceRequestTimeSeconds      totalResolverTimeSeconds      __typename    }    searchAlert {      alertId      alertStatus      __typename    }    debugInformation @include(if: $debug) {      rankedListings {        listingId        attributes {          key          value          __typename        }        __typename      }      lastViewedItems {        listingId        attributes {          key          value          __typename        }        __typename      }      categoryAffinities {        affinity        count        decay        affinityOwner        __typename      }      rankingStats {        key        value        __typename      }      __typename    }    __typename  }}fragment modularFilterNumericRange on ModularFeedNumericRangeFilter {  isExpandedHighlight  lowerBound {    ...modularFilterNumericRangeBound    __typename  }  shortcutLabel  shortcutRank  subTitle  targetName  title  type  upperBound {    ...modularFilterNumericRangeBound    __typename  }  __typename}fragment modularFilterNumericRangeBound on ModularFeedNumericRangeFilterNumericRangeBound {  label  limit  placeholderText  targetName  value  __typename}fragment modularFilterSelectionList on ModularFeedSelectionListFilter {  targetName  title  subTitle  shortcutLabel  shortcutRank  type  isExpandedHighlight  options {    ...modularFilterSelectionListOption    __typename  }  __typename}fragment modularFilterSelectionListOption on ModularFeedSelectionListFilterOption {  isDefault  isSelected  label  subLabel  value  __typename}fragment legacyFeedOptionListSelection on FeedOptionListSelection {  label  labelShort  name  options {    default    label    labelShort    selected    subLabel    value    __typename  }  position  queryParam  type  __typename}fragment legacyFeedOptionNumericRange on FeedOptionNumericRange {  label  labelShort  leftQueryParam  lowerBound  name  options {    currentValue    label    textHint    __typename  }  position  rightQueryParam  type  units  upperBound  __typename}fragment modularTileBanner on ModularFeedTileBanner {  tileId  tileType  title  __typename}fragment modularTileBingAd on ModularFeedTileBingAd {  tileId  bingAd {    ouAdId    adExperimentId    adNetwork    adRequestId    adTileType    adSettings {      repeatClickRefractoryPeriodMillis      __typename    }    bingClientId    clickFeedbackUrl    clickReturnUrl    contentUrl    deepLinkEnabled    experimentDataHash    image {      height      url      width      __typename    }    impressionFeedbackUrl    impressionUrls    viewableImpressionUrls    installmentInfo {      amount      description      downPayment      __typename    }    itemName    lowPrice    price    searchId    sellerName    templateFields {      key      value      __typename    }    __typename  }  tileType  __typename}fragment modularTileGoogleDisplayAd on ModularFeedTileGoogleDisplayAd {  tileId  googleDisplayAd {    ouAdId    additionalSizes    adExperimentId    adHeight    adNetwork    adPage    adRequestId    adTileType    adWidth    adaptive    channel    clickFeedbackUrl    clientId    contentUrl    customTargeting {      key      values      __typename    }    displayAdType    errorDrawable {      actionPath      listImage {        height        url        width        __typename      }      __typename    }    experimentDataHash    formatIds    impressionFeedbackUrl    personalizationProperties {      key      values      __typename    }    prebidConfigs {      key      values {        timeout        tamSlotUUID        liftoffPlacementIDs        __typename      }      __typename    }    renderLocation    searchId    searchQuery    templateId    __typename  }  tileType  __typename}fragment modularTileJob on ModularFeedTileJob {  tileId  tileType  job {    address {      city      state      zipcode      __typename    }    companyName    datePosted    image {      height      url      width      __typename    }    industry    jobId    jobListingUrl    jobOwnerId    pills {      text      type      __typename    }    title    apply {      method      value      __typename    }    wageDisplayValue    provider    __typename  }  __typename}fragment modularTileEmptyState on ModularFeedTileEmptyState {  tileId  tileType  title  description  iconType  __typename}fragment modularTileListing on ModularFeedTileListing {  tileId  listing {    ...modularListing    __typename  }  tileType  __typename}fragment modularListing on ModularFeedListing {  listingId  conditionText  flags  image {    height    url    width    __typename  }  isFirmPrice  locationName  price  title  vehicleMiles  __typename}fragment modularTileLocalDisplayAd on ModularFeedTileLocalDisplayAd {  tileId  localDisplayAd {    ouAdId    adExperimentId    adNetwork    adRequestId    adTileType    advertiserId    businessName    callToAction    callToActionType    clickFeedbackUrl    contentUrl    experimentDataHash    headline    image {      height      url      width      __typename    }    impressionFeedbackUrl    searchId    __typename  }  tileType  __typename}fragment modularTileSearchAlert on ModularFeedTileSearchAlert {  tileId  tileType  title  __typename}fragment modularTileSellerAd on ModularFeedTileSellerAd {  tileId  listing {    ...modularListing    __typename  }  sellerAd {    ouAdId    adId    adExperimentId    adNetwork    adRequestId    adTileType    clickFeedbackUrl    experimentDataHash    impressionFeedbackUrl    searchId    __typename  }  tileType  __typename}fragment modularModuleTileAdsPostXAd on ModularFeedTileAdsPostXAd {  ...modularTileAdsPostXAd  moduleId  moduleRank  moduleType  __typename}fragment modularTileAdsPostXAd on ModularFeedTileAdsPostXAd {  tileId  adsPostXAd {    ouAdId    adExperimentId    adNetwork    adRequestId    adTileType    clickFeedbackUrl    experimentDataHash    impressionFeedbackUrl    searchId    offer {      beacons {        noThanksClick        close        __typename      }      title      description      clickUrl      image      pixel      ctaYes      ctaNo      __typename    }    __typename  }  tileType  __typename}fragment modularGridModule on ModularFeedModuleGrid {  moduleId  collection  formFactor  grid {    actionPath    tiles {      ...modularModuleTileBingAd      ...modularModuleTileGoogleDisplayAd      ...modularModuleTileListing      ...modularModuleTileLocalDisplayAd      ...modularModuleTileSellerAd      __typename    }    __typename  }  moduleType  rank  rowIndex  searchId  subTitle  title  infoActionPath  __typename}fragment modularModuleTileBingAd on ModularFeedTileBingAd {  ...modularTileBingAd  moduleId  moduleRank  moduleType  __typename}fragment modularModuleTileGoogleDisplayAd on ModularFeedTileGoogleDisplayAd {  ...modularTileGoogleDisplayAd  moduleId  moduleRank  moduleType  __typename}fragment modularModuleTileListing on ModularFeedTileListing {  ...modularTileListing  moduleId  moduleRank  moduleType  __typename}fragment modularModuleTileLocalDisplayAd on ModularFeedTileLocalDisplayAd {  ...modularTileLocalDisplayAd  moduleId  moduleRank  moduleType  __typename}fragment modularModuleTileSellerAd on ModularFeedTileSellerAd {  ...modularTileSellerAd  moduleId  moduleRank  moduleType  __typename}fragment modularQueryInfo on ModularFeedQueryInfo {  appliedQuery  decisionType  originalQuery  suggestedQuery  __typename}",
-            "variables": {
-                "debug": False,
-                "searchParams": [
-                    {"key": "q", "value": self.query},
-                    {"key": "platform", "value": "web"},
-                    {"key": "lon", "value": self.long},
-                    {"key": "lat", "value": self.lat},
-                    {"key": "limit", "value": limit},
-                    {"key": "SORT", "value": sort_by},
-                    {"key": "DISTANCE", "value": self.distance},
-                ],
-            },
-        }
-
+        self.full_query = full_query
+
+        search_params = [
+            {"key": "q", "value": self.query},
+            {"key": "platform", "value": "web"},
+            {"key": "lon", "value": self.long},
+            {"key": "lat", "value": self.lat},
+            {"key": "limit", "value": limit},
+            {"key": "SORT", "value": sort_by},
+            {"key": "DISTANCE", "value": self.distance},
+        ]
         if self.min_price:
-            self.payload["variables"]["searchParams"].append(
-                {"key": "PRICE_MIN", "value": min_price}
-            )
+            search_params.append({"key": "PRICE_MIN", "value": min_price})
         if self.max_price:
-            self.payload["variables"]["searchParams"].append(
-                {"key": "PRICE_MAX", "value": max_price}
-            )
-
-    def new_listings_filename(self):
-
-        return f"{DATA_FOLDER}/NEW_LISTINGS_{self.time_checked}.csv"
-
-    def get_listings(self):
-        response = requests.post(
-            API_URL, headers=HEADERS, data=json.dumps(self.payload)
-        )
-        self.time_checked = datetime.now().timestamp()
-
-        listings_df = self.parse_listing(response.json())
-        return listings_df
-
-    def check_new_listings(self):
-        latest_listings_df = self.get_listings()
-        if os.path.exists(LISTINGS_DB):
-
-            old_listings_df = pd.read_csv(LISTINGS_DB)
-
-            latest_listings_df["long"] = latest_listings_df["long"].astype(float)
-            latest_listings_df["lat"] = latest_listings_df["lat"].astype(float)
-
-            old_listings_df["long"] = old_listings_df["long"].astype(float)
-            old_listings_df["lat"] = old_listings_df["lat"].astype(float)
-
-            merge_df = latest_listings_df.merge(
-                old_listings_df[["listing_id", "query", "long", "lat"]],
-                on=["listing_id", "query", "long", "lat"],
-                how="left",
-                indicator=True,
-            )
-            new_listings_df = merge_df[merge_df["_merge"] == "left_only"]
-
-        else:
-            new_listings_df = latest_listings_df
-
-        ## Notify of new listings
-        print(
-            f"Found {len(new_listings_df)} new listings for {self.query} in lat {self.lat} and long {self.long}"
-        )
-        new_listings_df.to_csv(self.new_listings_filename(), index=None)
-
-        ## Add new listing df to the listing db so notification doesnt come up again
-        if "_merge" in new_listings_df.columns:
-            new_listings_df = new_listings_df.drop(columns=["_merge"])
+            search_params.append({"key": "PRICE_MAX", "value": max_price})
+
+        # The search never changes, serialize the request body once
+        template = FULL_QUERY_TEMPLATE if full_query else LISTING_QUERY_TEMPLATE
+        self.body = template.encode(json.dumps(search_params))
+
+    def build_request(self):
+        return {
+            "method": "POST",
+            "url": API_URL,
+            "headers": HEADERS,
+            "data": self.body,
+        }
 
-        new_listings_df.to_csv(
-            LISTINGS_DB, mode="a", index=None, header=not os.path.exists(LISTINGS_DB)
-        )
+    def parse_response(self, response):
+        return self.parse_listing(self.decode_json(response))
 
     def parse_listing(self, listing_json: dict):
 
         records = listing_json.get("data").get("modularFeed").get("looseTiles")
-        listing_data = []
+        listings = ListingBatch(
+            COLUMNS,
+            constants={
+                "query": self.query,
+                "lat": self.lat,
+                "long": self.long,
+                "time_found": self.time_checked,
+            },
+        )
 
         for record in records:
             if record.get("listing"):
@@ -132,28 +161,21 @@ class OfferUp:
                 vehicle_miles = listing.get("vehicleMiles")
                 url = f"https://offerup.com/item/detail/{listing_id}"
 
-                listing_data.append(
-                    {
-                        "query": self.query,
-                        "lat": self.lat,
-                        "long": self.long,
-                        "listing_type": listing_type,
-                        "listing_type_name": listing_type_name,
-                        "listing_id": listing_id,
-                        "condition_text": condition_text,
-                        "flags": flags,
-                        "image_url": image_url,
-                        "is_firm_price": is_firm_price,
-                        "location_name": location_name,
-                        "price": price,
-                        "title": title,
-                        "vehicle_miles": vehicle_miles,
-                        "url": url,
-                        "time_found": self.time_checked,
-                    }
+                listings.append(
+                    listing_type,
+                    listing_type_name,
+                    listing_id,
+                    condition_text,
+                    flags,
+                    image_url,
+                    is_firm_price,
+                    location_name,
+                    price,
+                    title,
+                    vehicle_miles,
+                    url,
                 )
-        listing_df = pd.DataFrame(listing_data)
-        return listing_df
+        return listings
 
 
 if __name__ == "__main__":
@@ -178,6 +200,12 @@ if __name__ == "__main__":
     parser.add_argument(
         "-max", "--max_price", help="Maximum Price of result", type=str, default=None
     )
+    parser.add_argument(
+        "-fq",
+        "--full_query",
+        help="Request the full web app feed instead of only the listing fields",
+        action="store_true",
+    )
     args = parser.parse_args()
 
     user_search = OfferUp(
@@ -186,5 +214,6 @@ if __name__ == "__main__":
         str(args.long),
         min_price=str(args.min_price),
         max_price=str(args.max_price),
+        full_query=args.full_query,
     )
     user_search.check_new_listings()
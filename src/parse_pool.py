@@ -0,0 +1,103 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+DEFAULT_BATCH_SIZE = 4
+DEFAULT_BATCH_DELAY = 0.005  # seconds to wait for a batch to fill up
+
+
+def parse_batch(tasks):
+    """
+    Run in a worker process. Each task is (func, options, content), the
+    results come back in order as (ok, records or exception).
+    """
+    results = []
+    for func, options, content in tasks:
+        try:
+            results.append((True, func(content, **options)))
+        except Exception as e:
+            results.append((False, e))
+    return results
+
+
+class ParseExecutor:
+    """
+    Ships raw response bytes to a process pool and returns the parsed
+    listing records, so CPU heavy parsing doesn't hold the GIL of the
+    process doing the fetching.
+
+    `func` must be a module level function taking the response bytes and
+    keyword options and returning picklable records, see parse_task() on
+    the marketplace classes. Responses that arrive close together are sent
+    to a worker as one batch.
+    """
+
+    def __init__(self, workers: int = None, batch_size: int = DEFAULT_BATCH_SIZE, batch_delay: float = DEFAULT_BATCH_DELAY):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.pending = []
+        self.flush_handle = None
+
+    async def parse(self, func, content: bytes, **options):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((func, options, content, future))
+
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.batch_delay, self.flush)
+
+        return await future
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if not self.pending:
+            return
+
+        batch, self.pending = self.pending, []
+        tasks = [(func, options, content) for func, options, content, _ in batch]
+        futures = [future for *_, future in batch]
+
+        batch_future = asyncio.wrap_future(self.pool.submit(parse_batch, tasks))
+        batch_future.add_done_callback(
+            lambda done: self.deliver(done, futures)
+        )
+
+    @staticmethod
+    def deliver(done, futures):
+        if done.cancelled() or done.exception() is not None:
+            error = done.exception() if not done.cancelled() else asyncio.CancelledError()
+            for future in futures:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        for future, (ok, result) in zip(futures, done.result()):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+
+    def parse_many(self, func, contents, **options):
+        """Blocking bulk parse, yields the records of each content in order"""
+        tasks = [(func, options, content) for content in contents]
+        batches = [
+            tasks[start : start + self.batch_size]
+            for start in range(0, len(tasks), self.batch_size)
+        ]
+        for results in self.pool.map(parse_batch, batches):
+            for ok, result in results:
+                if not ok:
+                    raise result
+                yield result
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
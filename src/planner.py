@@ -0,0 +1,179 @@
+import inspect
+import json
+import math
+
+from geo import calculate_distance
+from marketplace import Marketplace, filter_bound
+from registry import load_marketplace
+
+
+MAX_GROWTH = 1.25  # largest covering radius of a group over its largest search radius
+SAME_CENTER_KM = 0.05  # centers this close are the same place, e.g. typed with fewer decimals
+
+
+def search_value(cls, params, name):
+    """Constructor argument `name` of a search, its default if not given"""
+    if name in params:
+        return params[name]
+    parameter = inspect.signature(cls.__init__).parameters.get(name)
+    if parameter is None or parameter.default is inspect.Parameter.empty:
+        return None
+    return parameter.default
+
+
+def normalized_query(query):
+    return " ".join(str(query).casefold().split())
+
+
+def varying_params(cls):
+    """Constructor arguments searches of one group may differ in"""
+    names = {"query", "lat", "long", cls.RADIUS_PARAM}
+    for min_attr, max_attr, _ in cls.RANGE_FILTERS:
+        names.update((min_attr, max_attr))
+    return names
+
+
+def shape_key(cls, search):
+    """Everything else about the request, it has to be the same within a group"""
+    varying = varying_params(cls)
+    names = [name for name in inspect.signature(cls.__init__).parameters if name != "self"]
+    shape = {name: search_value(cls, search.params, name) for name in names if name not in varying}
+    return (
+        search.marketplace,
+        normalized_query(search.params.get("query")),
+        json.dumps(shape, sort_keys=True, default=str),
+    )
+
+
+def radius_value(anchor, radius):
+    """`radius` in the type the search's radius was given in, rounded up for str and int"""
+    if isinstance(anchor, (str, int)):
+        return type(anchor)(math.ceil(radius))
+    return radius
+
+
+def has_coordinates(cls):
+    """Whether the listings of a marketplace can be filtered on distance"""
+    return cls.listing_distances is not Marketplace.listing_distances
+
+
+class PlannedGroup:
+    def __init__(self, cls, search, center, radius):
+        self.cls = cls
+        self.center = center
+        self.members = [(search, 0.0, radius)]  # (search, km from center, radius km)
+
+    def fit(self, center, radius, max_growth):
+        """km from the group's center if a search there with `radius` can join"""
+        distance = calculate_distance(*self.center, *center)
+        if not has_coordinates(self.cls):
+            # Nothing to filter the listings on, the search has to cover
+            # the same circle
+            same_radius = all(math.isclose(radius, r) for _, _, r in self.members)
+            return distance if distance <= SAME_CENTER_KM and same_radius else None
+
+        covering = max(self.covering_radius(), distance + radius)
+        largest = max(max(r for _, _, r in self.members), radius)
+        return distance if covering <= max_growth * largest else None
+
+    def covering_radius(self):
+        return max(distance + radius for _, distance, radius in self.members)
+
+    def searches(self):
+        return [search for search, _, _ in self.members]
+
+    def params(self):
+        """Constructor arguments of the one request for all the searches"""
+        cls = self.cls
+        searches = self.searches()
+        params = dict(searches[0].params)
+
+        # Widest window of every range filter, a search without a bound
+        # leaves the request unbounded too
+        for min_attr, max_attr, _ in cls.RANGE_FILTERS:
+            for attr, pick in ((min_attr, min), (max_attr, max)):
+                values = [search_value(cls, search.params, attr) for search in searches]
+                if any(filter_bound(value) is None for value in values):
+                    params[attr] = search_value(cls, {}, attr)
+                else:
+                    params[attr] = pick(values, key=filter_bound)
+
+        if has_coordinates(cls):
+            # In the unit and type the search was given in, rounded up
+            params[cls.RADIUS_PARAM] = radius_value(
+                search_value(cls, params, cls.RADIUS_PARAM), self.covering_radius() / cls.RADIUS_KM
+            )
+        return params
+
+
+def plan_searches(searches, max_growth: float = MAX_GROWTH):
+    """
+    Groups of saved searches that can share one upstream request, as
+    [(searches, request params)], params None for a search polled on its
+    own. Searches of a marketplace that allows it (Marketplace.COALESCE)
+    are grouped when they have the same query and request options:
+
+    - range filters (price, mileage, year) may differ, the request uses the
+      widest window and every search gets its own window applied locally
+    - where listings have coordinates, nearby centers and other radii are
+      folded into a covering circle as long as it stays within
+      `max_growth` of the largest radius in the group, otherwise centers
+      and radius have to match
+    """
+    plans = []
+    groups = {}
+    for search in searches:
+        cls = load_marketplace(search.marketplace)
+        if not cls.COALESCE:
+            plans.append(([search], None))
+            continue
+
+        center = (float(search.params["lat"]), float(search.params["long"]))
+        radius = float(search_value(cls, search.params, cls.RADIUS_PARAM)) * cls.RADIUS_KM
+        candidates = groups.setdefault(shape_key(cls, search), [])
+        for group in candidates:
+            distance = group.fit(center, radius, max_growth)
+            if distance is not None:
+                group.members.append((search, distance, radius))
+                break
+        else:
+            group = PlannedGroup(cls, search, center, radius)
+            candidates.append(group)
+            plans.append(group)
+
+    return [
+        (plan.searches(), plan.params() if len(plan.members) > 1 else None)
+        if isinstance(plan, PlannedGroup)
+        else plan
+        for plan in plans
+    ]
+
+
+class CoalescedScraper:
+    """
+    Polls several searches with one request. `upstream` fetches and parses
+    for all of them, parsing as deep as the search furthest behind needs,
+    and every search then processes the listings its own request would
+    have returned (Marketplace.local_listings) as usual.
+    """
+
+    def __init__(self, upstream, scrapers):
+        self.upstream = upstream
+        self.scrapers = scrapers
+        upstream.coalesced = scrapers
+
+    def get_listings(self):
+        return self.upstream.get_listings()
+
+    async def aget_listings(self):
+        return await self.upstream.aget_listings()
+
+    def process_listings(self, listings):
+        new_listings = []
+        for scraper in self.scrapers:
+            scraper.time_checked = self.upstream.time_checked
+            new_listings.append(scraper.process_listings(scraper.local_listings(listings)))
+        return new_listings
+
+    def check_new_listings(self):
+        return self.process_listings(self.get_listings())
@@ -0,0 +1,313 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from metrics import default_metrics
+
+
+DEFAULT_LIMITS = {
+    "rate": 1.0,  # requests per second a host starts at, after a restart too
+    "min_rate": 0.1,
+    "max_rate": 50.0,
+    "burst": 1,  # requests that may go back to back, 1 spaces every request 1/rate apart
+    "window": 2,  # requests in flight a host starts at
+    "max_window": 64,
+    "rate_step": 0.2,  # requests per second the rate grows by every second once it backed off
+}
+
+# Per-host overrides of DEFAULT_LIMITS, windows as large as the host's pool
+HOST_LIMITS = {
+    "offerup.com": {"max_window": 32},
+    "sapi.craigslist.org": {"max_window": 32},
+    "iphone-api.gumtree.com": {"max_window": 16},
+    "www.kijiji.ca": {"max_window": 16},
+    "api.ca-kijiji-production.classifiedscloud.io": {"max_window": 16},
+    "api.ebay.com": {"max_window": 16},
+}
+
+BACKOFF = 0.7  # factor rate and window are cut by when a host pushes back
+SLOW_START_STEP = 0.25  # of a request per second the rate grows by per response before the first backoff
+LATENCY_SMOOTHING = 0.2  # weight of the last response in the smoothed latency
+LATENCY_SPIKE = 2.0  # smoothed latency over the baseline that counts as pushing back
+LATENCY_SLACK = 0.2  # seconds, smaller increases never do
+BASELINE_DRIFT = 0.002  # the baseline follows a lasting rise in latency by this much per response
+MAX_RETRY_AFTER = 300  # seconds
+
+
+def retry_after_seconds(headers):
+    """Seconds of a Retry-After header, in seconds or as an HTTP date, None if there is none"""
+    value = headers.get("Retry-After") if headers else None
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+def is_pushback(status):
+    return status == 429 or status >= 500
+
+
+class Slot:
+    """
+    One request's place in a host's window. Used as a context manager
+    around the request, the response's status and headers are handed in
+    with record(). An exception escaping the block counts as the host
+    failing the request, cancellation does not.
+    """
+
+    def __init__(self, limiter=None, sent: float = 0.0, window_limited: bool = False, paced: bool = False):
+        self.limiter = limiter
+        self.sent = sent
+        self.window_limited = window_limited  # the request went at once and filled the window
+        self.paced = paced  # the request waited for its turn
+        self.status = None
+        self.headers = None
+
+    def record(self, status: int, headers=None):
+        self.status = status
+        self.headers = headers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.limiter is not None:
+            self.limiter.release(self, exc)
+
+
+class HostLimiter:
+    """
+    Paces the requests to one host and limits how many are in flight,
+    raising both for as long as the host keeps up and cutting them when it
+    pushes back, like TCP congestion control.
+
+    Requests are spaced 1/rate apart (a token bucket of `burst` tokens), so
+    polls that come due together go out evenly instead of at once, and at
+    most `window` of them are in flight. A 429, a 5xx, a failed request or
+    a latency spike (smoothed latency LATENCY_SPIKE times its baseline)
+    cuts rate and window by BACKOFF, once for all the requests that were
+    already in flight, and a Retry-After holds every request back until
+    it has passed. In between they grow: the window by one per window of
+    responses, the rate by `rate_step` per second. Until the first
+    backoff, after a restart, both start low and grow exponentially (slow
+    start), the rate doubling about every 3 seconds. Either only grows
+    while requests are actually waiting on it.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        rate: float = DEFAULT_LIMITS["rate"],
+        min_rate: float = DEFAULT_LIMITS["min_rate"],
+        max_rate: float = DEFAULT_LIMITS["max_rate"],
+        burst: int = DEFAULT_LIMITS["burst"],
+        window: float = DEFAULT_LIMITS["window"],
+        max_window: float = DEFAULT_LIMITS["max_window"],
+        rate_step: float = DEFAULT_LIMITS["rate_step"],
+        metrics=None,
+    ):
+        if min_rate > max_rate:
+            raise ValueError(f"min_rate {min_rate} is above max_rate {max_rate} for {host}")
+        self.host = host
+        self.rate = min(max(rate, min_rate), max_rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = max(burst, 1)
+        self.window = min(max(window, 1), max_window)
+        self.max_window = max_window
+        self.rate_step = rate_step
+        self.metrics = metrics
+        self.slow_start = True
+        self.in_flight = 0
+        self.next_send = 0.0  # when the bucket is full again, as time.monotonic()
+        self.not_before = 0.0  # Retry-After of the host
+        self.last_backoff = 0.0
+        self.latency = None  # smoothed
+        self.base_latency = None
+        self.waiters = deque()  # wake-up callbacks of requests waiting for room in the window
+        self.lock = threading.Lock()
+
+    def get_metrics(self):
+        if self.metrics is None:
+            self.metrics = default_metrics()
+        return self.metrics
+
+    def reserve(self, wake):
+        """A Slot if the window has room, else `wake` is called once it may have"""
+        with self.lock:
+            if self.in_flight >= int(self.window):
+                self.waiters.append(wake)
+                return None
+            self.in_flight += 1
+            now = time.monotonic()
+            interval = 1 / self.rate
+            sent = max(now, self.next_send - (self.burst - 1) * interval, self.not_before)
+            self.next_send = max(self.next_send, sent) + interval
+            # A request waiting for its turn is held back by the rate, not the window
+            paced = sent > now
+            return Slot(self, sent, not paced and self.in_flight >= int(self.window), paced)
+
+    def abandon(self, wake):
+        """A waiting request gave up, its wake-up goes to the next one if it already had it"""
+        with self.lock:
+            try:
+                self.waiters.remove(wake)
+                return
+            except ValueError:
+                pass
+        self.wake_waiters()
+
+    def wake_waiters(self):
+        with self.lock:
+            room = int(self.window) - self.in_flight
+            woken = [self.waiters.popleft() for _ in range(min(max(room, 0), len(self.waiters)))]
+        for wake in woken:
+            wake()
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        while True:
+            future = loop.create_future()
+
+            def wake(future=future):
+                loop.call_soon_threadsafe(
+                    lambda: future.done() or future.set_result(None)
+                )
+
+            slot = self.reserve(wake)
+            if slot is not None:
+                break
+            try:
+                await future
+            except asyncio.CancelledError:
+                self.abandon(wake)
+                raise
+
+        try:
+            await asyncio.sleep(max(slot.sent - time.monotonic(), 0.0))
+        except asyncio.CancelledError:
+            self.release(slot, None)
+            raise
+        self.get_metrics().observe("rate_limit_wait_seconds", time.monotonic() - start, host=self.host)
+        return slot
+
+    def acquire_blocking(self):
+        start = time.monotonic()
+        while True:
+            event = threading.Event()
+            slot = self.reserve(event.set)
+            if slot is not None:
+                break
+            event.wait()
+
+        time.sleep(max(slot.sent - time.monotonic(), 0.0))
+        self.get_metrics().observe("rate_limit_wait_seconds", time.monotonic() - start, host=self.host)
+        return slot
+
+    def release(self, slot, error=None):
+        """
+        Frees the slot and adjusts the limits to how the request went.
+        Anything but an Exception (cancellation) tells nothing about the host.
+        """
+        now = time.monotonic()
+        backoff = None
+        with self.lock:
+            self.in_flight -= 1
+            if isinstance(error, Exception):
+                backoff = self.push_back(slot, now, "error")
+            elif error is None and slot.status is not None:
+                if is_pushback(slot.status):
+                    backoff = self.push_back(slot, now, str(slot.status), retry_after_seconds(slot.headers))
+                elif slot.status < 400:
+                    backoff = self.keep_up(slot, now)
+        if backoff is not None:
+            self.get_metrics().inc("rate_limit_backoffs_total", host=self.host, reason=backoff)
+        self.wake_waiters()
+
+    def push_back(self, slot, now, reason, retry_after=None):
+        """Backs off, the reason if it did"""
+        if retry_after:
+            self.not_before = max(self.not_before, now + retry_after)
+        if slot.sent < self.last_backoff:
+            # Sent at the old limits, the backoff already answered it
+            return None
+        self.last_backoff = now
+        self.slow_start = False
+        self.rate = max(self.rate * BACKOFF, self.min_rate)
+        self.window = max(self.window * BACKOFF, 1)
+        return reason
+
+    def keep_up(self, slot, now):
+        latency = now - slot.sent
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += LATENCY_SMOOTHING * (latency - self.latency)
+        if self.base_latency is None:
+            self.base_latency = self.latency
+        else:
+            self.base_latency = min(self.base_latency * (1 + BASELINE_DRIFT), self.latency)
+        if (
+            self.latency > LATENCY_SPIKE * self.base_latency
+            and self.latency - self.base_latency > LATENCY_SLACK
+        ):
+            return self.push_back(slot, now, "latency")
+
+        if slot.window_limited:
+            step = 1 if self.slow_start else 1 / self.window
+            self.window = min(self.window + step, self.max_window)
+        if slot.paced:
+            # Per response, so per second these add up to a share of the
+            # rate (exponential) in slow start and to rate_step after it
+            step = SLOW_START_STEP if self.slow_start else self.rate_step / self.rate
+            self.rate = min(self.rate + step, self.max_rate)
+        return None
+
+    def describe(self):
+        return f"{self.host}: {self.rate:.2f} requests/s, window {int(self.window)}"
+
+
+class RateLimiter:
+    """HostLimiter of every host, limits from HOST_LIMITS and `host_limits` over DEFAULT_LIMITS"""
+
+    def __init__(self, host_limits: dict = None, default_limits: dict = None, metrics=None):
+        self.default_limits = {**DEFAULT_LIMITS, **(default_limits or {})}
+        self.host_limits = {host: dict(limits) for host, limits in HOST_LIMITS.items()}
+        for host, limits in (host_limits or {}).items():
+            self.host_limits.setdefault(host, {}).update(limits)
+        self.metrics = metrics
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def limits_for(self, host):
+        return {**self.default_limits, **self.host_limits.get(host, {})}
+
+    def for_url(self, url: str):
+        host = urlsplit(url).hostname or ""
+        limiter = self.hosts.get(host)
+        if limiter is not None:
+            return limiter
+
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = HostLimiter(host, metrics=self.metrics, **self.limits_for(host))
+            return self.hosts[host]
+
+    async def acquire(self, url: str):
+        return await self.for_url(url).acquire()
+
+    def acquire_blocking(self, url: str):
+        return self.for_url(url).acquire_blocking()
+
+    def describe(self):
+        return [limiter.describe() for limiter in self.hosts.values()]
@@ -0,0 +1,51 @@
+import importlib
+
+
+# Marketplace name -> "module:Class" of its scraper. Nothing is imported
+# until a marketplace is used, so listing or validating names is free.
+MARKETPLACES = {
+    "offerup": "offerup:OfferUp",
+    "craiglist": "craiglist:Craiglist",
+    "gumtree_uk": "gum_tree_uk:GumTreeUK",
+    "kijiji": "kijiji:Kijiji",
+    "kijiji_mobile": "kijiji_mobile:KijijiMobile",
+    "ebay": "eBay:eBay",
+}
+
+_classes = {}
+
+
+def register(name: str, spec: str):
+    """
+    Add a marketplace plugin, `spec` is "module:Class" of a Marketplace
+    subclass importable from the path, e.g.
+
+        register("facebook", "facebook_marketplace:Facebook")
+    """
+    if ":" not in spec:
+        raise ValueError(f"Expected module:Class, got {spec}")
+    MARKETPLACES[name] = spec
+    _classes.pop(name, None)
+
+
+def marketplace_names():
+    return list(MARKETPLACES)
+
+
+def marketplace_spec(name: str):
+    """(module, class name) of a marketplace"""
+    if name not in MARKETPLACES:
+        raise ValueError(f"Unknown marketplace {name}")
+    module_name, class_name = MARKETPLACES[name].split(":", 1)
+    return module_name, class_name
+
+
+def load_marketplace(name: str):
+    """
+    Scraper class of a marketplace. Its module, and with it the parsers
+    and libraries only that marketplace needs, is imported on first use.
+    """
+    if name not in _classes:
+        module_name, class_name = marketplace_spec(name)
+        _classes[name] = getattr(importlib.import_module(module_name), class_name)
+    return _classes[name]
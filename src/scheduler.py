@@ -0,0 +1,242 @@
+import math
+import time
+
+from planner import search_value
+from registry import load_marketplace
+from watermark import posted_timestamp
+
+
+DEFAULT_MIN_INTERVAL = 30  # seconds
+DEFAULT_MAX_INTERVAL = 3600
+BASE_INTERVAL = 1200  # seconds between polls of a search that gets one new listing an hour
+HALF_LIFE = 6 * 3600  # seconds observed after which a poll counts half
+PROFILE_HALF_LIFE = 7 * 3600  # a week of the same hour of day
+PROFILE_PRIOR = 3600  # seconds of the overall rate every hour of the day starts from
+MAX_STEP = 2.0  # largest factor the interval changes by from one poll to the next
+SEED_DAYS = 7  # of listing history the rates start from
+
+
+class DecayingRate:
+    """Events per second, older observations count less and less"""
+
+    def __init__(self, half_life: float):
+        self.half_life = half_life
+        self.events = 0.0
+        self.seconds = 0.0
+
+    def add(self, events: float, seconds: float):
+        decay = 0.5 ** (seconds / self.half_life)
+        self.events = self.events * decay + events
+        self.seconds = self.seconds * decay + seconds
+
+    def rate(self, prior_rate: float = 0.0, prior_seconds: float = 0.0):
+        seconds = self.seconds + prior_seconds
+        if seconds <= 0:
+            return None
+        return (self.events + prior_rate * prior_seconds) / seconds
+
+
+def hour_of_day(timestamp: float):
+    return time.localtime(timestamp).tm_hour
+
+
+def hour_seconds(start: float, end: float):
+    """(hour of day, seconds) of the local hours between two timestamps"""
+    while start < end:
+        next_hour = (int(start) // 3600 + 1) * 3600
+        yield hour_of_day(start), min(next_hour, end) - start
+        start = next_hour
+
+
+class ArrivalRate:
+    """
+    New listings per second of one search, from the posting times of the
+    listings its polls find. The first poll goes back as far as the
+    listings it found were posted, every later one covers the time since
+    the one before. With `profile` the rate is also kept per hour of the
+    day, starting from the overall rate until an hour has been seen for a
+    while.
+    """
+
+    def __init__(self, profile: bool = False):
+        self.overall = DecayingRate(HALF_LIFE)
+        self.hours = [DecayingRate(PROFILE_HALF_LIFE) for _ in range(24)] if profile else None
+        self.last_checked = None
+
+    def add(self, posted_times, start: float, end: float):
+        self.overall.add(len(posted_times), end - start)
+        if self.hours is None:
+            return
+        for hour, seconds in hour_seconds(start, end):
+            self.hours[hour].add(0, seconds)
+        for posted in posted_times:
+            self.hours[hour_of_day(end if posted is None else posted)].events += 1
+
+    def observe(self, posted_times, time_checked: float):
+        """Posting times of the listings a poll found new, None where unknown"""
+        if self.last_checked is not None:
+            if time_checked > self.last_checked:
+                self.add(posted_times, self.last_checked, time_checked)
+        else:
+            known = [posted for posted in posted_times if posted is not None]
+            if len(known) > 1 and min(known) < time_checked:
+                # The oldest one only marks where the page starts
+                self.add(sorted(known)[1:], min(known), time_checked)
+        self.last_checked = time_checked
+
+    def seed(self, posted_times, found_times):
+        """Start from the listing history of the search"""
+        start, end = min(found_times), max(found_times)
+        if end > start:
+            self.add(posted_times, start, end)
+            self.last_checked = end
+
+    def rate(self, at: float):
+        overall = self.overall.rate()
+        if overall is None or self.hours is None:
+            return overall
+        return self.hours[hour_of_day(at)].rate(overall, PROFILE_PRIOR)
+
+
+class AdaptiveScheduler:
+    """
+    Poll intervals that follow how fast new listings show up for every
+    search (ArrivalRate): `base_interval` for a search that gets one new
+    listing an hour, shorter by the square root of how much busier a
+    search is, kept between min_interval and max_interval. For a given
+    number of requests, that is what keeps the average wait of a new
+    listing for its poll lowest.
+
+    A search starts at its configured interval, the interval changes by at
+    most MAX_STEP per poll, and a poll that found a full page of new
+    listings, so probably missed some, always shortens it.
+    """
+
+    def __init__(
+        self,
+        min_interval: float = DEFAULT_MIN_INTERVAL,
+        max_interval: float = DEFAULT_MAX_INTERVAL,
+        base_interval: float = BASE_INTERVAL,
+        profile: bool = False,
+        metrics=None,
+    ):
+        if min_interval > max_interval:
+            raise ValueError(f"min_interval {min_interval} is above max_interval {max_interval}")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.base_interval = base_interval
+        self.profile = profile
+        self.metrics = metrics
+        self.rates = {}  # saved search -> ArrivalRate
+        self.intervals = {}
+        self.full_pages = set()
+
+    def arrival_rate(self, search):
+        if search not in self.rates:
+            self.rates[search] = ArrivalRate(self.profile)
+        return self.rates[search]
+
+    def page_size(self, search):
+        """Listings per page of the search's request, None if unknown or tiled"""
+        cls = load_marketplace(search.marketplace)
+        if cls.PAGE_SIZE_PARAM is None or search.tile:
+            return None
+        page_size = search_value(cls, search.params, cls.PAGE_SIZE_PARAM)
+        return None if page_size is None else int(page_size)
+
+    def observe(self, search, new_listings, time_checked: float):
+        """
+        New listings of a poll, one batch or, for a group of searches, a
+        list of them
+        """
+        batches = new_listings if isinstance(new_listings, list) else [new_listings]
+        column = load_marketplace(search.marketplace).WATERMARK_COLUMN
+        posted = {}
+        for batch in batches:
+            times = batch.column(column) if column else [None] * len(batch)
+            for listing_id, value in zip(batch.column("listing_id"), times):
+                posted.setdefault(str(listing_id), posted_timestamp(value))
+
+        rate = self.arrival_rate(search)
+        if self.metrics is not None and rate.last_checked is not None:
+            for value in posted.values():
+                if value is not None:
+                    self.metrics.observe(
+                        "discovery_lag_seconds",
+                        max(time_checked - value, 0.0),
+                        marketplace=search.marketplace,
+                    )
+        rate.observe(list(posted.values()), time_checked)
+
+        page_size = self.page_size(search)
+        if page_size and len(posted) >= page_size:
+            self.full_pages.add(search)
+
+    def next_interval(self, search, now: float = None):
+        """Seconds until the next poll of a search"""
+        now = time.time() if now is None else now
+        current = self.intervals.get(search, search.interval)
+        rate = self.arrival_rate(search).rate(now)
+        if rate is None:
+            interval = current
+        elif rate <= 0:
+            interval = self.max_interval
+        else:
+            interval = self.base_interval * math.sqrt(1 / 3600 / rate)
+        interval = min(max(interval, current / MAX_STEP), current * MAX_STEP)
+        if search in self.full_pages:
+            self.full_pages.discard(search)
+            interval = min(interval, current / MAX_STEP)
+        interval = min(max(interval, self.min_interval), self.max_interval)
+
+        self.intervals[search] = interval
+        if self.metrics is not None:
+            self.metrics.observe("poll_interval_seconds", interval, marketplace=search.marketplace)
+        return interval
+
+    def seed(self, searches, folder: str, days: float = SEED_DAYS):
+        """
+        Start the rates of `searches` (set up, with their scrapers) from the
+        last `days` of the Parquet listing history in `folder`
+        """
+        import pandas as pd
+        from history import read_history
+
+        def timestamp(value):
+            return None if value is None or pd.isna(value) else value.timestamp()
+
+        since = time.time() - days * 86400
+        by_marketplace = {}
+        for search in searches:
+            by_marketplace.setdefault(search.marketplace, []).append(search)
+
+        seeded = 0
+        for marketplace, marketplace_searches in by_marketplace.items():
+            column = load_marketplace(marketplace).WATERMARK_COLUMN
+            columns = ["search_key", "listing_id", "time_found"] + ([column] if column else [])
+            history = read_history(folder, columns, [marketplace], since=since)
+            if history.empty:
+                continue
+
+            rows = {}
+            for row in history.itertuples(index=False):
+                rows.setdefault(row.search_key, []).append(row)
+            for search in marketplace_searches:
+                # A group's request is for the listings of all its searches
+                members = getattr(search, "searches", None) or [search]
+                listings = {}
+                for member in members:
+                    for row in rows.get(member.scraper.search_key(), ()):
+                        listings.setdefault(row.listing_id, row)
+                if not listings:
+                    continue
+                found = [timestamp(row.time_found) for row in listings.values()]
+                posted = [
+                    timestamp(getattr(row, column)) if column else None
+                    for row in listings.values()
+                ]
+                if None in found:
+                    continue
+                self.arrival_rate(search).seed(posted, found)
+                seeded += 1
+        return seeded
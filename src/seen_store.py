@@ -0,0 +1,355 @@
+import csv
+import os
+import sqlite3
+import sys
+import threading
+import argparse
+
+from watermark import Watermark
+
+
+SEEN_DB = "./data/SEEN_LISTINGS.db"
+
+# Legacy per-marketplace csv databases and the columns that made up the
+# search key in the old pandas merge.
+LEGACY_DBS = {
+    "offerup": ("./data/offerup/LISING_DB.csv", ("query", "lat", "long")),
+    "craiglist": ("./data/craiglist/LISING_DB.csv", ("query", "lat", "long")),
+    "gumtree_uk": ("./data/GumTreeUK/LISING_DB.csv", ("query", "lat", "long")),
+    "kijiji": ("./data/kijiji/LISING_DB.csv", ("query", "city", "state")),
+    "kijiji_mobile": ("./data/kijiji/LISING_DB.csv", ("query", "lat", "long")),
+    "ebay": ("./data/eBay/LISING_DB.csv", ("query", "poctal_code", "country")),
+}
+
+# kijiji and kijiji_mobile appended to the same csv, under the header of
+# whichever wrote first. Their rows are told apart by their number of
+# fields and read by these columns instead.
+LEGACY_LAYOUTS = {
+    "kijiji": (
+        "query", "city", "state", "listing_id", "title", "location", "image_url", "price",
+        "url", "mileageinkm", "poster_info", "time_posted", "sorted_time", "time_found",
+    ),
+    "kijiji_mobile": (
+        "query", "lat", "long", "listing_id", "title", "location", "image_url", "price",
+        "url", "mileageinkm", "car_year", "poster_info", "time_posted", "sorted_time",
+        "time_found",
+    ),
+}
+
+# Keep well under SQLITE_MAX_VARIABLE_NUMBER for the IN (...) lookups
+CHUNK_SIZE = 500
+
+
+def normalize_key_part(value):
+    """
+    Normalize a search parameter so "40.7128", 40.7128 and "40.71280" give
+    the same key, the same way the old merge cast lat/long to float.
+    """
+    if value is None:
+        return ""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return str(value).strip()
+    if number != number:  # NaN from an empty csv cell
+        return ""
+    return repr(number)
+
+
+def make_search_key(*parts):
+    return "|".join(normalize_key_part(part) for part in parts)
+
+
+def normalize_listing_id(listing_id):
+    # pandas writes integer ids as "123.0" once a column has had a missing value
+    listing_id = str(listing_id)
+    if listing_id.endswith(".0") and listing_id[:-2].isdigit():
+        return listing_id[:-2]
+    return listing_id
+
+
+def chunked(items, size=CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+class SeenStore:
+    """
+    Interface for the seen-listing store. Implementations only ever touch
+    the listing ids of the current batch, never the whole history.
+    """
+
+    def filter_new(self, marketplace: str, search_key: str, listing_ids):
+        """Return the ids (unique, in input order) not seen before for the search"""
+        raise NotImplementedError
+
+    def add(self, marketplace: str, search_key: str, listing_ids):
+        """Mark ids as seen for the search"""
+        raise NotImplementedError
+
+    def get_watermark(self, marketplace: str, search_key: str):
+        """Watermark of the search, None before its first poll"""
+        return None
+
+    def set_watermark(self, marketplace: str, search_key: str, watermark: Watermark):
+        pass
+
+    def close(self):
+        pass
+
+
+class MemorySeenStore(SeenStore):
+    def __init__(self):
+        self.seen = {}
+        self.watermarks = {}
+
+    def filter_new(self, marketplace, search_key, listing_ids):
+        seen = self.seen.get((marketplace, search_key), set())
+        return [
+            listing_id
+            for listing_id in dict.fromkeys(str(i) for i in listing_ids)
+            if listing_id not in seen
+        ]
+
+    def add(self, marketplace, search_key, listing_ids):
+        self.seen.setdefault((marketplace, search_key), set()).update(
+            str(i) for i in listing_ids
+        )
+
+    def get_watermark(self, marketplace, search_key):
+        return self.watermarks.get((marketplace, search_key))
+
+    def set_watermark(self, marketplace, search_key, watermark):
+        self.watermarks[(marketplace, search_key)] = watermark
+
+
+class SQLiteSeenStore(SeenStore):
+    def __init__(self, path: str = SEEN_DB):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS seen_listings (
+                marketplace TEXT NOT NULL,
+                search_key TEXT NOT NULL,
+                listing_id TEXT NOT NULL,
+                first_seen REAL DEFAULT (strftime('%s', 'now'))
+            )"""
+        )
+        self.conn.execute(
+            """CREATE UNIQUE INDEX IF NOT EXISTS seen_listings_key
+            ON seen_listings (marketplace, search_key, listing_id)"""
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS watermarks (
+                marketplace TEXT NOT NULL,
+                search_key TEXT NOT NULL,
+                watermark TEXT NOT NULL,
+                PRIMARY KEY (marketplace, search_key)
+            )"""
+        )
+        self.conn.commit()
+
+    def filter_new(self, marketplace, search_key, listing_ids):
+        listing_ids = list(dict.fromkeys(str(i) for i in listing_ids))
+        seen = set()
+        with self.lock:
+            for chunk in chunked(listing_ids):
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"""SELECT listing_id FROM seen_listings
+                    WHERE marketplace = ? AND search_key = ?
+                    AND listing_id IN ({placeholders})""",
+                    (marketplace, search_key, *chunk),
+                )
+                seen.update(row[0] for row in rows)
+        return [listing_id for listing_id in listing_ids if listing_id not in seen]
+
+    def add(self, marketplace, search_key, listing_ids):
+        self.add_many((marketplace, search_key, str(i)) for i in listing_ids)
+
+    def add_many(self, rows):
+        """Insert (marketplace, search_key, listing_id) rows in one transaction"""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                """INSERT OR IGNORE INTO seen_listings
+                (marketplace, search_key, listing_id) VALUES (?, ?, ?)""",
+                rows,
+            )
+
+    def get_watermark(self, marketplace, search_key):
+        with self.lock:
+            row = self.conn.execute(
+                """SELECT watermark FROM watermarks
+                WHERE marketplace = ? AND search_key = ?""",
+                (marketplace, search_key),
+            ).fetchone()
+        return Watermark.loads(row[0]) if row else None
+
+    def set_watermark(self, marketplace, search_key, watermark):
+        with self.lock, self.conn:
+            self.conn.execute(
+                """INSERT OR REPLACE INTO watermarks
+                (marketplace, search_key, watermark) VALUES (?, ?, ?)""",
+                (marketplace, search_key, watermark.dumps()),
+            )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class CachedSeenStore(SeenStore):
+    """
+    Keeps the recently seen ids of every search in memory in front of another
+    store, so a long running process only asks the backing store about ids it
+    has not come across yet.
+    """
+
+    def __init__(self, store: SeenStore, max_ids_per_search: int = 5000):
+        self.store = store
+        self.max_ids_per_search = max_ids_per_search
+        self.cache = {}
+        self.watermarks = {}
+        self.lock = threading.Lock()
+
+    def remember(self, key, listing_ids):
+        with self.lock:
+            known = self.cache.setdefault(key, {})
+            for listing_id in listing_ids:
+                known.pop(listing_id, None)
+                known[listing_id] = None
+            while len(known) > self.max_ids_per_search:
+                del known[next(iter(known))]
+
+    def filter_new(self, marketplace, search_key, listing_ids):
+        key = (marketplace, search_key)
+        listing_ids = list(dict.fromkeys(str(i) for i in listing_ids))
+        with self.lock:
+            known = self.cache.get(key, {})
+            candidates = [i for i in listing_ids if i not in known]
+        if not candidates:
+            return []
+
+        new_ids = self.store.filter_new(marketplace, search_key, candidates)
+        new_set = set(new_ids)
+        self.remember(key, [i for i in candidates if i not in new_set])
+        return new_ids
+
+    def add(self, marketplace, search_key, listing_ids):
+        listing_ids = [str(i) for i in listing_ids]
+        self.store.add(marketplace, search_key, listing_ids)
+        self.remember((marketplace, search_key), listing_ids)
+
+    def get_watermark(self, marketplace, search_key):
+        key = (marketplace, search_key)
+        if key not in self.watermarks:
+            self.watermarks[key] = self.store.get_watermark(marketplace, search_key)
+        return self.watermarks[key]
+
+    def set_watermark(self, marketplace, search_key, watermark):
+        self.store.set_watermark(marketplace, search_key, watermark)
+        self.watermarks[(marketplace, search_key)] = watermark
+
+    def close(self):
+        self.store.close()
+
+
+def read_legacy_csv(csv_path: str, marketplaces):
+    """
+    Rows of a legacy LISING_DB.csv as (marketplace, {column: value}). A csv
+    of one marketplace is read by its header. Rows of the marketplaces in
+    LEGACY_LAYOUTS are read by the layout with as many fields, rows
+    matching none of them are skipped.
+    """
+    layouts = {
+        len(LEGACY_LAYOUTS[marketplace]): (marketplace, LEGACY_LAYOUTS[marketplace])
+        for marketplace in marketplaces
+        if marketplace in LEGACY_LAYOUTS
+    }
+    csv.field_size_limit(sys.maxsize)
+    with open(csv_path, newline="") as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        for row in reader:
+            if layouts:
+                if len(row) not in layouts:
+                    continue
+                marketplace, columns = layouts[len(row)]
+            else:
+                marketplace, columns = marketplaces[0], header
+            yield marketplace, dict(zip(columns, row))
+
+
+def import_csv(store: SQLiteSeenStore, marketplace: str, csv_path: str, key_columns):
+    """
+    Stream a legacy LISING_DB.csv into the store, see read_legacy_csv().
+    An empty key column is part of the key (the kijiji CLI searches with
+    an empty state), rows without the key columns are skipped.
+
+    @param store: Store to import into
+    @param marketplace: Marketplace name the rows belong to
+    @param csv_path: Path of the legacy csv database
+    @param key_columns: Columns that make up the search key
+    @return: Number of rows read from the csv
+    """
+    if not os.path.exists(csv_path):
+        return 0
+
+    count = 0
+    batch = []
+    for _, row in read_legacy_csv(csv_path, [marketplace]):
+        if not row.get("listing_id"):
+            continue
+        if any(row.get(column) is None for column in key_columns):
+            continue
+
+        search_key = make_search_key(*(row[column] for column in key_columns))
+        batch.append((marketplace, search_key, normalize_listing_id(row["listing_id"])))
+        count += 1
+
+        if len(batch) >= 50000:
+            store.add_many(batch)
+            batch = []
+
+    if batch:
+        store.add_many(batch)
+    return count
+
+
+_default_store = None
+
+
+def default_seen_store():
+    global _default_store
+    if _default_store is None:
+        _default_store = SQLiteSeenStore(SEEN_DB)
+    return _default_store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="One-shot import of the legacy LISING_DB.csv files"
+    )
+    parser.add_argument("-db", "--db", help="Seen listings database", default=SEEN_DB)
+    parser.add_argument(
+        "-m",
+        "--marketplace",
+        help="Marketplace to import, all by default",
+        choices=list(LEGACY_DBS),
+        action="append",
+    )
+    args = parser.parse_args()
+
+    store = SQLiteSeenStore(args.db)
+    for marketplace in args.marketplace or LEGACY_DBS:
+        csv_path, key_columns = LEGACY_DBS[marketplace]
+        count = import_csv(store, marketplace, csv_path, key_columns)
+        print(f"Imported {count} listings for {marketplace} from {csv_path}")
+    store.close()
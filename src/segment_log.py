@@ -0,0 +1,363 @@
+import argparse
+import bisect
+import itertools
+import json
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from listing_batch import listing_records
+
+try:
+    import fcntl
+except ImportError:  # Windows, writers are only serialized within the process
+    fcntl = None
+
+
+SEGMENT_BYTES = 64 * 1024 * 1024  # a segment is rolled once it is this big
+SEGMENT_SECONDS = 24 * 60 * 60  # or once it has been written to for this long
+INDEX_INTERVAL = 4096  # log bytes between two offset index entries
+POLL_RECORDS = 1000
+
+LOG_SUFFIX = ".log"
+INDEX_SUFFIX = ".index"
+LOCK_NAME = ".lock"
+CONSUMERS_FOLDER = "consumers"
+
+# Offset relative to the segment's base offset, byte position in the segment
+INDEX_ENTRY = struct.Struct(">IQ")
+
+
+def segment_name(base_offset: int, suffix: str):
+    return f"{base_offset:020d}{suffix}"
+
+
+def segment_offsets(folder):
+    """Base offsets of the segments in `folder`, oldest first"""
+    if not os.path.isdir(folder):
+        return []
+    return sorted(
+        int(name[: -len(LOG_SUFFIX)])
+        for name in os.listdir(folder)
+        if name.endswith(LOG_SUFFIX) and name[: -len(LOG_SUFFIX)].isdigit()
+    )
+
+
+def read_index(path):
+    """(relative offset, position) entries of a segment index"""
+    try:
+        with open(path, "rb") as file:
+            content = file.read()
+    except FileNotFoundError:
+        return []
+    usable = len(content) - len(content) % INDEX_ENTRY.size
+    return list(INDEX_ENTRY.iter_unpack(content[:usable]))
+
+
+def index_position(entries, relative_offset):
+    """Byte position of the last indexed record at or before relative_offset"""
+    i = bisect.bisect_right(entries, (relative_offset, float("inf"))) - 1
+    return entries[i][1] if i >= 0 else 0
+
+
+class SegmentLog:
+    """
+    Append-only log of records (JSON lines) split into rolling segment files.
+
+    Every record gets the next offset of the log. A segment is named after
+    the offset of its first record and comes with a sparse offset index,
+    an entry per INDEX_INTERVAL bytes, so readers can start at any offset
+    by looking up the segment by name and seeking to the nearest indexed
+    record. Nothing is written for an empty append.
+
+        <folder>/00000000000000000000.log
+        <folder>/00000000000000000000.index
+        <folder>/00000000000000052311.log
+        ...
+
+    Several processes can write to the same log, e.g. overlapping cron
+    runs. Every append holds an exclusive lock on <folder>/.lock while it
+    catches up with what the others appended, assigns its offsets and
+    writes. A new process keeps appending to the last segment until it
+    is full.
+    """
+
+    def __init__(
+        self,
+        folder: str,
+        max_segment_bytes: int = SEGMENT_BYTES,
+        max_segment_seconds: float = SEGMENT_SECONDS,
+        index_interval: int = INDEX_INTERVAL,
+    ):
+        self.folder = folder
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_seconds = max_segment_seconds
+        self.index_interval = index_interval
+        self.lock = threading.Lock()
+        self.lock_file = None
+        self.log_file = None
+        self.index_file = None
+        self.base_offset = None
+        self.position = None  # end of the open segment
+        self.segment_started = None
+        self.indexed_position = None
+        self.next_offset = None
+
+    @contextmanager
+    def locked(self):
+        """Exclusive access to the log, across threads and processes"""
+        with self.lock:
+            if fcntl is None:
+                yield
+                return
+            if self.lock_file is None:
+                os.makedirs(self.folder, exist_ok=True)
+                self.lock_file = open(os.path.join(self.folder, LOCK_NAME), "ab")
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    def sync(self):
+        """Catch up with appends of other writers, holding the lock"""
+        bases = segment_offsets(self.folder)
+        if (
+            self.log_file is not None
+            and bases
+            and bases[-1] == self.base_offset
+            and os.fstat(self.log_file.fileno()).st_size == self.position
+        ):
+            return
+        self.close_segment()
+        self.recover(bases)
+
+    def recover(self, bases):
+        """
+        Reopen the last segment after its last complete record, holding the
+        lock. A partly written record at its end, left by a writer that
+        died, and index entries past it are dropped.
+        """
+        if not bases:
+            self.next_offset = 0
+            return
+
+        base = bases[-1]
+        log_path = os.path.join(self.folder, segment_name(base, LOG_SUFFIX))
+        index_path = os.path.join(self.folder, segment_name(base, INDEX_SUFFIX))
+        size = os.path.getsize(log_path)
+        # Entries can point past the end of a log cut short
+        entries = [entry for entry in read_index(index_path) if entry[1] < size]
+
+        relative, position = entries[-1] if entries else (0, 0)
+        next_offset = base + relative
+        end = position
+        with open(log_path, "rb") as file:
+            file.seek(position)
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                end += len(line)
+                next_offset = json.loads(line)["offset"] + 1
+
+        if end < size:
+            os.truncate(log_path, end)
+        valid = [entry for entry in entries if entry[1] < end]
+        index_size = os.path.getsize(index_path) if os.path.exists(index_path) else 0
+        if index_size != len(valid) * INDEX_ENTRY.size:
+            with open(index_path, "wb") as file:
+                file.write(b"".join(INDEX_ENTRY.pack(*entry) for entry in valid))
+
+        self.base_offset = base
+        self.next_offset = next_offset
+        self.position = end
+        self.indexed_position = valid[-1][1] if valid else 0
+        self.log_file = open(log_path, "ab")
+        self.index_file = open(index_path, "ab")
+        # A segment was started when the one before it was last written to,
+        # the first one is timed from now
+        started_with = segment_name(bases[-2], LOG_SUFFIX) if len(bases) > 1 else None
+        self.segment_started = (
+            os.path.getmtime(os.path.join(self.folder, started_with)) if started_with else time.time()
+        )
+
+    def append(self, records):
+        """Append the records (dicts), returns the offset of the first one"""
+        if not records:
+            return None
+
+        with self.locked():
+            self.sync()
+            first = self.next_offset
+            lines = []
+            for offset, record in enumerate(records, first):
+                lines.append(json.dumps({"offset": offset, **record}, default=str).encode() + b"\n")
+
+            if self.segment_full():
+                self.roll()
+            position = self.position
+            relative = first - self.base_offset
+            entries = []
+            for line in lines:
+                if position == 0 or position - self.indexed_position >= self.index_interval:
+                    entries.append(INDEX_ENTRY.pack(relative, position))
+                    self.indexed_position = position
+                position += len(line)
+                relative += 1
+
+            # The records before their index entries, a reader never gets
+            # sent past the end of the log
+            self.log_file.write(b"".join(lines))
+            self.log_file.flush()
+            if entries:
+                self.index_file.write(b"".join(entries))
+                self.index_file.flush()
+            self.position = position
+            self.next_offset = first + len(records)
+            return first
+
+    def append_listings(self, listings, **fields):
+        """Append a ListingBatch or DataFrame of listings, with `fields` added to each"""
+        if listings.empty:
+            return None
+        return self.append([{**fields, **record} for record in listing_records(listings)])
+
+    def segment_full(self):
+        if self.log_file is None:
+            return True
+        return (
+            self.position >= self.max_segment_bytes
+            or time.time() - self.segment_started >= self.max_segment_seconds
+        )
+
+    def roll(self):
+        self.close_segment()
+        os.makedirs(self.folder, exist_ok=True)
+        self.base_offset = self.next_offset
+        self.log_file = open(os.path.join(self.folder, segment_name(self.base_offset, LOG_SUFFIX)), "ab")
+        self.index_file = open(
+            os.path.join(self.folder, segment_name(self.base_offset, INDEX_SUFFIX)), "ab"
+        )
+        self.position = 0
+        self.segment_started = time.time()
+        self.indexed_position = 0
+
+    def close_segment(self):
+        if self.log_file is not None:
+            self.log_file.close()
+            self.index_file.close()
+        self.log_file = self.index_file = None
+
+    def close(self):
+        with self.lock:
+            self.close_segment()
+            if self.lock_file is not None:
+                self.lock_file.close()
+                self.lock_file = None
+
+
+def read_log(folder, offset: int = 0):
+    """
+    Records of the log in `folder` from `offset` on, oldest first. Safe to
+    use while the log is written to, a record being written is not
+    returned until it is complete.
+    """
+    bases = segment_offsets(folder)
+    start = max(bisect.bisect_right(bases, offset) - 1, 0)
+    for base in bases[start:]:
+        position = 0
+        if offset > base:
+            entries = read_index(os.path.join(folder, segment_name(base, INDEX_SUFFIX)))
+            position = index_position(entries, offset - base)
+
+        with open(os.path.join(folder, segment_name(base, LOG_SUFFIX)), "rb") as file:
+            file.seek(position)
+            for line in file:
+                if not line.endswith(b"\n"):
+                    return
+                record = json.loads(line)
+                if record["offset"] >= offset:
+                    yield record
+
+
+class LogConsumer:
+    """
+    Reads a segment log from where it left off. The offset is kept in
+    <log folder>/consumers/<name>.offset once commit() is called, records
+    polled and not committed are read again after a restart.
+    """
+
+    def __init__(self, folder: str, name: str):
+        self.folder = folder
+        self.path = os.path.join(folder, CONSUMERS_FOLDER, f"{name}.offset")
+        self.committed = self.load()
+        self.offset = self.committed
+
+    def load(self):
+        try:
+            with open(self.path) as file:
+                return int(file.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def poll(self, max_records: int = POLL_RECORDS):
+        records = list(itertools.islice(read_log(self.folder, self.offset), max_records))
+        if records:
+            self.offset = records[-1]["offset"] + 1
+        return records
+
+    def seek(self, offset: int):
+        self.offset = offset
+
+    def commit(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as file:
+            file.write(str(self.offset))
+        os.replace(temporary, self.path)
+        self.committed = self.offset
+
+
+_segment_logs = {}
+_segment_logs_lock = threading.Lock()
+
+
+def segment_log(folder):
+    """The one SegmentLog writing to `folder` in this process"""
+    folder = os.path.normpath(folder)
+    with _segment_logs_lock:
+        if folder not in _segment_logs:
+            _segment_logs[folder] = SegmentLog(folder)
+        return _segment_logs[folder]
+
+
+def close_segment_logs():
+    with _segment_logs_lock:
+        for log in _segment_logs.values():
+            log.close()
+        _segment_logs.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read a new-listings segment log")
+    parser.add_argument("folder", help="Log folder, e.g. ./data/kijiji/new_listings")
+    parser.add_argument("-o", "--offset", help="First offset to read", type=int, default=None)
+    parser.add_argument(
+        "-c", "--consumer", help="Resume from and commit the offset of this consumer", default=None
+    )
+    parser.add_argument("-n", "--max_records", type=int, default=POLL_RECORDS)
+    args = parser.parse_args()
+
+    if args.consumer:
+        consumer = LogConsumer(args.folder, args.consumer)
+        if args.offset is not None:
+            consumer.seek(args.offset)
+        records = consumer.poll(args.max_records)
+        consumer.commit()
+    else:
+        records = list(itertools.islice(read_log(args.folder, args.offset or 0), args.max_records))
+
+    for record in records:
+        print(json.dumps(record))
@@ -0,0 +1,42 @@
+import archive
+from archive import ResponseArchive, read_index, read_response
+from transport import Response
+
+
+def response(i):
+    content = b'{"results": [{"id": %d, "title": "listing %d", "price": {"amount": 100}}]}' % (i, i)
+    return Response(200, f"https://example.com/search?page={i}", {}, content)
+
+
+def test_close_writes_every_queued_response(tmp_path):
+    responses = ResponseArchive(str(tmp_path), sample_rate=1)
+    for i in range(5):
+        responses.record("offerup", "key", {"query": "iphone"}, response(i), 1700000000.0 + i)
+    responses.close()
+
+    entries = read_index(str(tmp_path), "offerup")
+    assert [entry["ts"] for entry in entries] == [1700000000.0 + i for i in range(5)]
+    assert read_response(str(tmp_path), "offerup", entries[3]) == response(3).content
+
+
+def test_record_does_not_wait_for_the_writer(tmp_path):
+    responses = ResponseArchive(str(tmp_path), sample_rate=1, queue_size=2)
+    # The writer is stuck, e.g. training or on a slow disk
+    with responses.lock:
+        for i in range(5):
+            responses.record("offerup", "key", {}, response(i), 1700000000.0 + i)
+        assert responses.dropped >= 2
+    responses.close()
+    assert len(read_index(str(tmp_path), "offerup")) == 5 - responses.dropped
+
+
+def test_writer_trains_the_dictionary(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "TRAIN_AFTER", 3)
+    responses = ResponseArchive(str(tmp_path), sample_rate=1)
+    for i in range(4):
+        responses.record("offerup", "key", {}, response(i), 1700000000.0 + i)
+    responses.close()
+
+    entries = read_index(str(tmp_path), "offerup")
+    assert [entry["dict"] is None for entry in entries] == [True, True, True, False]
+    assert read_response(str(tmp_path), "offerup", entries[-1]) == response(3).content
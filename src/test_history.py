@@ -0,0 +1,117 @@
+import csv
+import os
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import kijiji  # noqa: E402
+import kijiji_mobile  # noqa: E402
+from history import ListingHistory, import_listings_db, read_history  # noqa: E402
+from seen_store import LEGACY_DBS, make_search_key  # noqa: E402
+
+WRITER_COLUMNS = {"kijiji": kijiji.COLUMNS, "kijiji_mobile": kijiji_mobile.COLUMNS}
+
+
+def write_csv(path, rows):
+    columns = list(dict.fromkeys(column for row in rows for column in row))
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def legacy_key(marketplace):
+    _, key_columns = LEGACY_DBS[marketplace]
+    return key_columns
+
+
+def import_rows(tmp_path, rows, marketplaces):
+    path = tmp_path / "LISING_DB.csv"
+    write_csv(path, rows)
+    history = ListingHistory(str(tmp_path / "history"))
+    imported = import_listings_db(history, str(path), marketplaces)
+    history.close()
+    listings = read_history(str(tmp_path / "history"))
+    if not listings.empty:
+        listings = listings.sort_values("listing_id").reset_index(drop=True)
+    return imported, listings
+
+
+def append_like_the_csv_scrapers(path, columns, rows):
+    import pandas as pd
+
+    pd.DataFrame(rows, columns=columns).to_csv(
+        path, mode="a", index=None, header=not os.path.exists(path)
+    )
+
+
+KIJIJI_MARKETPLACES = [
+    ("kijiji", legacy_key("kijiji"), ("query", "city", "state")),
+    ("kijiji_mobile", legacy_key("kijiji_mobile"), ("query", "lat", "long")),
+]
+
+
+@pytest.mark.parametrize("first", ["kijiji", "kijiji_mobile"])
+def test_import_shared_kijiji_file_once(tmp_path, first):
+    path = str(tmp_path / "LISING_DB.csv")
+    batches = {
+        "kijiji": [
+            # The CLI searches with an empty state by default
+            {
+                "query": "toyota", "city": "Alberta", "state": "", "listing_id": "1",
+                "price": "1200.0 CAD", "time_found": 1700000000.0,
+            },
+        ],
+        "kijiji_mobile": [
+            {
+                "query": "toyota", "lat": 49.2827, "long": -123.1207, "listing_id": "2",
+                "price": "$ 900.0", "car_year": "2012", "time_found": 1700000000.0,
+            },
+        ],
+    }
+    # Only the first writer's header is in the file
+    other = "kijiji_mobile" if first == "kijiji" else "kijiji"
+    for marketplace in (first, other):
+        append_like_the_csv_scrapers(path, WRITER_COLUMNS[marketplace], batches[marketplace])
+
+    history = ListingHistory(str(tmp_path / "history"))
+    imported = import_listings_db(history, path, KIJIJI_MARKETPLACES)
+    history.close()
+    listings = read_history(str(tmp_path / "history")).sort_values("listing_id").reset_index(drop=True)
+
+    assert imported == {"kijiji": 1, "kijiji_mobile": 1}
+    assert listings["listing_id"].tolist() == ["1", "2"]
+    assert listings["marketplace"].tolist() == ["kijiji", "kijiji_mobile"]
+    assert listings["search_key"].tolist() == [
+        make_search_key("toyota", "Alberta", ""),
+        make_search_key("toyota", 49.2827, -123.1207),
+    ]
+    assert listings["price"].tolist() == [1200.0, 900.0]
+    assert listings["car_year"].tolist()[1] == "2012"
+    assert listings["time_found"][0].timestamp() == 1700000000
+
+
+def test_import_ebay_keys_from_the_legacy_columns(tmp_path):
+    rows = [
+        {
+            "query": "iphone", "poctal_code": "10001", "country": "US",
+            "listing_id": "v1|1|0", "price": "$500.00", "time_found": "1700000000",
+        },
+    ]
+    imported, listings = import_rows(
+        tmp_path, rows, [("ebay", legacy_key("ebay"), ("query", "postal_code", "country"))]
+    )
+
+    assert imported == {"ebay": 1}
+    assert listings["search_key"].tolist() == [make_search_key("iphone", "10001", "US")]
+    assert listings["postal_code"].tolist() == ["10001"]
+
+
+def test_import_file_without_the_key_columns(tmp_path):
+    rows = [{"query": "iphone", "listing_id": "1", "time_found": "1700000000"}]
+    imported, listings = import_rows(
+        tmp_path, rows, [("ebay", legacy_key("ebay"), ("query", "postal_code", "country"))]
+    )
+    assert imported == {"ebay": 0}
+    assert listings.empty
@@ -0,0 +1,59 @@
+import pytest
+
+from metrics import SECONDS_BUCKETS, Histogram, Metrics
+
+
+def histogram(values, buckets=SECONDS_BUCKETS):
+    histogram = Histogram(buckets)
+    for value in values:
+        histogram.observe(value)
+    return histogram
+
+
+def test_quantile_interpolates_within_the_bucket():
+    # 0.1 to 10 seconds in steps of 0.1, spread over the 2.5, 5 and 10 buckets
+    samples = histogram([i / 10 for i in range(1, 101)])
+    assert samples.quantile(0.5) == pytest.approx(5.0)
+    assert samples.quantile(0.95) == pytest.approx(9.5)
+    assert samples.quantile(0.25) == pytest.approx(2.5)
+    assert samples.quantile(1.0) == pytest.approx(10.0)
+
+
+def test_quantiles_of_one_bucket_differ():
+    # All in the (0.01, 0.025] bucket, which used to give p50 = p95 = max
+    samples = histogram([0.011 + i * 0.001 for i in range(10)])
+    assert samples.quantile(0.5) == pytest.approx(0.0155)
+    assert samples.quantile(0.5) < samples.quantile(0.95) < samples.max
+
+
+def test_quantile_stays_within_observed_values():
+    samples = histogram([3.0, 3.0, 3.0])
+    assert samples.quantile(0.01) == pytest.approx(3.0)
+    assert samples.quantile(0.99) == pytest.approx(3.0)
+
+
+def test_quantile_above_the_last_bucket():
+    samples = histogram([100.0, 200.0], buckets=(1, 10))
+    assert samples.quantile(0.5) == pytest.approx(150.0)
+    assert samples.quantile(1.0) == pytest.approx(200.0)
+
+
+def test_quantile_of_empty_histogram():
+    assert Histogram(SECONDS_BUCKETS).quantile(0.5) is None
+
+
+def test_summary_reports_interpolated_quantiles():
+    metrics = Metrics()
+    for i in range(1, 101):
+        metrics.observe("stage_seconds", i / 10, stage="fetch")
+    metrics.inc("polls_total", 3, marketplace="offerup")
+    summary = metrics.summary()
+
+    [stage] = summary["histograms"]
+    assert stage["labels"] == {"stage": "fetch"}
+    assert (stage["count"], stage["max"]) == (100, 10.0)
+    assert stage["p50"] == pytest.approx(5.0)
+    assert stage["p95"] == pytest.approx(9.5)
+    assert summary["counters"] == [
+        {"name": "polls_total", "labels": {"marketplace": "offerup"}, "value": 3}
+    ]
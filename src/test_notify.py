@@ -0,0 +1,212 @@
+import asyncio
+import json
+
+from listing_batch import ListingBatch
+from metrics import Metrics
+from notify import FileSink, Notifier, Sink, UnixSocketSink
+
+
+def listings(start, count):
+    batch = ListingBatch(["listing_id", "title", "price"])
+    for i in range(start, start + count):
+        batch.append(str(i), f"listing {i}", "$10")
+    return batch
+
+
+def counters(metrics, name):
+    return {
+        counter["labels"]["sink"]: counter["value"]
+        for counter in metrics.summary()["counters"]
+        if counter["name"] == name
+    }
+
+
+def file_ids(path):
+    with open(path) as file:
+        return [json.loads(line)["listing_id"] for line in file]
+
+
+async def settle(condition, timeout=5):
+    """Let the sink tasks run until `condition()` holds"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline
+        await asyncio.sleep(0.01)
+
+
+class BlockedSink(Sink):
+    """Delivers nothing until `release` is set, records the batches it was given"""
+
+    name = "blocked"
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.release = asyncio.Event()
+        self.batches = []
+
+    async def deliver(self, listings):
+        self.batches.append(listings)
+        await self.release.wait()
+
+
+class FlakySink(Sink):
+    """Fails the first `failures` deliveries"""
+
+    name = "flaky"
+    retry_wait = 0.0
+
+    def __init__(self, failures, **options):
+        super().__init__(**options)
+        self.failures = failures
+        self.attempts = 0
+
+    async def deliver(self, listings):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise ConnectionError("refused")
+
+
+def test_file_sink_writes_every_listing(tmp_path):
+    path = tmp_path / "notifications.jsonl"
+
+    async def run():
+        notifier = Notifier([FileSink(str(path), batch_wait=0)], Metrics())
+        await notifier.start()
+        notifier.notify("offerup", "key", "iphone", listings(0, 3))
+        await notifier.close()
+
+    asyncio.run(run())
+    with open(path) as file:
+        records = [json.loads(line) for line in file]
+    assert [record["listing_id"] for record in records] == ["0", "1", "2"]
+    assert records[0] == {
+        "marketplace": "offerup",
+        "search_key": "key",
+        "search": "iphone",
+        "listing_id": "0",
+        "title": "listing 0",
+        "price": "$10",
+    }
+
+
+def test_unix_socket_sink_sends_batches_of_batch_size(tmp_path):
+    path = str(tmp_path / "listings.sock")
+    metrics = Metrics()
+    received = []
+
+    async def serve(reader, writer):
+        async for line in reader:
+            received.append(json.loads(line))
+
+    async def run():
+        server = await asyncio.start_unix_server(serve, path)
+        notifier = Notifier([UnixSocketSink(path, batch_size=3, batch_wait=0)], metrics)
+        await notifier.start()
+        notifier.notify("offerup", "key", "iphone", listings(0, 7))
+        await settle(lambda: sum(batch["count"] for batch in received) == 7)
+        await notifier.close()
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(run())
+    assert [batch["count"] for batch in received] == [3, 3, 1]
+    assert [listing["listing_id"] for batch in received for listing in batch["listings"]] == [
+        str(i) for i in range(7)
+    ]
+    assert counters(metrics, "notifications_sent_total") == {"unix_socket": 7}
+    assert counters(metrics, "notification_batches_total") == {"unix_socket": 3}
+
+
+def test_full_queue_drops_the_oldest_listings(tmp_path):
+    path = tmp_path / "notifications.jsonl"
+    metrics = Metrics()
+
+    async def run():
+        notifier = Notifier([FileSink(str(path), queue_size=5, batch_wait=0)], metrics)
+        await notifier.start()
+        notifier.notify("offerup", "key", "iphone", listings(0, 8))
+        await notifier.close()
+
+    asyncio.run(run())
+    assert file_ids(path) == ["3", "4", "5", "6", "7"]
+    assert counters(metrics, "notifications_dropped_total") == {"file": 3}
+
+
+def test_slow_sink_does_not_block_the_others(tmp_path):
+    path = tmp_path / "notifications.jsonl"
+    metrics = Metrics()
+
+    async def run():
+        slow = BlockedSink(batch_wait=0)
+        notifier = Notifier([slow, FileSink(str(path), batch_wait=0)], metrics)
+        await notifier.start()
+        notifier.notify("offerup", "key", "iphone", listings(0, 2))
+        await settle(lambda: path.exists() and len(file_ids(path)) == 2)
+
+        # What comes in while the slow sink is busy goes out as one batch
+        notifier.notify("offerup", "key", "iphone", listings(2, 2))
+        notifier.notify("offerup", "key", "iphone", listings(4, 2))
+        await settle(lambda: len(file_ids(path)) == 6)
+        assert len(slow.batches) == 1
+
+        slow.release.set()
+        await notifier.close()
+        return slow
+
+    slow = asyncio.run(run())
+    assert [len(batch) for batch in slow.batches] == [2, 4]
+    assert counters(metrics, "notifications_sent_total") == {"blocked": 6, "file": 6}
+
+
+def test_failed_delivery_is_retried(capsys):
+    metrics = Metrics()
+
+    async def run(sink):
+        notifier = Notifier([sink], metrics)
+        await notifier.start()
+        notifier.notify("offerup", "key", "iphone", listings(0, 2))
+        await notifier.close()
+
+    recovers = FlakySink(failures=2, name="recovers", batch_wait=0)
+    asyncio.run(run(recovers))
+    assert recovers.attempts == 3
+
+    fails = FlakySink(failures=3, name="fails", batch_wait=0)
+    asyncio.run(run(fails))
+    assert fails.attempts == 3
+    assert counters(metrics, "notifications_sent_total") == {"recovers": 2}
+    assert counters(metrics, "notifications_failed_total") == {"fails": 2}
+    assert "Could not notify fails of 2 listings" in capsys.readouterr().out
+
+
+def test_close_delivers_without_waiting_for_the_batch(tmp_path):
+    path = tmp_path / "notifications.jsonl"
+
+    async def run():
+        notifier = Notifier([FileSink(str(path), batch_wait=60)], Metrics())
+        await notifier.start()
+        notifier.notify("offerup", "key", "iphone", listings(0, 2))
+        # The sink is waiting for a batch to fill
+        await asyncio.sleep(0.05)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await notifier.close(timeout=5)
+        return loop.time() - started
+
+    assert asyncio.run(run()) < 1
+    assert file_ids(path) == ["0", "1"]
+
+
+def test_close_gives_up_on_a_hanging_sink():
+    async def run():
+        sink = BlockedSink(batch_wait=0)
+        notifier = Notifier([sink], Metrics())
+        await notifier.start()
+        notifier.notify("offerup", "key", "iphone", listings(0, 2))
+        await settle(lambda: sink.batches)
+        await notifier.close(timeout=0.1)
+        return notifier
+
+    notifier = asyncio.run(run())
+    assert not notifier.deliveries
@@ -0,0 +1,149 @@
+import pytest
+
+import registry
+from daemon import SavedSearch
+from geo import destination_point, distance_list
+from listing_batch import ListingBatch
+from marketplace import Marketplace
+from offerup import OfferUp
+from planner import plan_searches
+
+
+CENTER = (40.0, -74.0)
+
+
+class NearbyMarketplace(Marketplace):
+    """A coalescing marketplace whose listings have coordinates, radius in km"""
+
+    NAME = "nearby"
+    COALESCE = True
+    RANGE_FILTERS = (("min_price", "max_price", "price"),)
+    RADIUS_PARAM = "distance"
+
+    def __init__(
+        self,
+        query: str,
+        lat: float,
+        long: float,
+        min_price: str = None,
+        max_price: str = None,
+        distance: str = "10",
+        sort_by: str = "date",
+    ):
+        self.query = query
+        self.lat = lat
+        self.long = long
+        self.min_price = min_price
+        self.max_price = max_price
+        self.distance = distance
+
+    def listing_distances(self, listings):
+        return distance_list(self.lat, self.long, listings.column("lat"), listings.column("long"))
+
+
+@pytest.fixture
+def nearby(monkeypatch):
+    monkeypatch.setitem(registry.MARKETPLACES, "nearby", "test_planner:NearbyMarketplace")
+    monkeypatch.setitem(registry._classes, "nearby", NearbyMarketplace)
+
+
+def search(marketplace, **params):
+    params.setdefault("query", "iphone")
+    params.setdefault("lat", str(CENTER[0]))
+    params.setdefault("long", str(CENTER[1]))
+    return SavedSearch(marketplace, params)
+
+
+def at(km, **params):
+    lat, long = destination_point(*CENTER, 0, km)
+    return search("nearby", lat=lat, long=long, **params)
+
+
+def test_searches_of_other_prices_share_the_widest_window():
+    searches = [
+        search("offerup", min_price="100", max_price="500"),
+        search("offerup", min_price="50", max_price="300"),
+    ]
+    [(members, params)] = plan_searches(searches)
+    assert members == searches
+    assert (params["min_price"], params["max_price"]) == ("50", "500")
+
+
+def test_search_without_a_bound_leaves_the_request_unbounded():
+    searches = [search("offerup", min_price="100", max_price="500"), search("offerup", max_price="300")]
+    [(_, params)] = plan_searches(searches)
+    assert (params["min_price"], params["max_price"]) == (None, "500")
+
+
+def test_queries_differing_in_case_and_spacing_are_grouped():
+    searches = [search("offerup", query="iPhone  13"), search("offerup", query="iphone 13")]
+    assert [len(members) for members, _ in plan_searches(searches)] == [2]
+
+
+def test_other_request_options_are_not_grouped():
+    searches = [search("offerup"), search("offerup", sort_by="price"), search("offerup", query="ipad")]
+    assert plan_searches(searches) == [([s], None) for s in searches]
+
+
+def test_without_coordinates_center_and_radius_have_to_match():
+    searches = [
+        search("offerup"),
+        search("offerup", lat="40.0000001"),
+        search("offerup", lat="40.1"),
+        search("offerup", distance="30"),
+    ]
+    assert [len(members) for members, _ in plan_searches(searches)] == [2, 1, 1]
+
+
+def test_marketplaces_without_coalesce_are_polled_alone():
+    searches = [search("craiglist"), search("craiglist")]
+    assert plan_searches(searches) == [([s], None) for s in searches]
+
+
+def test_nearby_centers_share_a_covering_circle(nearby):
+    searches = [at(0), at(2), at(2, distance="5")]
+    [(members, params)] = plan_searches(searches)
+    assert members == searches
+    # 2 km off center with a 10 km radius, rounded up in the search's type
+    assert params["distance"] == "13"
+
+
+def test_covering_circle_stays_within_max_growth(nearby):
+    assert [len(members) for members, _ in plan_searches([at(0), at(5)])] == [1, 1]
+    assert [len(members) for members, _ in plan_searches([at(0), at(2)], max_growth=1.1)] == [1, 1]
+    assert [len(members) for members, _ in plan_searches([at(0), at(5)], max_growth=1.6)] == [2]
+
+
+def upstream_batch(rows):
+    batch = ListingBatch(
+        ["query", "lat", "long", "listing_id", "price", "time_found"],
+        constants={"query": "iPhone", "time_found": 1700000000.0},
+    )
+    for row in rows:
+        batch.append(*row)
+    return batch
+
+
+def test_local_listings_keep_the_search_price_window():
+    scraper = OfferUp("iphone", "40.0", "-74.0", min_price="100", max_price="500")
+    listings = upstream_batch(
+        [(None, None, str(i), price) for i, price in enumerate(["$50", "$100", "$300", "$600", None, "$1,000"])]
+    )
+    local = scraper.local_listings(listings)
+    assert local.column("listing_id") == ["1", "2"]
+    assert local.column("query") == ["iphone", "iphone"]
+
+
+def test_local_listings_without_bounds_keep_everything():
+    scraper = OfferUp("iphone", "40.0", "-74.0")
+    listings = upstream_batch([(None, None, "1", None), (None, None, "2", "$5")])
+    assert scraper.local_listings(listings).column("listing_id") == ["1", "2"]
+
+
+def test_local_listings_keep_the_search_circle():
+    scraper = NearbyMarketplace("iphone", *CENTER, distance="10")
+    points = [destination_point(*CENTER, 90, km) for km in (0, 5, 20)] + [(None, None)]
+    listings = upstream_batch([(lat, long, str(i), "$10") for i, (lat, long) in enumerate(points)])
+    local = scraper.local_listings(listings)
+    assert local.column("listing_id") == ["0", "1"]
+    assert local.column("query") == ["iphone", "iphone"]
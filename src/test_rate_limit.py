@@ -0,0 +1,285 @@
+import asyncio
+from email.utils import formatdate
+
+import pytest
+
+import kijiji_helper
+import rate_limit
+import transport
+from metrics import Metrics
+from rate_limit import (
+    BACKOFF,
+    MAX_RETRY_AFTER,
+    SLOW_START_STEP,
+    HostLimiter,
+    RateLimiter,
+    retry_after_seconds,
+)
+from transport import Response, Transport, TransportError
+
+
+class Clock:
+    """Stands in for the time module, time only moves when advanced"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return 1700000000.0 + self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit, "time", clock)
+    return clock
+
+
+def limiter(**limits):
+    limits.setdefault("metrics", Metrics())
+    return HostLimiter("example.com", **limits)
+
+
+def backoffs(host_limiter):
+    return {
+        counter["labels"]["reason"]: counter["value"]
+        for counter in host_limiter.metrics.summary()["counters"]
+        if counter["name"] == "rate_limit_backoffs_total"
+    }
+
+
+def respond(host_limiter, slot, status=200, headers=None):
+    slot.record(status, headers)
+    host_limiter.release(slot)
+
+
+def test_retry_after_seconds(clock):
+    assert retry_after_seconds({"Retry-After": "5"}) == 5.0
+    http_date = formatdate(clock.time() + 30, usegmt=True)
+    assert retry_after_seconds({"Retry-After": http_date}) == pytest.approx(30, abs=1)
+    assert retry_after_seconds({"Retry-After": "-3"}) == 0.0
+    assert retry_after_seconds({"Retry-After": "86400"}) == MAX_RETRY_AFTER
+    assert retry_after_seconds({"Retry-After": "soon"}) is None
+    assert retry_after_seconds({}) is None
+    assert retry_after_seconds(None) is None
+
+
+def test_limits_are_checked():
+    with pytest.raises(ValueError):
+        limiter(min_rate=5, max_rate=1)
+
+
+def test_requests_are_spaced_by_the_rate(clock):
+    host = limiter(rate=2.0, window=10)
+    slots = [host.reserve(None) for _ in range(3)]
+    assert [slot.sent - clock.now for slot in slots] == [0.0, 0.5, 1.0]
+    assert [slot.paced for slot in slots] == [False, True, True]
+
+
+def test_burst_goes_out_at_once(clock):
+    host = limiter(rate=2.0, burst=3, window=10)
+    slots = [host.reserve(None) for _ in range(4)]
+    assert [slot.sent - clock.now for slot in slots] == [0.0, 0.0, 0.0, 0.5]
+
+
+def test_full_window_wakes_a_waiter_on_release(clock):
+    host = limiter(rate=1.0, burst=2, window=2)
+    first, second = host.reserve(None), host.reserve(None)
+    assert second.window_limited
+    woken = []
+    assert host.reserve(lambda: woken.append(True)) is None
+
+    respond(host, first)
+    assert woken == [True]
+    assert host.reserve(None) is not None
+
+
+def test_pushback_backs_off_once_per_flight(clock):
+    host = limiter(rate=10.0, window=8)
+    in_flight = [host.reserve(None) for _ in range(4)]
+    clock.advance(1)
+    for slot in in_flight:
+        respond(host, slot, 429)
+    assert host.rate == pytest.approx(10.0 * BACKOFF)
+    assert host.window == pytest.approx(8 * BACKOFF)
+    assert backoffs(host) == {"429": 1}
+
+    # Sent at the new limits, so it is answered again
+    clock.advance(1)
+    respond(host, host.reserve(None), 503)
+    assert host.rate == pytest.approx(10.0 * BACKOFF ** 2)
+    assert backoffs(host) == {"429": 1, "503": 1}
+
+
+def test_backoff_stops_at_the_minimums(clock):
+    host = limiter(rate=1.0, min_rate=0.8, window=1)
+    respond(host, host.reserve(None), 500)
+    assert (host.rate, host.window) == (0.8, 1)
+
+
+def test_retry_after_holds_every_request_back(clock):
+    host = limiter(rate=20.0, window=8)
+    respond(host, host.reserve(None), 503, {"Retry-After": "10"})
+    assert host.not_before == clock.now + 10
+    assert host.reserve(None).sent == clock.now + 10
+
+
+def test_client_errors_neither_back_off_nor_grow(clock):
+    host = limiter(rate=1.0, window=1)
+    slot = host.reserve(None)
+    respond(host, slot, 404)
+    assert (host.rate, host.window, host.slow_start) == (1.0, 1, True)
+
+
+def test_slow_start_grows_by_whole_steps(clock):
+    host = limiter(rate=1.0, window=1)
+    slot = host.reserve(None)
+    assert slot.window_limited and not slot.paced
+    respond(host, slot)
+    assert host.window == 2
+
+    paced = host.reserve(None)
+    assert paced.paced
+    clock.advance(paced.sent - clock.now)
+    respond(host, paced)
+    assert host.rate == pytest.approx(1.0 + SLOW_START_STEP)
+
+
+def test_window_grows_by_one_per_window_after_backoff(clock):
+    host = limiter(rate=2.0, burst=4, window=4)
+    respond(host, host.reserve(None), 500)
+    window = host.window
+    assert not host.slow_start
+
+    clock.advance(10)
+    slots = [host.reserve(None) for _ in range(int(window))]
+    assert slots[-1].window_limited
+    respond(host, slots[-1])
+    assert host.window == pytest.approx(window + 1 / window)
+
+
+def test_rate_grows_by_rate_step_per_second_after_backoff(clock):
+    host = limiter(rate=2.0, window=4, rate_step=0.2)
+    respond(host, host.reserve(None), 500)
+    rate = host.rate
+
+    clock.advance(10)
+    host.reserve(None)
+    paced = host.reserve(None)
+    clock.advance(paced.sent - clock.now)
+    respond(host, paced)
+    # rate_step / rate per response, rate responses per second
+    assert host.rate == pytest.approx(rate + 0.2 / rate)
+
+
+def test_limits_only_grow_while_requests_wait(clock):
+    host = limiter(rate=1.0, window=4)
+    slot = host.reserve(None)
+    assert not slot.window_limited and not slot.paced
+    respond(host, slot)
+    assert (host.rate, host.window) == (1.0, 4)
+
+
+def test_growth_is_capped(clock):
+    host = limiter(rate=1.0, max_rate=1.1, burst=2, window=2, max_window=2)
+    first, second = host.reserve(None), host.reserve(None)
+    assert second.window_limited
+    respond(host, second)
+    respond(host, first)
+
+    paced = host.reserve(None)
+    clock.advance(paced.sent - clock.now)
+    respond(host, paced)
+    assert (host.rate, host.window) == (1.1, 2)
+
+
+def test_latency_spike_backs_off(clock):
+    host = limiter(rate=20.0, window=1, max_window=1)
+    for latency in [0.1] * 5 + [2.0]:
+        slot = host.reserve(None)
+        clock.advance(latency)
+        respond(host, slot)
+    assert backoffs(host) == {"latency": 1}
+    assert host.rate == pytest.approx(20.0 * BACKOFF)
+
+
+def test_small_latency_increase_is_not_a_spike(clock):
+    host = limiter(rate=20.0, window=1, max_window=1)
+    for latency in [0.01] * 5 + [0.1] * 10:
+        slot = host.reserve(None)
+        clock.advance(latency)
+        respond(host, slot)
+    assert backoffs(host) == {}
+
+
+def test_exception_in_the_slot_backs_off(clock):
+    host = limiter(rate=1.0, window=2)
+    with pytest.raises(ConnectionError):
+        with host.reserve(None):
+            raise ConnectionError
+    assert host.in_flight == 0
+    assert backoffs(host) == {"error": 1}
+
+
+def test_cancellation_in_the_slot_does_not_back_off(clock):
+    host = limiter(rate=1.0, window=2)
+    with pytest.raises(asyncio.CancelledError):
+        with host.reserve(None):
+            raise asyncio.CancelledError
+    assert host.in_flight == 0
+    assert (host.rate, host.window) == (1.0, 2)
+    assert backoffs(host) == {}
+
+
+def test_acquire_blocking_waits_for_its_turn(clock):
+    host = limiter(rate=4.0, window=8)
+    start = clock.now
+    for _ in range(3):
+        host.acquire_blocking()
+    assert clock.now - start == pytest.approx(0.5)
+
+
+def test_rate_limiter_merges_limits_per_host():
+    limiter = RateLimiter({"example.com": {"rate": 3.0}, "api.ebay.com": {"window": 4}}, metrics=Metrics())
+    example = limiter.for_url("https://example.com/search?q=1")
+    assert limiter.for_url("https://example.com/other") is example
+    assert example.rate == 3.0
+    ebay = limiter.for_url("https://api.ebay.com/buy")
+    assert (ebay.window, ebay.max_window) == (4, 16)
+
+
+class StubTransport(Transport):
+    """Answers every request with `status`, through the limiter like the real transports"""
+
+    def __init__(self, status, headers=None):
+        self.status = status
+        self.headers = headers or {}
+        self.urls = []
+
+    def fetch(self, method, url, params=None, headers=None, data=None, timeout=None):
+        with self.slot(url) as slot:
+            self.urls.append(url)
+            slot.record(self.status, self.headers)
+        return Response(self.status, url, self.headers, b'{"data": {}}')
+
+
+def test_kijiji_lookups_wait_for_the_limiter(monkeypatch):
+    stub = StubTransport(429, {"Retry-After": "5"})
+    stub.limiter = RateLimiter(metrics=Metrics())
+    monkeypatch.setattr(transport, "_default_transport", stub)
+
+    with pytest.raises(TransportError):
+        kijiji_helper.post_query({"query": "{}"})
+    assert stub.urls == [kijiji_helper.API_URL]
+    host = stub.limiter.for_url(kijiji_helper.API_URL)
+    assert backoffs(host) == {"429": 1}
+    assert host.not_before > 0
@@ -0,0 +1,188 @@
+import math
+import time
+
+import pytest
+
+from daemon import SavedSearch
+from kijiji_mobile import KijijiMobile
+from listing_batch import ListingBatch
+from scheduler import MAX_STEP, AdaptiveScheduler, ArrivalRate, DecayingRate
+
+
+START = 1700000000.0
+PAGE = 10
+
+
+def new_search(interval=600, tile=False, **params):
+    params = {"query": "toyota", "lat": "45.2731", "long": "-73.1214", "limit": str(PAGE), **params}
+    return SavedSearch("kijiji_mobile", params, interval, tile=tile)
+
+
+def batch(posted_times, prefix="a"):
+    listings = ListingBatch(["listing_id", "sorted_time"])
+    for i, posted in enumerate(posted_times):
+        listings.append(f"{prefix}{i}", posted)
+    return listings
+
+
+def poll(scheduler, search, checked, posted_times=(), prefix=None):
+    scheduler.observe(search, batch(posted_times, prefix or str(checked)), checked)
+    return scheduler.next_interval(search, checked)
+
+
+def test_interval_bounds_are_checked():
+    with pytest.raises(ValueError):
+        AdaptiveScheduler(min_interval=100, max_interval=10)
+
+
+def test_search_starts_at_its_own_interval():
+    scheduler = AdaptiveScheduler()
+    assert scheduler.next_interval(new_search(interval=600), START) == 600
+    # Within the bounds
+    assert AdaptiveScheduler(max_interval=300).next_interval(new_search(interval=600), START) == 300
+
+
+def test_decaying_rate_halves_old_observations():
+    rate = DecayingRate(half_life=100)
+    rate.add(10, 100)
+    rate.add(0, 100)
+    assert (rate.events, rate.seconds) == (5.0, 150.0)
+    assert DecayingRate(100).rate() is None
+    assert rate.rate(prior_rate=1.0, prior_seconds=50) == pytest.approx(55 / 200)
+
+
+def test_first_poll_counts_back_to_the_oldest_listing():
+    rate = ArrivalRate()
+    rate.observe([START - 300, START - 100, START - 200, None], START)
+    # The oldest listing marks the start of the page, two came after it
+    assert rate.rate(START) == pytest.approx(2 / 300)
+
+    rate.observe([START + 50], START + 100)
+    assert rate.last_checked == START + 100
+
+
+def test_interval_follows_the_square_root_of_the_rate():
+    scheduler = AdaptiveScheduler(base_interval=1200)
+    search = new_search(interval=600)
+    poll(scheduler, search, START)
+    # Four new listings an hour, half the interval of one an hour
+    interval = poll(scheduler, search, START + 3600, [START + 600 * i for i in range(1, 5)])
+    assert interval == pytest.approx(600)
+
+
+def test_interval_changes_by_at_most_max_step_per_poll():
+    scheduler = AdaptiveScheduler(min_interval=1, base_interval=1200)
+    search = new_search(interval=600)
+    poll(scheduler, search, START)
+    # Hundreds of listings an hour would want a few seconds at once
+    now = START + 600
+    interval = poll(scheduler, search, now, [now - i for i in range(PAGE - 1)])
+    assert interval == pytest.approx(600 / MAX_STEP)
+
+    intervals = []
+    for _ in range(10):
+        now += interval
+        interval = poll(scheduler, search, now, [now - i for i in range(PAGE - 1)])
+        intervals.append(interval)
+    assert all(later >= earlier / MAX_STEP - 1e-9 for earlier, later in zip(intervals, intervals[1:]))
+    assert intervals == sorted(intervals, reverse=True)
+    assert intervals[-1] < 100
+
+
+def test_busy_search_stops_at_min_interval():
+    scheduler = AdaptiveScheduler(min_interval=60, base_interval=1200)
+    search = new_search(interval=120)
+    now = START
+    interval = poll(scheduler, search, now)
+    for _ in range(10):
+        now += interval
+        # 9 listings a minute would want 52 seconds
+        interval = poll(scheduler, search, now, [now - i for i in range(PAGE - 1)])
+    assert interval == 60
+
+
+def test_dead_search_backs_off_to_max_interval():
+    scheduler = AdaptiveScheduler(max_interval=3600)
+    search = new_search(interval=60)
+    now = START
+    intervals = [poll(scheduler, search, now)]
+    while intervals[-1] < 3600:
+        now += intervals[-1]
+        intervals.append(poll(scheduler, search, now))
+        assert len(intervals) < 20
+    assert intervals[:3] == [60, 120, 240]
+    assert intervals[-1] == 3600
+
+
+def test_full_page_shortens_the_interval():
+    scheduler = AdaptiveScheduler(base_interval=1200)
+    search = new_search(interval=600)
+    poll(scheduler, search, START)
+    # Few listings an hour, but a whole page of them new at once
+    now = START + 36000
+    assert poll(scheduler, search, now, [now - 60 * i for i in range(PAGE)]) == 300
+    # The next poll that finds less goes by the rate again
+    assert poll(scheduler, search, now + 300) == 600
+
+
+def test_tiled_search_has_no_full_pages():
+    scheduler = AdaptiveScheduler(base_interval=1200)
+    search = new_search(interval=600, tile=True)
+    poll(scheduler, search, START)
+    now = START + 36000
+    assert poll(scheduler, search, now, [now - 60 * i for i in range(PAGE)]) == 1200
+
+
+def test_group_listings_count_once():
+    scheduler = AdaptiveScheduler()
+    search = new_search()
+    scheduler.observe(search, batch([]), START)
+    scheduler.observe(search, [batch([START + 10, START + 20]), batch([START + 10])], START + 100)
+    assert scheduler.arrival_rate(search).rate(START + 100) == pytest.approx(2 / 100)
+
+
+def local_time(day, hour):
+    return time.mktime((2024, 6, day, hour, 0, 0, 0, 0, -1))
+
+
+def test_profile_keeps_the_rate_per_hour_of_day():
+    rate = ArrivalRate(profile=True)
+    rate.observe([], local_time(1, 0))
+    # A week of hourly polls, new listings only between 9 and 10
+    for day in range(1, 8):
+        for hour in range(24):
+            checked = local_time(day, hour) + 3600
+            posted = [checked - 60 * i for i in range(1, 7)] if hour == 9 else []
+            rate.observe(posted, checked)
+
+    busy = rate.rate(local_time(8, 9) + 1800)
+    quiet = rate.rate(local_time(8, 15) + 1800)
+    assert busy > 10 * quiet
+    assert rate.rate(local_time(8, 9)) == busy
+    # The overall rate lies in between
+    assert quiet < rate.overall.rate() < busy
+
+
+def test_seed_starts_from_the_listing_history(tmp_path):
+    pytest.importorskip("pyarrow")
+    from history import ListingHistory
+
+    search = new_search(interval=600)
+    search.scraper = KijijiMobile(**search.params)
+    other = new_search(interval=600, query="honda")
+    other.scraper = KijijiMobile(**other.params)
+
+    now = time.time()
+    history = ListingHistory(str(tmp_path))
+    found = [now - 3600 * 6 + 600 * i for i in range(37)]
+    listings = batch([value - 60 for value in found]).to_dataframe()
+    listings["time_found"] = found
+    history.record("kijiji_mobile", search.scraper.search_key(), search.scraper.search_fields(), listings)
+    history.close()
+
+    scheduler = AdaptiveScheduler(base_interval=1200)
+    assert scheduler.seed([search, other], str(tmp_path)) == 1
+    # 37 listings over the 6 hours they were found in
+    assert scheduler.arrival_rate(search).rate(now) == pytest.approx(37 / 21600)
+    assert scheduler.arrival_rate(other).rate(now) is None
+    assert scheduler.next_interval(search, now) == pytest.approx(1200 * math.sqrt(6 / 37))
@@ -0,0 +1,165 @@
+import csv
+import os
+
+import pytest
+
+import kijiji
+import kijiji_mobile
+from seen_store import (
+    CHUNK_SIZE,
+    CachedSeenStore,
+    MemorySeenStore,
+    SQLiteSeenStore,
+    import_csv,
+    make_search_key,
+)
+from watermark import Watermark
+
+
+WRITER_COLUMNS = {"kijiji": kijiji.COLUMNS, "kijiji_mobile": kijiji_mobile.COLUMNS}
+
+
+@pytest.fixture(params=["memory", "sqlite", "cached"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        store = MemorySeenStore()
+    elif request.param == "sqlite":
+        store = SQLiteSeenStore(str(tmp_path / "seen.db"))
+    else:
+        store = CachedSeenStore(SQLiteSeenStore(str(tmp_path / "seen.db")))
+    yield store
+    store.close()
+
+
+def test_filter_new_keeps_unseen_ids_once_in_order(store):
+    store.add("offerup", "key", ["2"])
+    assert store.filter_new("offerup", "key", ["3", "1", 2, "3", 1]) == ["3", "1"]
+
+
+def test_added_ids_are_not_new_again(store):
+    new_ids = store.filter_new("offerup", "key", ["1", "2"])
+    store.add("offerup", "key", new_ids)
+    assert store.filter_new("offerup", "key", ["1", "2", "3"]) == ["3"]
+
+
+def test_seen_ids_are_per_marketplace_and_search(store):
+    store.add("offerup", "key", ["1"])
+    assert store.filter_new("offerup", "other key", ["1"]) == ["1"]
+    assert store.filter_new("craiglist", "key", ["1"]) == ["1"]
+
+
+def test_filter_new_beyond_one_chunk(store):
+    listing_ids = [str(i) for i in range(CHUNK_SIZE * 2 + 7)]
+    store.add("offerup", "key", listing_ids[::2])
+    assert store.filter_new("offerup", "key", listing_ids) == listing_ids[1::2]
+
+
+def test_watermark_round_trip(store):
+    assert store.get_watermark("offerup", "key") is None
+    watermark = Watermark(1700000000.0, ["a", "b"])
+    store.set_watermark("offerup", "key", watermark)
+    loaded = store.get_watermark("offerup", "key")
+    assert (loaded.posted, loaded.listing_ids) == (1700000000.0, {"a", "b"})
+
+
+def test_sqlite_store_keeps_ids_across_reopen(tmp_path):
+    path = str(tmp_path / "seen.db")
+    store = SQLiteSeenStore(path)
+    store.add("offerup", "key", ["1"])
+    store.close()
+
+    store = SQLiteSeenStore(path)
+    assert store.filter_new("offerup", "key", ["1", "2"]) == ["2"]
+    store.close()
+
+
+def test_cached_store_only_asks_backing_store_about_unknown_ids(tmp_path):
+    backing = SQLiteSeenStore(str(tmp_path / "seen.db"))
+    store = CachedSeenStore(backing)
+    store.add("offerup", "key", ["1"])
+
+    asked = []
+    filter_new = backing.filter_new
+    backing.filter_new = lambda *args: asked.append(list(args[2])) or filter_new(*args)
+    assert store.filter_new("offerup", "key", ["1", "2"]) == ["2"]
+    assert asked == [["2"]]
+    store.close()
+
+
+def write_csv(path, rows):
+    columns = list(dict.fromkeys(column for row in rows for column in row))
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def append_csv(path, columns, rows):
+    """Append the way the csv scrapers did, with a header only if the file is new"""
+    header = not os.path.exists(path)
+    with open(path, "a", newline="") as file:
+        writer = csv.DictWriter(file, columns)
+        if header:
+            writer.writeheader()
+        writer.writerows(rows)
+
+
+def kijiji_row(listing_id, state=""):
+    return {"query": "toyota", "city": "Alberta", "state": state, "listing_id": listing_id}
+
+
+def kijiji_mobile_row(listing_id):
+    return {"query": "toyota", "lat": "45.2731", "long": "-73.1214", "listing_id": listing_id}
+
+
+def test_import_csv(tmp_path):
+    path = tmp_path / "LISING_DB.csv"
+    write_csv(
+        path,
+        [
+            {"query": "toyota", "lat": "40.7128", "long": "-74.0060", "listing_id": "123.0"},
+            {"query": "toyota", "lat": "40.71280", "long": "-74.006", "listing_id": "124"},
+            {"query": "toyota", "lat": "40.7128", "long": "-74.0060", "listing_id": ""},
+        ],
+    )
+    store = SQLiteSeenStore(str(tmp_path / "seen.db"))
+    assert import_csv(store, "offerup", str(path), ("query", "lat", "long")) == 2
+
+    key = make_search_key("toyota", 40.7128, -74.006)
+    assert store.filter_new("offerup", key, ["123", "124", "125"]) == ["125"]
+    store.close()
+
+
+@pytest.mark.parametrize("first", ["kijiji", "kijiji_mobile"])
+def test_import_shared_kijiji_csv(tmp_path, first):
+    # Both scrapers appended to one file, only the first one wrote a header
+    path = str(tmp_path / "LISING_DB.csv")
+    batches = {
+        "kijiji": [kijiji_row("1"), kijiji_row("2", state="AB")],
+        "kijiji_mobile": [kijiji_mobile_row("3")],
+    }
+    writes = [first, *(m for m in batches if m != first), first]
+    for marketplace in writes:
+        append_csv(path, WRITER_COLUMNS[marketplace], batches[marketplace])
+
+    store = SQLiteSeenStore(str(tmp_path / "seen.db"))
+    for marketplace, key_columns in (
+        ("kijiji", ("query", "city", "state")),
+        ("kijiji_mobile", ("query", "lat", "long")),
+    ):
+        imported = import_csv(store, marketplace, path, key_columns)
+        assert imported == len(batches[marketplace]) * writes.count(marketplace)
+
+    # The CLI searches with an empty state by default
+    empty_state = make_search_key("toyota", "Alberta", "")
+    assert store.filter_new("kijiji", empty_state, ["1", "2", "3"]) == ["2", "3"]
+    assert store.filter_new("kijiji", make_search_key("toyota", "Alberta", "AB"), ["2"]) == []
+    mobile = make_search_key("toyota", 45.2731, -73.1214)
+    assert store.filter_new("kijiji_mobile", mobile, ["1", "3"]) == ["1"]
+    store.close()
+
+
+def test_import_missing_csv(tmp_path):
+    store = SQLiteSeenStore(str(tmp_path / "seen.db"))
+    assert import_csv(store, "offerup", str(tmp_path / "missing.csv"), ("query",)) == 0
+    store.close()
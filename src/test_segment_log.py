@@ -0,0 +1,148 @@
+import json
+import multiprocessing
+import os
+
+from segment_log import (
+    INDEX_SUFFIX,
+    LOG_SUFFIX,
+    LogConsumer,
+    SegmentLog,
+    read_index,
+    read_log,
+    segment_name,
+    segment_offsets,
+)
+
+
+def records(start, count, writer="a"):
+    return [{"listing_id": f"{writer}{i}"} for i in range(start, start + count)]
+
+
+def offsets(folder, offset=0):
+    return [record["offset"] for record in read_log(folder, offset)]
+
+
+def test_append_assigns_consecutive_offsets(tmp_path):
+    log = SegmentLog(str(tmp_path))
+    assert log.append(records(0, 3)) == 0
+    assert log.append([]) is None
+    assert log.append(records(3, 2)) == 3
+    log.close()
+    assert [record["listing_id"] for record in read_log(str(tmp_path))] == [f"a{i}" for i in range(5)]
+    assert offsets(str(tmp_path), 2) == [2, 3, 4]
+
+
+def test_restart_appends_to_the_last_segment(tmp_path):
+    folder = str(tmp_path)
+    for run in range(3):
+        log = SegmentLog(folder)
+        assert log.append(records(run * 2, 2)) == run * 2
+        log.close()
+
+    assert segment_offsets(folder) == [0]
+    assert offsets(folder) == list(range(6))
+
+
+def test_restart_drops_a_partly_written_record(tmp_path):
+    folder = str(tmp_path)
+    log = SegmentLog(folder)
+    log.append(records(0, 2))
+    log.close()
+    with open(os.path.join(folder, segment_name(0, LOG_SUFFIX)), "ab") as file:
+        file.write(b'{"offset": 2, "listing_id": "cut sh')
+
+    log = SegmentLog(folder)
+    assert log.append(records(2, 1, "b")) == 2
+    log.close()
+    assert [record["listing_id"] for record in read_log(folder)] == ["a0", "a1", "b2"]
+
+
+def test_restart_drops_index_entries_past_the_log(tmp_path):
+    folder = str(tmp_path)
+    log = SegmentLog(folder, index_interval=1)
+    log.append(records(0, 4))
+    log.close()
+    log_path = os.path.join(folder, segment_name(0, LOG_SUFFIX))
+    with open(log_path, "rb") as file:
+        first_two = len(file.readline()) + len(file.readline())
+    os.truncate(log_path, first_two)
+
+    log = SegmentLog(folder, index_interval=1)
+    assert log.append(records(2, 1, "b")) == 2
+    log.close()
+    index = read_index(os.path.join(folder, segment_name(0, INDEX_SUFFIX)))
+    assert [relative for relative, _ in index] == [0, 1, 2]
+    assert [record["listing_id"] for record in read_log(folder, 2)] == ["b2"]
+
+
+def test_full_segments_roll(tmp_path):
+    folder = str(tmp_path)
+    log = SegmentLog(folder, max_segment_bytes=100, index_interval=50)
+    for i in range(10):
+        log.append(records(i * 3, 3))
+    log.close()
+
+    bases = segment_offsets(folder)
+    assert len(bases) > 1 and bases[0] == 0
+    assert offsets(folder) == list(range(30))
+    assert offsets(folder, 17) == list(range(17, 30))
+
+    # A restart keeps filling the last segment only while it has room
+    log = SegmentLog(folder, max_segment_bytes=100)
+    log.append(records(30, 3))
+    log.close()
+    assert segment_offsets(folder)[:-1] == bases
+    assert offsets(folder) == list(range(33))
+
+
+def test_consumer_resumes_from_its_commit(tmp_path):
+    folder = str(tmp_path)
+    log = SegmentLog(folder)
+    log.append(records(0, 5))
+    consumer = LogConsumer(folder, "notify")
+    assert [record["offset"] for record in consumer.poll(3)] == [0, 1, 2]
+    consumer.commit()
+    consumer.poll()
+
+    consumer = LogConsumer(folder, "notify")
+    assert [record["offset"] for record in consumer.poll()] == [3, 4]
+    log.close()
+
+
+def write_batches(folder, writer, batches, max_segment_bytes):
+    log = SegmentLog(folder, max_segment_bytes=max_segment_bytes, index_interval=256)
+    for i in range(batches):
+        log.append(records(i * 5, 5, writer))
+    log.close()
+
+
+def test_concurrent_writers_never_share_offsets(tmp_path):
+    folder = str(tmp_path)
+    writers = [
+        multiprocessing.Process(target=write_batches, args=(folder, writer, 200, 20000))
+        for writer in ("a", "b")
+    ]
+    for process in writers:
+        process.start()
+    for process in writers:
+        process.join()
+    assert [process.exitcode for process in writers] == [0, 0]
+
+    written = list(read_log(folder))
+    assert [record["offset"] for record in written] == list(range(2000))
+    assert sorted(record["listing_id"] for record in written) == sorted(
+        f"{writer}{i}" for writer in ("a", "b") for i in range(1000)
+    )
+    # Every writer's own records stay in the order it appended them
+    for writer in ("a", "b"):
+        own = [int(record["listing_id"][1:]) for record in written if record["listing_id"][0] == writer]
+        assert own == list(range(1000))
+
+    # Every segment starts with its base offset and indexes its records
+    for base in segment_offsets(folder):
+        with open(os.path.join(folder, segment_name(base, LOG_SUFFIX)), "rb") as file:
+            lines = file.read().splitlines()
+        assert json.loads(lines[0])["offset"] == base
+        for relative, position in read_index(os.path.join(folder, segment_name(base, INDEX_SUFFIX))):
+            assert offsets(folder, base + relative)[0] == base + relative
+            assert position <= sum(len(line) + 1 for line in lines)
@@ -0,0 +1,119 @@
+import math
+
+import pytest
+
+from geo import calculate_distance
+from tiling import SMOOTHING, TILE_MARGIN, Tile, TilePlan
+
+
+CENTER = (45.5, -73.6)
+PAGE = 40
+
+
+def ids(prefix, count):
+    return [f"{prefix}{i}" for i in range(count)]
+
+
+def poll(plan, parsed):
+    """Observe `parsed(tile)` listing ids on every leaf and update the plan"""
+    for tile in plan.leaves():
+        tile.observe(parsed(tile))
+    return plan.update()
+
+
+def full(tile):
+    return ids(f"{tile.x},{tile.y}:", PAGE)
+
+
+def test_plan_starts_as_the_search_circle():
+    plan = TilePlan(CENTER, 20.0, PAGE)
+    [root] = plan.leaves()
+    assert (root.x, root.y, root.radius) == (0.0, 0.0, 20.0)
+    assert root.center == pytest.approx(CENTER)
+
+
+def test_full_tile_splits_into_quarters():
+    plan = TilePlan(CENTER, 20.0, PAGE)
+    assert poll(plan, full) == (1, 0)
+
+    quarters = plan.leaves()
+    assert sorted((tile.x, tile.y) for tile in quarters) == [(-10, -10), (-10, 10), (10, -10), (10, 10)]
+    for tile in quarters:
+        assert tile.side == 20.0
+        assert tile.radius == pytest.approx(10 * math.sqrt(2) * TILE_MARGIN)
+        # The tile's center is where its x and y put it
+        assert calculate_distance(*CENTER, *tile.center) == pytest.approx(math.hypot(10, 10), rel=1e-3)
+
+
+def test_tile_below_split_fill_is_kept():
+    plan = TilePlan(CENTER, 20.0, PAGE, split_fill=0.8)
+    assert poll(plan, lambda tile: ids("a", 31)) == (0, 0)
+    assert len(plan.leaves()) == 1
+
+
+def test_parsed_is_smoothed_over_polls():
+    tile = Tile(CENTER, 0.0, 0.0, 2.0, 1.0)
+    tile.observe(ids("a", 10))
+    assert tile.parsed == 10
+    tile.observe(ids("a", 30))
+    assert tile.parsed == 10 + SMOOTHING * 20
+
+
+def test_quiet_quarters_merge_back():
+    plan = TilePlan(CENTER, 20.0, PAGE, merge_fill=0.5)
+    poll(plan, full)
+    # The same 15 listings in every quarter count once
+    assert poll(plan, lambda tile: ids("a", 15)) == (0, 1)
+    [root] = plan.leaves()
+    assert root is plan.root and root.parsed == 15
+
+
+def test_quarters_parsing_half_a_page_together_stay_split():
+    plan = TilePlan(CENTER, 20.0, PAGE, merge_fill=0.5)
+    poll(plan, full)
+    assert poll(plan, lambda tile: ids(f"{tile.x},{tile.y}:", 5)) == (0, 0)
+    assert len(plan.leaves()) == 4
+
+
+def test_split_quarters_do_not_merge_their_parent():
+    plan = TilePlan(CENTER, 20.0, PAGE)
+    poll(plan, full)
+    poll(plan, lambda tile: full(tile) if (tile.x, tile.y) == (10, 10) else ids("a", 1))
+    assert len(plan.leaves()) == 7
+
+    # The quiet quarters of the root keep a split sibling, only its
+    # own quarters can merge
+    assert poll(plan, lambda tile: ids("a", 1)) == (0, 1)
+    assert len(plan.leaves()) == 4
+
+
+def test_quarters_outside_the_circle_are_left_out():
+    plan = TilePlan(CENTER, 20.0, PAGE, min_tile_km=0.0)
+    tile = plan.root
+    for _ in range(3):
+        plan.split(tile)
+        tile = max(tile.children, key=lambda child: (child.x, child.y))
+    # The corner quarter of the third split is past the search's circle
+    assert len(tile.parent.children) == 3
+    for leaf in plan.leaves():
+        assert math.hypot(leaf.x, leaf.y) - leaf.radius < plan.root.radius
+
+
+def test_tiles_stop_splitting_at_min_tile_km():
+    plan = TilePlan(CENTER, 2.0, PAGE, min_tile_km=1.0)
+    assert poll(plan, full) == (1, 0)
+    # Quarters of the 2 km tiles would have a radius under 1 km
+    assert poll(plan, full) == (0, 0)
+    assert len(plan.leaves()) == 4
+
+
+def test_max_tiles_splits_the_fullest_tiles_first():
+    plan = TilePlan(CENTER, 20.0, PAGE, max_tiles=7)
+    poll(plan, full)
+    fullest = (10, -10)
+    assert poll(plan, lambda tile: ids(f"{tile.x},{tile.y}:", PAGE + ((tile.x, tile.y) == fullest))) == (1, 0)
+    assert len(plan.leaves()) == 7
+    assert [(tile.x, tile.y) for tile in plan.leaves() if tile.side == 10] == [(5, -15), (5, -5), (15, -15), (15, -5)]
+
+    assert poll(plan, full) == (0, 0)
+    assert len(plan.leaves()) == 7
@@ -0,0 +1,71 @@
+from watermark import STOP_AFTER, Cutoff, Watermark, oldest_watermark, posted_timestamp
+
+
+def test_posted_timestamp():
+    assert posted_timestamp(1700000000) == 1700000000.0
+    assert posted_timestamp("1700000000") == 1700000000.0
+    assert posted_timestamp("2023-11-14T22:13:20Z") == 1700000000.0
+    assert posted_timestamp("2023-11-14T22:13:20") == 1700000000.0
+    for value in (None, "", "yesterday", float("nan"), True):
+        assert posted_timestamp(value) is None
+
+
+def test_covers_older_and_seen_ties_only():
+    watermark = Watermark(100.0, ["a"])
+    assert watermark.covers(99, "x")
+    assert watermark.covers(100, "a")
+    assert not watermark.covers(100, "b")
+    assert not watermark.covers(101, "x")
+    assert not watermark.covers(None, "x")
+
+
+def test_advance_keeps_the_newer_watermark():
+    old = Watermark(100.0, ["a"])
+    new = Watermark(200.0, ["b"])
+    assert old.advance(new) is new
+    assert new.advance(old) is new
+    assert old.advance(None) is old
+
+
+def test_advance_merges_ids_of_a_tie():
+    assert Watermark(100.0, ["a"]).advance(Watermark(100.0, ["b"])) == Watermark(100.0, ["a", "b"])
+
+
+def test_from_listings_ignores_times_after_the_check():
+    watermark = Watermark.from_listings(
+        [100, 300, 200, 200, None], ["a", "bumped", "b", "c", "d"], time_checked=250
+    )
+    assert watermark == Watermark(200.0, ["b", "c"])
+    assert Watermark.from_listings([None], ["a"]) is None
+
+
+def test_dumps_round_trip():
+    watermark = Watermark(100.5, ["b", "a"])
+    assert Watermark.loads(watermark.dumps()) == watermark
+
+
+def test_oldest_watermark_keeps_ids_all_searches_saw():
+    watermarks = [Watermark(100.0, ["a", "b"]), Watermark(100.0, ["b"]), Watermark(200.0)]
+    assert oldest_watermark(watermarks) == Watermark(100.0, ["b"])
+    assert oldest_watermark([Watermark(100.0), None]) is None
+    assert oldest_watermark([]) is None
+
+
+def test_cutoff_without_watermark_never_stops():
+    cutoff = Cutoff(None)
+    assert not any(cutoff.passed(0, str(i)) for i in range(STOP_AFTER * 2))
+
+
+def test_cutoff_stops_after_stop_after_listings_in_a_row():
+    cutoff = Cutoff(Watermark(100.0))
+    passed = [cutoff.passed(50, str(i)) for i in range(STOP_AFTER)]
+    assert passed == [False] * (STOP_AFTER - 1) + [True]
+    assert cutoff.reached
+
+
+def test_cutoff_tolerates_old_listings_between_new_ones():
+    # Promoted ads ahead of the newest listings are older than the watermark
+    cutoff = Cutoff(Watermark(100.0))
+    page = [50] * (STOP_AFTER - 1) + [150] + [50] * (STOP_AFTER - 1)
+    assert not any(cutoff.passed(posted, str(i)) for i, posted in enumerate(page))
+    assert cutoff.passed(50, "last")
@@ -93,9 +93,10 @@ class KijijiAPI:
             return None
 
 
-# Create an instance of the class and call the make_request method
-kijiji_api_instance = KijijiAPI()
-response = kijiji_api_instance.make_request()
-print(
-    json.dumps(response, indent=2)
-)  # Print the formatted response or None if the request failed
+if __name__ == "__main__":
+    # Create an instance of the class and call the make_request method
+    kijiji_api_instance = KijijiAPI()
+    response = kijiji_api_instance.make_request()
+    print(
+        json.dumps(response, indent=2)
+    )  # Print the formatted response or None if the request failed
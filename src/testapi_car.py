@@ -91,13 +91,15 @@ class KijijiAPI:
             print(f"Request failed with status code: {response.status_code}")
             return None, 0  # Return None for the data and 0 for the size
 
-# Create an instance of the class and call the make_request method
-kijiji_api_instance = KijijiAPI()
-response_data, response_size_kb = kijiji_api_instance.make_request()
 
-# Print the formatted response or None if the request failed
-if response_data is not None:
-    print(json.dumps(response_data, indent=2))
-    print(f"Response size: {response_size_kb:.2f} KB")  # Print the response size in KB
-else:
-    print("No response data to display.")
+if __name__ == "__main__":
+    # Create an instance of the class and call the make_request method
+    kijiji_api_instance = KijijiAPI()
+    response_data, response_size_kb = kijiji_api_instance.make_request()
+
+    # Print the formatted response or None if the request failed
+    if response_data is not None:
+        print(json.dumps(response_data, indent=2))
+        print(f"Response size: {response_size_kb:.2f} KB")  # Print the response size in KB
+    else:
+        print("No response data to display.")
@@ -0,0 +1,244 @@
+import asyncio
+import math
+
+from geo import destination_point
+from listing_batch import merge_batches
+from planner import radius_value, search_value
+
+
+SPLIT_FILL = 0.8  # share of its page a tile may parse before it is split
+MERGE_FILL = 0.5  # share of a page the tiles of a split parse together before they are merged back
+SMOOTHING = 0.5  # weight of the last poll in the listings a tile parses per poll
+MIN_TILE_KM = 1.0
+MAX_TILES = 64  # requests per poll of one search
+TILE_MARGIN = 1.01  # tiles are laid out on a flat map around the search, this covers its distortion
+
+
+def can_tile(cls):
+    """
+    Whether searches of a marketplace can be split into tiles: its request
+    takes a center, a radius and a page size, and its parsers stop at the
+    watermark, so what a tile parses is what was posted since the last poll.
+    """
+    return (
+        cls.RADIUS_PARAM is not None
+        and cls.PAGE_SIZE_PARAM is not None
+        and cls.WATERMARK_COLUMN is not None
+    )
+
+
+class Tile:
+    """
+    Square of a tiled search, `x` and `y` km east and north of the search's
+    center to the square's center, fetched as the circle around the square.
+    """
+
+    def __init__(self, origin, x: float, y: float, side: float, radius: float, parent=None):
+        self.x = x
+        self.y = y
+        self.side = side
+        self.radius = radius  # km
+        self.center = destination_point(
+            *origin, math.degrees(math.atan2(x, y)), math.hypot(x, y)
+        )
+        self.parent = parent
+        self.children = []
+        self.parsed = None  # listings the tile parses per poll, smoothed over polls
+        self.listing_ids = set()  # of the last poll
+        self.scraper = None
+
+    def observe(self, listing_ids):
+        self.listing_ids = set(listing_ids)
+        if self.parsed is None:
+            self.parsed = len(self.listing_ids)
+        else:
+            self.parsed += SMOOTHING * (len(self.listing_ids) - self.parsed)
+
+    def leaves(self):
+        if not self.children:
+            return [self]
+        return [leaf for child in self.children for leaf in child.leaves()]
+
+
+class TilePlan:
+    """
+    Tiles covering the circle of a search, sized by the listings each of
+    them parses per poll. It starts as the search's own circle, split it is
+    the four quarters of the square around it. A tile that parses more than
+    `split_fill` of its page is split into its four quarters the next poll,
+    the quarters of a tile that parse less than `merge_fill` of a page
+    together are merged back. Dense areas end up with small tiles and
+    sparse ones with large tiles.
+
+    The circle of a quarter lies within the circle of its square, so the
+    tiles of a split cover no more ground than the tile did.
+    """
+
+    def __init__(
+        self,
+        center,
+        radius: float,
+        page_size: int,
+        split_fill: float = SPLIT_FILL,
+        merge_fill: float = MERGE_FILL,
+        min_tile_km: float = MIN_TILE_KM,
+        max_tiles: int = MAX_TILES,
+    ):
+        self.root = Tile(center, 0.0, 0.0, 2 * radius, radius)
+        self.page_size = page_size
+        self.split_fill = split_fill
+        self.merge_fill = merge_fill
+        self.min_tile_km = min_tile_km
+        self.max_tiles = max_tiles
+
+    def leaves(self):
+        return self.root.leaves()
+
+    def split(self, tile):
+        side = tile.side / 2
+        radius = side / math.sqrt(2) * TILE_MARGIN
+        tile.children = [
+            Tile(self.root.center, tile.x + dx * side / 2, tile.y + dy * side / 2, side, radius, tile)
+            for dx in (-1, 1)
+            for dy in (-1, 1)
+            # Quarters outside the search's circle are left out
+            if math.hypot(tile.x + dx * side / 2, tile.y + dy * side / 2) - radius < self.root.radius
+        ]
+
+    def update(self):
+        """Split and merge tiles after a poll, (splits, merges)"""
+        merges = 0
+        parents = {id(leaf.parent): leaf.parent for leaf in self.leaves() if leaf.parent}
+        for parent in parents.values():
+            children = parent.children
+            if any(child.children for child in children):
+                continue
+            # The quarters overlap, a listing in several of them is counted once
+            parsed = len(set().union(*(child.listing_ids for child in children)))
+            if parsed < self.merge_fill * self.page_size:
+                parent.children = []
+                parent.parsed = parsed
+                merges += 1
+
+        splits = 0
+        leaves = self.leaves()
+        count = len(leaves)
+        full = [
+            leaf
+            for leaf in leaves
+            if leaf.parsed >= self.split_fill * self.page_size
+            and leaf.side / 2 / math.sqrt(2) >= self.min_tile_km
+        ]
+        for leaf in sorted(full, key=lambda leaf: leaf.parsed, reverse=True):
+            if count + 3 > self.max_tiles:
+                break
+            self.split(leaf)
+            count += len(leaf.children) - 1
+            splits += 1
+        return splits, merges
+
+
+class TiledScraper:
+    """
+    Polls a wide search as tiles of smaller radius, see TilePlan. The tiles
+    are fetched concurrently, each parsing down to the search's watermark,
+    and their listings merged into one batch with the search's fields,
+    keeping every listing once. Where listings have coordinates the ones
+    outside the search's circle are dropped again, elsewhere the tiles at
+    the edge can reach up to their radius past it.
+    """
+
+    def __init__(self, scraper, params: dict, plan: TilePlan = None):
+        self.scraper = scraper
+        self.params = params
+        if plan is None:
+            cls = type(scraper)
+            plan = TilePlan(
+                (float(scraper.lat), float(scraper.long)),
+                float(getattr(scraper, cls.RADIUS_PARAM)) * cls.RADIUS_KM,
+                int(search_value(cls, params, cls.PAGE_SIZE_PARAM)),
+            )
+        self.plan = plan
+
+    @property
+    def coalesced(self):
+        return self.scraper.coalesced
+
+    @coalesced.setter
+    def coalesced(self, scrapers):
+        self.scraper.coalesced = scrapers
+
+    @property
+    def time_checked(self):
+        return self.scraper.time_checked
+
+    def search_key(self):
+        return self.scraper.search_key()
+
+    def tile_scraper(self, tile):
+        if tile is self.plan.root:
+            return self.scraper
+        if tile.scraper is None:
+            cls = type(self.scraper)
+            params = dict(self.params, lat=round(tile.center[0], 6), long=round(tile.center[1], 6))
+            params[cls.RADIUS_PARAM] = radius_value(
+                search_value(cls, self.params, cls.RADIUS_PARAM), tile.radius / cls.RADIUS_KM
+            )
+            scraper = cls(**params)
+            scraper.transport = self.scraper.transport
+            scraper.parse_executor = self.scraper.parse_executor
+            scraper.metrics = self.scraper.metrics
+            # Parse as deep as the search itself would
+            scraper.coalesced = [self.scraper]
+            tile.scraper = scraper
+        return tile.scraper
+
+    def get_listings(self):
+        tiles = self.plan.leaves()
+        return self.merge_tiles(tiles, [self.tile_scraper(tile).get_listings() for tile in tiles])
+
+    async def aget_listings(self):
+        tiles = self.plan.leaves()
+        batches = await asyncio.gather(
+            *(self.tile_scraper(tile).aget_listings() for tile in tiles)
+        )
+        return self.merge_tiles(tiles, batches)
+
+    def merge_tiles(self, tiles, batches):
+        scraper = self.scraper
+        for tile, batch in zip(tiles, batches):
+            tile.observe(batch.column("listing_id"))
+        splits, merges = self.plan.update()
+
+        metrics = scraper.get_metrics()
+        metrics.inc("tile_requests_total", len(tiles), marketplace=scraper.NAME)
+        metrics.inc("tile_splits_total", splits, marketplace=scraper.NAME)
+        metrics.inc("tile_merges_total", merges, marketplace=scraper.NAME)
+        if len(tiles) == 1:
+            return batches[0]
+
+        scraper.time_checked = max(tile.scraper.time_checked for tile in tiles)
+        fields = dict(scraper.search_fields(), time_found=scraper.time_checked)
+        listings = merge_batches(
+            batches, {name: fields[name] for name in fields if name in batches[0].constants}
+        )
+
+        distances = scraper.listing_distances(listings)
+        if distances is None:
+            return listings
+        # Listings without a location are kept, as the search's own request would
+        positions = [
+            i
+            for i, distance in enumerate(distances)
+            if distance is None or distance <= self.plan.root.radius
+        ]
+        listings = listings.select(positions)
+        if "distance" in listings.columns:
+            listings.set_column("distance", [distances[i] for i in positions])
+        return listings
+
+    def process_listings(self, listings):
+        return self.scraper.process_listings(listings)
+
+    def check_new_listings(self):
+        return self.process_listings(self.get_listings())
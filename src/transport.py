@@ -0,0 +1,289 @@
+import asyncio
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+from http_pool import get_session
+from metrics import default_metrics
+from rate_limit import Slot
+
+
+DEFAULT_TIMEOUT = 30  # seconds
+DEFAULT_LIMIT = 512  # connections in flight for the async transport
+DEFAULT_LIMIT_PER_HOST = 64
+
+
+class Response:
+    """Transport independent response, the body is always read in full"""
+
+    def __init__(self, status: int, url: str, headers: dict, content: bytes):
+        self.status = status
+        self.url = url
+        self.headers = headers
+        self.content = content
+
+    @property
+    def status_code(self):
+        return self.status
+
+    @property
+    def ok(self):
+        return self.status < 400
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding(), errors="replace")
+
+    def encoding(self):
+        content_type = self.headers.get("Content-Type", "")
+        for part in content_type.split(";"):
+            name, _, value = part.strip().partition("=")
+            if name.lower() == "charset" and value:
+                return value.strip('"')
+        return "utf-8"
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise TransportError(f"{self.status} for {self.url}")
+
+
+class TransportError(Exception):
+    pass
+
+
+def encode_params(params):
+    """
+    Flatten query params to (key, value) pairs the way requests does: list
+    values become repeated keys and None values are dropped.
+    """
+    if not params:
+        return []
+
+    pairs = []
+    for key, value in params.items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        for item in values:
+            if item is not None:
+                pairs.append((key, str(item)))
+    return pairs
+
+
+class Transport:
+    """
+    Common fetch interface of the scrapers. fetch() blocks, afetch() is a
+    coroutine, both return a Response. With a `limiter`
+    (rate_limit.RateLimiter) every request waits for its slot at its host.
+    """
+
+    metrics = None
+    limiter = None
+
+    def get_metrics(self):
+        if self.metrics is None:
+            self.metrics = default_metrics()
+        return self.metrics
+
+    def slot(self, url):
+        if self.limiter is None:
+            return Slot()
+        return self.limiter.acquire_blocking(url)
+
+    async def aslot(self, url):
+        if self.limiter is None:
+            return Slot()
+        return await self.limiter.acquire(url)
+
+    def fetch(self, method, url, params=None, headers=None, data=None, timeout=DEFAULT_TIMEOUT):
+        raise NotImplementedError
+
+    async def afetch(self, method, url, params=None, headers=None, data=None, timeout=DEFAULT_TIMEOUT):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    async def aclose(self):
+        self.close()
+
+
+class RequestsTransport(Transport):
+    """
+    Blocking transport on the pooled requests sessions, used by the CLIs.
+    requests only reports the time to the response headers, so fetches are
+    timed as TTFB (connect included) and download.
+    """
+
+    def fetch(self, method, url, params=None, headers=None, data=None, timeout=DEFAULT_TIMEOUT):
+        with self.slot(url) as slot:
+            start = time.perf_counter()
+            response = get_session(url).request(
+                method,
+                url,
+                params=encode_params(params),
+                headers=headers,
+                data=data,
+                timeout=timeout,
+            )
+            total = time.perf_counter() - start
+            slot.record(response.status_code, response.headers)
+
+        host = urlsplit(url).hostname
+        ttfb = response.elapsed.total_seconds()
+        self.get_metrics().observe("ttfb_seconds", ttfb, host=host)
+        self.get_metrics().observe("download_seconds", max(total - ttfb, 0), host=host)
+        return Response(
+            response.status_code, response.url, response.headers, response.content
+        )
+
+    async def afetch(self, method, url, params=None, headers=None, data=None, timeout=DEFAULT_TIMEOUT):
+        return await asyncio.to_thread(
+            self.fetch, method, url, params, headers, data, timeout
+        )
+
+
+def timing_trace_config(metrics):
+    """
+    aiohttp tracing hooks recording per host DNS, connect (DNS included)
+    and TTFB times plus failed requests
+    """
+    import aiohttp
+
+    async def on_request_start(session, context, params):
+        context.start = time.perf_counter()
+        context.host = params.url.host
+
+    async def on_dns_resolvehost_start(session, context, params):
+        context.dns_start = time.perf_counter()
+
+    async def on_dns_resolvehost_end(session, context, params):
+        metrics.observe(
+            "dns_seconds", time.perf_counter() - context.dns_start, host=params.host
+        )
+
+    async def on_connection_create_start(session, context, params):
+        context.connect_start = time.perf_counter()
+
+    async def on_connection_create_end(session, context, params):
+        metrics.observe(
+            "connect_seconds",
+            time.perf_counter() - context.connect_start,
+            host=context.host,
+        )
+
+    async def on_request_end(session, context, params):
+        metrics.observe(
+            "ttfb_seconds", time.perf_counter() - context.start, host=context.host
+        )
+
+    async def on_request_exception(session, context, params):
+        metrics.inc("fetch_errors_total", host=context.host)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+    trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+
+class AiohttpTransport(Transport):
+    """
+    Native async transport. One aiohttp session (and connection pool) is
+    shared by every request, so a single event loop can keep hundreds of
+    requests in flight. fetch() runs the request on a background loop for
+    callers that are not async. aiohttp is only imported once the first
+    session is opened, the blocking CLIs never load it.
+    """
+
+    def __init__(self, limit: int = DEFAULT_LIMIT, limit_per_host: int = DEFAULT_LIMIT_PER_HOST, keepalive_timeout: float = 60):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.session = None
+        self.session_loop = None
+        self.background_loop = None
+        self.lock = threading.Lock()
+
+    def get_session(self):
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        if self.session is None or self.session.closed or self.session_loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                trace_configs=[timing_trace_config(self.get_metrics())],
+            )
+            self.session_loop = loop
+        return self.session
+
+    async def afetch(self, method, url, params=None, headers=None, data=None, timeout=DEFAULT_TIMEOUT):
+        import aiohttp
+
+        if isinstance(data, str):
+            data = data.encode()
+
+        session = self.get_session()
+        with await self.aslot(url) as slot:
+            async with session.request(
+                method,
+                url,
+                params=encode_params(params),
+                headers=headers,
+                data=data,
+                timeout=aiohttp.ClientTimeout(total=timeout),
+            ) as response:
+                start = time.perf_counter()
+                content = await response.read()
+                self.get_metrics().observe(
+                    "download_seconds", time.perf_counter() - start, host=response.url.host
+                )
+                slot.record(response.status, response.headers)
+                return Response(response.status, str(response.url), response.headers, content)
+
+    def get_background_loop(self):
+        with self.lock:
+            if self.background_loop is None:
+                self.background_loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self.background_loop.run_forever, daemon=True
+                ).start()
+            return self.background_loop
+
+    def fetch(self, method, url, params=None, headers=None, data=None, timeout=DEFAULT_TIMEOUT):
+        future = asyncio.run_coroutine_threadsafe(
+            self.afetch(method, url, params, headers, data, timeout),
+            self.get_background_loop(),
+        )
+        return future.result()
+
+    async def aclose(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    def close(self):
+        if self.background_loop is not None and self.session_loop is self.background_loop:
+            asyncio.run_coroutine_threadsafe(self.aclose(), self.background_loop).result()
+            self.background_loop.call_soon_threadsafe(self.background_loop.stop)
+
+
+_default_transport = None
+
+
+def default_transport():
+    global _default_transport
+    if _default_transport is None:
+        _default_transport = RequestsTransport()
+    return _default_transport
@@ -0,0 +1,141 @@
+import json
+from datetime import datetime, timezone
+
+
+# Listings behind the watermark in a row before a newest-first page is
+# treated as exhausted. More than one so the promoted/top ads some
+# marketplaces put ahead of the newest listings don't end a poll early.
+STOP_AFTER = 5
+
+
+def posted_timestamp(value):
+    """
+    Unix timestamp of a posting time as the marketplaces send it: epoch
+    seconds (Craigslist) or an ISO 8601 string (GumTree, Kijiji, eBay).
+    None when the value is missing or can't be read.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return None if value != value else float(value)
+
+    value = str(value).strip()
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        posted = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if posted.tzinfo is None:
+        posted = posted.replace(tzinfo=timezone.utc)
+    return posted.timestamp()
+
+
+class Watermark:
+    """
+    Newest posting time seen for a search, plus the ids of the listings
+    posted at exactly that time so ties are not mistaken for new listings.
+    """
+
+    def __init__(self, posted: float, listing_ids=()):
+        self.posted = posted
+        self.listing_ids = frozenset(str(i) for i in listing_ids)
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, Watermark)
+            and self.posted == other.posted
+            and self.listing_ids == other.listing_ids
+        )
+
+    def __repr__(self):
+        return f"Watermark({self.posted!r}, {sorted(self.listing_ids)!r})"
+
+    def covers(self, posted, listing_id):
+        """True if the listing is at or behind the watermark"""
+        posted = posted_timestamp(posted)
+        if posted is None:
+            return False
+        if posted == self.posted:
+            return str(listing_id) in self.listing_ids
+        return posted < self.posted
+
+    def advance(self, other):
+        """The newer of the two watermarks, ties merge their ids"""
+        if other is None or other.posted < self.posted:
+            return self
+        if other.posted > self.posted:
+            return other
+        return Watermark(self.posted, self.listing_ids | other.listing_ids)
+
+    @classmethod
+    def from_listings(cls, posted_values, listing_ids, time_checked: float = None):
+        """
+        Watermark of a batch of listings. Posting times after time_checked
+        (bumped ads, bad clocks) are ignored so they can't push the mark
+        past listings that have yet to show up.
+        """
+        newest = None
+        newest_ids = []
+        for posted, listing_id in zip(posted_values, listing_ids):
+            posted = posted_timestamp(posted)
+            if posted is None or (time_checked is not None and posted > time_checked):
+                continue
+            if newest is None or posted > newest:
+                newest = posted
+                newest_ids = [listing_id]
+            elif posted == newest:
+                newest_ids.append(listing_id)
+
+        if newest is None:
+            return None
+        return cls(newest, newest_ids)
+
+    def dumps(self):
+        return json.dumps({"posted": self.posted, "ids": sorted(self.listing_ids)})
+
+    @classmethod
+    def loads(cls, text):
+        data = json.loads(text)
+        return cls(data["posted"], data["ids"])
+
+
+def oldest_watermark(watermarks):
+    """
+    Watermark a request shared by several searches can be parsed up to:
+    the oldest of theirs, only the ids all of them have seen at that time.
+    None if any search has none yet.
+    """
+    watermarks = list(watermarks)
+    if not watermarks or any(watermark is None for watermark in watermarks):
+        return None
+    posted = min(watermark.posted for watermark in watermarks)
+    oldest = [watermark for watermark in watermarks if watermark.posted == posted]
+    return Watermark(posted, frozenset.intersection(*(w.listing_ids for w in oldest)))
+
+
+class Cutoff:
+    """
+    Tracks a newest-first page against the watermark of its search, parsers
+    check every listing with passed() and stop once it returns True.
+    """
+
+    def __init__(self, watermark: Watermark = None, stop_after: int = STOP_AFTER):
+        self.watermark = watermark
+        self.stop_after = stop_after
+        self.behind = 0
+        self.reached = False
+
+    def passed(self, posted, listing_id):
+        if self.watermark is None:
+            return False
+        if self.watermark.covers(posted, listing_id):
+            self.behind += 1
+            self.reached = self.behind >= self.stop_after
+        else:
+            self.behind = 0
+        return self.reached